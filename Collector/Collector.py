@@ -20,15 +20,26 @@ import base64
 import hashlib
 import json
 import os
+import pickle
 import shutil
+import signal
 import sys
+import time
+from contextlib import ExitStack
+from functools import lru_cache
 from tempfile import mkstemp
 from zipfile import ZipFile
 
+import requests
+
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Running.AutoRunner import AutoRunner
 from FTB.Signatures.CrashInfo import CrashInfo
 from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.Matchers import StringMatch
+from FTB.Signatures.OutputMatcher import OutputMatches
+from FTB.Signatures.SignatureIndex import SignatureIndex
+from FTB.Signatures.Symptom import Symptom
 from Reporter.Reporter import Reporter, remote_checks, signature_checks
 
 __all__ = []
@@ -36,6 +47,36 @@ __version__ = 0.1
 __date__ = "2014-10-01"
 __updated__ = "2014-10-01"
 
+SIGNATURE_INDEX_FILE = "signatures.idx"
+SIGNATURE_STATE_FILE = "signatures.state"
+
+# Signature indices loaded by this process, mapping the signature cache directory
+# to a tuple of the modification time of the directory and of the index file when
+# the index was last synced, the index and the modification time and size of each
+# signature file in the index.
+_SIGNATURE_INDICES = {}
+
+# Directories modified less than this many nanoseconds before they were synced
+# may have been modified again without their modification time changing.
+_SIGNATURE_INDEX_RACY_NS = 2 * 10**9
+
+
+@lru_cache(maxsize=None)
+def _signature_index_version():
+    """
+    Get the version of the signature index file format. The index is a pickle of
+    signature objects, so it is derived from the source of all modules defining
+    the pickled classes and changes whenever any of them does.
+
+    @rtype: str
+    @return: Version of the signature index file format
+    """
+    digest = hashlib.sha1()
+    for cls in (SignatureIndex, CrashSignature, Symptom, StringMatch):
+        with open(sys.modules[cls.__module__].__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
 
 class Collector(Reporter):
     @remote_checks
@@ -44,14 +85,39 @@ class Collector(Reporter):
         """
         Refresh signatures by contacting the server, downloading new signatures
         and invalidating old ones.
+
+        If a previous refresh is recorded in the signature cache directory, only
+        the changes since then are downloaded and applied. Otherwise, or if the
+        server can't provide the changes anymore, all signatures are downloaded
+        unless they didn't change since the last download.
         """
+        state = self.__load_refresh_state()
+
+        if state.get("generation") is not None and self.__refresh_delta(
+            state["generation"]
+        ):
+            return
+
         url = "%s://%s:%d/crashmanager/rest/signatures/download/" % (
             self.serverProtocol,
             self.serverHost,
             self.serverPort,
         )
 
-        response = self.get(url, stream=True)
+        headers = {}
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+
+        response = self.get(
+            url,
+            stream=True,
+            headers=headers,
+            expected=(requests.codes["ok"], requests.codes["not_modified"]),
+        )
+
+        if response.status_code == requests.codes["not_modified"]:
+            self.__update_signature_index()
+            return
 
         (zipFileFd, zipFileName) = mkstemp(prefix="fuzzmanager-signatures")
 
@@ -61,6 +127,129 @@ class Collector(Reporter):
         self.refreshFromZip(zipFileName)
         os.remove(zipFileName)
 
+        generation = response.headers.get("X-Signatures-Generation")
+        self.__store_refresh_state(
+            {
+                "etag": response.headers.get("ETag"),
+                "generation": int(generation) if generation else None,
+            }
+        )
+
+    def __refresh_delta(self, generation):
+        """
+        Download and apply the signature changes since the given export generation.
+
+        @type generation: int
+        @param generation: Export generation of the local signatures
+
+        @rtype: bool
+        @return: True if the local signatures are up-to-date, False if a full
+                 refresh is required
+        """
+        url = "%s://%s:%d/crashmanager/rest/signatures/delta/" % (
+            self.serverProtocol,
+            self.serverHost,
+            self.serverPort,
+        )
+
+        response = self.get(
+            url,
+            params={"since": generation},
+            stream=True,
+            expected=(
+                requests.codes["ok"],
+                requests.codes["not_modified"],
+                requests.codes["not_found"],
+                requests.codes["gone"],
+            ),
+        )
+
+        if response.status_code == requests.codes["not_modified"]:
+            self.__update_signature_index()
+            return True
+        if response.status_code != requests.codes["ok"]:
+            return False
+
+        (zipFileFd, zipFileName) = mkstemp(prefix="fuzzmanager-signatures")
+        try:
+            with os.fdopen(zipFileFd, "wb") as zipFile:
+                shutil.copyfileobj(response.raw, zipFile)
+            self.__apply_delta(zipFileName)
+        finally:
+            os.remove(zipFileName)
+
+        return True
+
+    def __apply_delta(self, zipFileName):
+        """
+        Apply a signature delta downloaded from the server. Each file is replaced
+        atomically and the new generation is only recorded once all changes are
+        applied, so an interrupted update is simply repeated on the next refresh.
+
+        @type zipFileName: str
+        @param zipFileName: Zip file containing the changed files and delta.json
+        """
+        with ZipFile(zipFileName, "r") as zipFile:
+            if zipFile.testzip():
+                raise RuntimeError(f"Bad CRC for downloaded zipfile {zipFileName}")
+
+            delta = json.loads(zipFile.read("delta.json"))
+            changed = [name for name in zipFile.namelist() if name != "delta.json"]
+
+            for name in changed + delta["removed"]:
+                if os.path.basename(name) != name or not (
+                    name.endswith(".signature") or name.endswith(".metadata")
+                ):
+                    raise RuntimeError(f"Invalid file in signature delta: {name}")
+
+            (index, fileStats) = self.__get_signature_index(resync=True)
+
+            for name in changed:
+                (tmpFd, tmpFileName) = mkstemp(
+                    prefix="fuzzmanager-signatures", dir=self.sigCacheDir
+                )
+                with os.fdopen(tmpFd, "wb") as tmpFile:
+                    tmpFile.write(zipFile.read(name))
+                os.replace(tmpFileName, os.path.join(self.sigCacheDir, name))
+
+                if name.endswith(".signature"):
+                    fileStats[name] = self.__signature_file_stat(name)
+                    try:
+                        index.add(name, CrashSignature(zipFile.read(name).decode()))
+                    except RuntimeError as e:
+                        index.remove(name)
+                        print(
+                            f"Warning: Skipping invalid signature file {name}: {e}",
+                            file=sys.stderr,
+                        )
+
+        for name in delta["removed"]:
+            try:
+                os.remove(os.path.join(self.sigCacheDir, name))
+            except FileNotFoundError:
+                pass
+            index.remove(name)
+            fileStats.pop(name, None)
+
+        self.__store_signature_index(index, fileStats)
+
+        self.__store_refresh_state({"etag": None, "generation": delta["generation"]})
+
+    def __load_refresh_state(self):
+        try:
+            with open(os.path.join(self.sigCacheDir, SIGNATURE_STATE_FILE)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def __store_refresh_state(self, state):
+        (stateFd, stateFileName) = mkstemp(
+            prefix="fuzzmanager-signatures", dir=self.sigCacheDir
+        )
+        with os.fdopen(stateFd, "w") as f:
+            json.dump(state, f)
+        os.replace(stateFileName, os.path.join(self.sigCacheDir, SIGNATURE_STATE_FILE))
+
     @signature_checks
     def refreshFromZip(self, zipFileName):
         """
@@ -74,7 +263,11 @@ class Collector(Reporter):
 
             # Now clean the signature directory, only deleting signatures and metadata
             for sigFile in os.listdir(self.sigCacheDir):
-                if sigFile.endswith(".signature") or sigFile.endswith(".metadata"):
+                if (
+                    sigFile.endswith(".signature")
+                    or sigFile.endswith(".metadata")
+                    or sigFile in (SIGNATURE_INDEX_FILE, SIGNATURE_STATE_FILE)
+                ):
                     os.remove(os.path.join(self.sigCacheDir, sigFile))
                 else:
                     print(
@@ -85,6 +278,12 @@ class Collector(Reporter):
 
             zipFile.extractall(self.sigCacheDir)
 
+        # Parse all signatures once and store them in the index for search()
+        index = SignatureIndex()
+        fileStats = {}
+        self.__sync_signature_index(index, fileStats)
+        self.__store_signature_index(index, fileStats)
+
     @remote_checks
     def submit(
         self,
@@ -124,6 +323,61 @@ class Collector(Reporter):
             self.serverPort,
         )
 
+        data = self.prepareSubmission(
+            crashInfo, testCase, testCaseQuality, testCaseSize, metaData
+        )
+
+        if "testcase" in data:
+            # Fuzzers often submit the same testcase repeatedly. Submit only its
+            # hash first and upload the testcase if the server doesn't have it.
+            hashOnly = {key: value for key, value in data.items() if key != "testcase"}
+            response = self.post(
+                url,
+                hashOnly,
+                expected=(requests.codes["created"], requests.codes["not_found"]),
+            )
+            if response.status_code == requests.codes["created"]:
+                return response.json()
+
+        return self.post(url, data).json()
+
+    @remote_checks
+    def submitMany(self, submissions):
+        """
+        Submit several crashes to the server at once.
+
+        @type submissions: list
+        @param submissions: Crash data dictionaries as returned by
+                            L{prepareSubmission}
+
+        @rtype: list
+        @return: The created crash entries as returned by the server
+        """
+        url = "%s://%s:%d/crashmanager/rest/crashes/bulk/" % (
+            self.serverProtocol,
+            self.serverHost,
+            self.serverPort,
+        )
+
+        return self.post(url, json=submissions).json()
+
+    def prepareSubmission(
+        self,
+        crashInfo,
+        testCase=None,
+        testCaseQuality=0,
+        testCaseSize=None,
+        metaData=None,
+    ):
+        """
+        Serialize the given crash information and an optional testcase/metadata
+        into the dictionary that is sent to the server on submission.
+
+        The parameters are the same as for L{submit}.
+
+        @rtype: dict
+        @return: JSON serializable crash data
+        """
         # Serialize our crash information, testcase and metadata into a dictionary to
         # POST
         data = {}
@@ -138,8 +392,18 @@ class Collector(Reporter):
             if testCaseSize is None:
                 testCaseSize = len(testCaseData)
 
-            if isBinary:
-                testCaseData = base64.b64encode(testCaseData)
+            data["testcase_sha1"] = hashlib.sha1(testCaseData).hexdigest()
+
+            if not isBinary:
+                try:
+                    testCaseData = testCaseData.decode("utf-8")
+                except UnicodeDecodeError:
+                    # Keep the data JSON serializable, send it encoded instead.
+                    # It is still a text testcase for signature matching.
+                    data["testcase_encoding"] = "base64"
+
+            if isBinary or "testcase_encoding" in data:
+                testCaseData = base64.b64encode(testCaseData).decode("ascii")
 
             data["testcase"] = testCaseData
             data["testcase_isbinary"] = isBinary
@@ -174,7 +438,7 @@ class Collector(Reporter):
         if crashInfo.configuration.args:
             data["args"] = json.dumps(crashInfo.configuration.args)
 
-        return self.post(url, data).json()
+        return data
 
     @signature_checks
     def search(self, crashInfo):
@@ -190,28 +454,165 @@ class Collector(Reporter):
                  None if no match.
         """
 
-        cachedSigFiles = os.listdir(self.sigCacheDir)
+        (index, _) = self.__get_signature_index()
 
-        for sigFile in cachedSigFiles:
-            if not sigFile.endswith(".signature"):
-                continue
+        # Only signatures that can possibly match need to be checked
+        candidates = index.candidates(crashInfo)
+        outputMatches = OutputMatches.forSignatures(
+            crashInfo, (index.get(sigFile) for sigFile in candidates)
+        )
 
-            sigFile = os.path.join(self.sigCacheDir, sigFile)
-            if not os.path.isdir(sigFile):
-                with open(sigFile) as f:
-                    sigData = f.read()
-                    crashSig = CrashSignature(sigData)
-                    if crashSig.matches(crashInfo):
-                        metadataFile = sigFile.replace(".signature", ".metadata")
-                        metadata = None
-                        if os.path.exists(metadataFile):
-                            with open(metadataFile) as m:
-                                metadata = json.loads(m.read())
+        for sigFile in sorted(candidates):
+            crashSig = index.get(sigFile)
+            if crashSig.matches(crashInfo, outputMatches):
+                sigFile = os.path.join(self.sigCacheDir, sigFile)
+                metadataFile = sigFile.replace(".signature", ".metadata")
+                metadata = None
+                if os.path.exists(metadataFile):
+                    with open(metadataFile) as m:
+                        metadata = json.loads(m.read())
 
-                        return (sigFile, metadata)
+                return (sigFile, metadata)
 
         return (None, None)
 
+    def __get_signature_index(self, resync=False):
+        """
+        Get the index of all signatures in the local cache directory. The index is
+        loaded once per process. It is only synced with the signature files when
+        signature files were added or removed, when the index was stored by another
+        process (e.g. refresh) or when requested. The synced index is not stored.
+
+        @type resync: bool
+        @param resync: Sync the index even if the directory wasn't modified,
+                       e.g. to pick up signature files modified in place
+
+        @rtype: tuple
+        @return: Index of all signatures in the signature cache directory and the
+                 modification time and size of each indexed signature file
+        """
+        (dirMtime, indexMtime) = self.__signature_cache_mtimes()
+        cached = _SIGNATURE_INDICES.get(self.sigCacheDir)
+        if cached is not None and cached[1] == indexMtime:
+            (syncedDirMtime, _, index, fileStats) = cached
+            if not resync and syncedDirMtime == dirMtime:
+                return (index, fileStats)
+        else:
+            # Not loaded yet or stored by another process
+            (index, fileStats) = self.__load_signature_index()
+
+        self.__sync_signature_index(index, fileStats)
+        self.__cache_signature_index(index, fileStats)
+        return (index, fileStats)
+
+    def __update_signature_index(self):
+        """
+        Sync the index with the signature files and store it.
+        """
+        (index, fileStats) = self.__get_signature_index(resync=True)
+        self.__store_signature_index(index, fileStats)
+
+    def __cache_signature_index(self, index, fileStats):
+        (dirMtime, indexMtime) = self.__signature_cache_mtimes()
+        if time.time_ns() - dirMtime < _SIGNATURE_INDEX_RACY_NS:
+            # Sync again on the next lookup
+            dirMtime = None
+        _SIGNATURE_INDICES[self.sigCacheDir] = (dirMtime, indexMtime, index, fileStats)
+
+    def __signature_cache_mtimes(self):
+        dirMtime = os.stat(self.sigCacheDir).st_mtime_ns
+        try:
+            indexMtime = os.stat(
+                os.path.join(self.sigCacheDir, SIGNATURE_INDEX_FILE)
+            ).st_mtime_ns
+        except FileNotFoundError:
+            indexMtime = None
+        return (dirMtime, indexMtime)
+
+    def __signature_file_stat(self, sigFile):
+        stat = os.stat(os.path.join(self.sigCacheDir, sigFile))
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def __load_signature_index(self):
+        indexFile = os.path.join(self.sigCacheDir, SIGNATURE_INDEX_FILE)
+        try:
+            with open(indexFile, "rb") as f:
+                (version, *data) = pickle.load(f)
+        except FileNotFoundError:
+            return (SignatureIndex(), {})
+        except (pickle.UnpicklingError, EOFError, ValueError, AttributeError) as e:
+            print(
+                f"Warning: Ignoring invalid signature index {indexFile}: {e}",
+                file=sys.stderr,
+            )
+            return (SignatureIndex(), {})
+
+        if version != _signature_index_version():
+            return (SignatureIndex(), {})
+
+        (index, fileStats) = data
+        return (index, fileStats)
+
+    def __store_signature_index(self, index, fileStats):
+        (indexFd, indexFileName) = mkstemp(
+            prefix="fuzzmanager-signatures", dir=self.sigCacheDir
+        )
+        with os.fdopen(indexFd, "wb") as f:
+            pickle.dump(
+                (_signature_index_version(), index, fileStats),
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(indexFileName, os.path.join(self.sigCacheDir, SIGNATURE_INDEX_FILE))
+        self.__cache_signature_index(index, fileStats)
+
+    def __sync_signature_index(self, index, fileStats):
+        """
+        Parse signature files that are missing from the index or were modified
+        since they were indexed and remove those that don't exist anymore.
+
+        @type index: SignatureIndex
+        @param index: The index to update
+
+        @type fileStats: dict
+        @param fileStats: Modification time and size of each indexed signature
+                          file, updated along with the index
+
+        @rtype: bool
+        @return: True if the index was modified
+        """
+        sigFiles = {}
+        with os.scandir(self.sigCacheDir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".signature") and entry.is_file():
+                    stat = entry.stat()
+                    sigFiles[entry.name] = (stat.st_mtime_ns, stat.st_size)
+
+        changed = False
+
+        for sigFile in set(fileStats) - set(sigFiles):
+            index.remove(sigFile)
+            del fileStats[sigFile]
+            changed = True
+
+        for sigFile, stat in sigFiles.items():
+            if fileStats.get(sigFile) == stat:
+                continue
+
+            fileStats[sigFile] = stat
+            changed = True
+            with open(os.path.join(self.sigCacheDir, sigFile)) as f:
+                try:
+                    index.add(sigFile, CrashSignature(f.read()))
+                except RuntimeError as e:
+                    index.remove(sigFile)
+                    print(
+                        f"Warning: Skipping invalid signature file {sigFile}: {e}",
+                        file=sys.stderr,
+                    )
+
+        return changed
+
     @signature_checks
     def generate(
         self,
@@ -409,6 +810,13 @@ def main(args=None):
     parser.add_argument(
         "--crashdata", help="File containing external crash data", metavar="FILE"
     )
+    parser.add_argument(
+        "--taillines",
+        type=int,
+        help="Stream the crash information files and only keep the crash report "
+        "and this many lines before and after it (for huge logs)",
+        metavar="N",
+    )
 
     # Actions
     action_group = parser.add_argument_group(
@@ -457,6 +865,57 @@ def main(args=None):
         action="store_true",
         help="Print the client ID used when submitting issues",
     )
+    actions.add_argument(
+        "--serve",
+        help=(
+            "Run as daemon listening on the specified Unix socket. The daemon keeps "
+            "signatures and the server connection open and submits crashes in "
+            "batches."
+        ),
+        metavar="SOCKET",
+    )
+
+    # Daemon settings
+    parser.add_argument(
+        "--daemon",
+        help="Use the daemon on the specified socket to refresh, search or submit",
+        metavar="SOCKET",
+    )
+    parser.add_argument(
+        "--batchsize",
+        default=100,
+        type=int,
+        help="Number of crashes the daemon submits at once (default: %(default)s)",
+        metavar="NUM",
+    )
+    parser.add_argument(
+        "--flushinterval",
+        default=10,
+        type=float,
+        help=(
+            "Maximum time in seconds crashes are queued by the daemon "
+            "(default: %(default)s)"
+        ),
+        metavar="SECS",
+    )
+    parser.add_argument(
+        "--maxqueued",
+        default=10000,
+        type=int,
+        help=(
+            "Maximum number of crashes queued by the daemon, further submissions "
+            "fail while the queue is full (default: %(default)s)"
+        ),
+        metavar="NUM",
+    )
+    parser.add_argument(
+        "--quarantinedir",
+        help=(
+            "Directory the daemon writes crashes rejected by the server to "
+            "(default: drop them)"
+        ),
+        metavar="DIR",
+    )
 
     # Settings
     parser.add_argument("--sigdir", help="Signature cache directory", metavar="DIR")
@@ -664,21 +1123,39 @@ def main(args=None):
                     "Must specify at least either --stderr or --crashdata file"
                 )
 
-            if opts.stdout:
-                with open(opts.stdout) as f:
-                    stdout = f.read()
+            if opts.taillines is not None:
+                with ExitStack() as stack:
+                    (stdout, stderr, crashdata) = (
+                        (
+                            stack.enter_context(open(path, errors="replace"))
+                            if path
+                            else None
+                        )
+                        for path in (opts.stdout, opts.stderr, opts.crashdata)
+                    )
+                    crashInfo = CrashInfo.fromRawCrashStreams(
+                        stdout,
+                        stderr,
+                        configuration,
+                        auxCrashData=crashdata,
+                        tailLines=opts.taillines,
+                    )
+            else:
+                if opts.stdout:
+                    with open(opts.stdout) as f:
+                        stdout = f.read()
 
-            if opts.stderr:
-                with open(opts.stderr) as f:
-                    stderr = f.read()
+                if opts.stderr:
+                    with open(opts.stderr) as f:
+                        stderr = f.read()
 
-            if opts.crashdata:
-                with open(opts.crashdata) as f:
-                    crashdata = f.read()
+                if opts.crashdata:
+                    with open(opts.crashdata) as f:
+                        crashdata = f.read()
 
-            crashInfo = CrashInfo.fromRawCrashData(
-                stdout, stderr, configuration, auxCrashData=crashdata
-            )
+                crashInfo = CrashInfo.fromRawCrashData(
+                    stdout, stderr, configuration, auxCrashData=crashdata
+                )
             if opts.testcase:
                 (testCaseData, isBinary) = Collector.read_testcase(opts.testcase)
                 if not isBinary:
@@ -699,19 +1176,65 @@ def main(args=None):
         opts.tool,
     )
 
+    if opts.serve:
+        # Imported here because Unix sockets aren't available on all platforms
+        from Collector.CollectorDaemon import CollectorDaemon
+
+        daemon = CollectorDaemon(
+            opts.serve,
+            collector,
+            opts.batchsize,
+            opts.flushinterval,
+            opts.maxqueued,
+            opts.quarantinedir,
+        )
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            daemon.server_close()
+        return 0
+
+    daemonClient = None
+    if opts.daemon:
+        from Collector.CollectorDaemon import CollectorDaemonClient
+
+        daemonClient = CollectorDaemonClient(opts.daemon)
+
     if opts.refresh:
-        collector.refresh()
+        if daemonClient:
+            daemonClient.refresh()
+        else:
+            collector.refresh()
         return 0
 
     if opts.submit:
         testcase = opts.testcase
-        collector.submit(
-            crashInfo, testcase, opts.testcasequality, opts.testcasesize, metadata
-        )
+        if daemonClient:
+            daemonClient.submit(
+                collector.prepareSubmission(
+                    crashInfo,
+                    testcase,
+                    opts.testcasequality,
+                    opts.testcasesize,
+                    metadata,
+                )
+            )
+        else:
+            collector.submit(
+                crashInfo, testcase, opts.testcasequality, opts.testcasesize, metadata
+            )
         return 0
 
     if opts.search:
-        (sig, metadata) = collector.search(crashInfo)
+        if daemonClient:
+            (sig, metadata) = daemonClient.search(
+                collector.prepareSubmission(crashInfo, opts.testcase)
+            )
+        else:
+            (sig, metadata) = collector.search(crashInfo)
         if sig is None:
             print("No match found", file=sys.stderr)
             return 3
@@ -0,0 +1,298 @@
+"""
+Collector Daemon -- Long running local crash processing service
+
+Keeps a Collector instance with its HTTP session and parsed signatures alive
+and serves search and submit requests from local processes over a Unix socket.
+Submissions are queued and sent to the server in batches.
+
+Batches the server rejects (4xx) are dropped or, if a quarantine directory is
+given, written there for inspection. Server errors (5xx) and connection errors
+are retried. The number of queued crashes is limited, further submissions are
+refused while the queue is full.
+
+The protocol is line based, every request and response is a single JSON object
+terminated by a newline.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import threading
+import time
+from tempfile import mkstemp
+
+import requests
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
+from Reporter.Reporter import ServerError
+
+LOG = logging.getLogger("collector.daemon")
+
+
+class _CollectorRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                response = self.server.dispatch(request)
+            except Exception as e:  # pylint: disable=broad-except
+                LOG.warning("Request failed: %s", e)
+                response = {"error": str(e)}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class CollectorDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        socketPath,
+        collector,
+        batchSize=100,
+        flushInterval=10,
+        maxQueued=10000,
+        quarantineDir=None,
+    ):
+        """
+        @type socketPath: string
+        @param socketPath: Path of the Unix socket to listen on
+
+        @type collector: Collector
+        @param collector: Collector used for searching and submitting
+
+        @type batchSize: int
+        @param batchSize: Number of queued crashes that triggers a submission
+
+        @type flushInterval: float
+        @param flushInterval: Maximum number of seconds a crash stays queued
+
+        @type maxQueued: int
+        @param maxQueued: Maximum number of crashes waiting for submission
+
+        @type quarantineDir: string
+        @param quarantineDir: Directory to write batches rejected by the server to
+        """
+        self.collector = collector
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.maxQueued = maxQueued
+        self.quarantineDir = quarantineDir
+
+        self.queue = []
+        self.queuedSince = None
+        self.stopping = False
+        self.cond = threading.Condition()
+        # Serializes use of the HTTP session and of the signature cache directory
+        self.flushLock = threading.Lock()
+        self.signatureLock = threading.Lock()
+
+        # Remove a stale socket left behind by a previous daemon
+        try:
+            if stat.S_ISSOCK(os.stat(socketPath).st_mode):
+                os.remove(socketPath)
+        except FileNotFoundError:
+            pass
+
+        super().__init__(socketPath, _CollectorRequestHandler)
+
+        self.flusher = threading.Thread(target=self._flushLoop, daemon=True)
+        self.flusher.start()
+
+    def dispatch(self, request):
+        action = request.get("action")
+        if action == "submit":
+            return {"queued": self.enqueue(request["crash"])}
+        if action == "search":
+            return self.search(request["crash"])
+        if action == "flush":
+            return {"submitted": self.flush()}
+        if action == "refresh":
+            with self.flushLock, self.signatureLock:
+                self.collector.refresh()
+            return {}
+        raise RuntimeError(f"Unknown action: {action}")
+
+    def enqueue(self, data):
+        """
+        Queue crash data for submission.
+
+        @type data: dict
+        @param data: Crash data as returned by L{Collector.prepareSubmission}
+
+        @rtype: int
+        @return: Number of crashes waiting for submission
+        """
+        with self.cond:
+            if len(self.queue) >= self.maxQueued:
+                raise RuntimeError(
+                    f"Submission queue is full ({len(self.queue)} crashes)"
+                )
+            if not self.queue:
+                self.queuedSince = time.monotonic()
+            self.queue.append(data)
+            if len(self.queue) >= self.batchSize:
+                self.cond.notify_all()
+            return len(self.queue)
+
+    def flush(self):
+        """
+        Submit all queued crashes in batches of at most batchSize. Batches that
+        are rejected by the server are dropped. If submitting fails with a server
+        or connection error, the remaining crashes stay queued.
+
+        @rtype: int
+        @return: Number of crashes submitted
+        """
+        submitted = 0
+        with self.flushLock:
+            while True:
+                with self.cond:
+                    batch = self.queue[: self.batchSize]
+                if not batch:
+                    break
+                try:
+                    self.collector.submitMany(batch)
+                    submitted += len(batch)
+                except Exception as e:  # pylint: disable=broad-except
+                    if CollectorDaemon._isTransient(e):
+                        raise
+                    self._quarantine(batch, e)
+                with self.cond:
+                    # Only this method removes items, so the batch is still first
+                    del self.queue[: len(batch)]
+                    self.queuedSince = time.monotonic() if self.queue else None
+        return submitted
+
+    @staticmethod
+    def _isTransient(error):
+        if isinstance(error, ServerError):
+            return error.status_code >= 500
+        return isinstance(
+            error,
+            (requests.exceptions.ConnectionError, requests.exceptions.Timeout),
+        )
+
+    def _quarantine(self, batch, error):
+        if self.quarantineDir is None:
+            LOG.error(
+                "Dropping %d crashes rejected by the server: %s", len(batch), error
+            )
+            return
+
+        (fd, fileName) = mkstemp(
+            prefix="rejected-", suffix=".json", dir=self.quarantineDir
+        )
+        with os.fdopen(fd, "w") as f:
+            json.dump(batch, f)
+        LOG.error(
+            "Moved %d crashes rejected by the server to %s: %s",
+            len(batch),
+            fileName,
+            error,
+        )
+
+    def search(self, data):
+        configuration = ProgramConfiguration(
+            data["product"],
+            data["platform"],
+            data["os"],
+            data.get("product_version"),
+        )
+        crashInfo = CrashInfo.fromRawCrashData(
+            data.get("rawStdout", ""),
+            data.get("rawStderr", ""),
+            configuration,
+            auxCrashData=data.get("rawCrashData", ""),
+        )
+        if data.get("testcase") and not data.get("testcase_isbinary"):
+            crashInfo.testcase = data["testcase"]
+
+        with self.signatureLock:
+            (sigFile, metadata) = self.collector.search(crashInfo)
+        return {"signature": sigFile, "metadata": metadata}
+
+    def _flushDue(self):
+        if not self.queue:
+            return False
+        if len(self.queue) >= self.batchSize:
+            return True
+        return time.monotonic() - self.queuedSince >= self.flushInterval
+
+    def _flushLoop(self):
+        while True:
+            with self.cond:
+                while not self.stopping and not self._flushDue():
+                    timeout = None
+                    if self.queue:
+                        timeout = self.flushInterval - (
+                            time.monotonic() - self.queuedSince
+                        )
+                    self.cond.wait(timeout)
+                if self.stopping:
+                    return
+            try:
+                self.flush()
+            except Exception as e:  # pylint: disable=broad-except
+                LOG.warning("Failed to submit queued crashes, retrying later: %s", e)
+                with self.cond:
+                    self.cond.wait(self.flushInterval)
+
+    def server_close(self):
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        self.flusher.join()
+        super().server_close()
+        try:
+            os.remove(self.server_address)
+        except FileNotFoundError:
+            pass
+        try:
+            self.flush()
+        except Exception as e:  # pylint: disable=broad-except
+            LOG.error("Dropping %d queued crashes: %s", len(self.queue), e)
+
+
+class CollectorDaemonClient:
+    """Client for talking to a L{CollectorDaemon}"""
+
+    def __init__(self, socketPath):
+        self.socketPath = socketPath
+
+    def request(self, action, **kwds):
+        kwds["action"] = action
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.socketPath)
+            with sock.makefile("rwb") as fp:
+                fp.write(json.dumps(kwds).encode("utf-8") + b"\n")
+                fp.flush()
+                response = json.loads(fp.readline())
+        if "error" in response:
+            raise RuntimeError(f"Collector daemon error: {response['error']}")
+        return response
+
+    def submit(self, data):
+        return self.request("submit", crash=data)["queued"]
+
+    def search(self, data):
+        response = self.request("search", crash=data)
+        return (response["signature"], response["metadata"])
+
+    def flush(self):
+        return self.request("flush")["submitted"]
+
+    def refresh(self):
+        self.request("refresh")
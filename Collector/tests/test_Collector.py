@@ -12,6 +12,7 @@ file, You can obtain one at http://mozilla.org/MPL/2.0/.
 @contact:    choller@mozilla.com
 """
 
+import io
 import json
 import os
 import platform
@@ -23,7 +24,7 @@ from urllib.parse import urlsplit
 import pytest
 import requests
 
-from Collector.Collector import Collector, main
+from Collector.Collector import _SIGNATURE_INDICES, Collector, main
 from crashmanager.models import CrashEntry
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Signatures.CrashInfo import CrashInfo
@@ -47,8 +48,26 @@ def test_collector_help(capsys):
     assert err.startswith("usage: ")
 
 
+@pytest.fixture
+def close_sessions(monkeypatch):
+    """Close the HTTP sessions of all collectors created during the test, so no
+    keep-alive connections to the live server are left behind"""
+    sessions = []
+
+    class _Session(requests.Session):
+        def __init__(self):
+            super().__init__()
+            sessions.append(self)
+
+    monkeypatch.setattr(requests, "Session", _Session)
+    yield
+    for session in sessions:
+        session.close()
+
+
 @patch("os.path.expanduser")
 @patch("time.sleep", new=Mock())
+@pytest.mark.usefixtures("close_sessions")
 def test_collector_submit(mock_expanduser, live_server, tmp_path, fm_user):
     """Test crash submission"""
     mock_expanduser.side_effect = lambda path: str(
@@ -100,6 +119,33 @@ def test_collector_submit(mock_expanduser, live_server, tmp_path, fm_user):
     assert entry.env == ""
     assert entry.args == ""
 
+    # submitting the same testcase again only sends its hash
+    with patch.object(collector, "post", wraps=collector.post) as post:
+        result = collector.submit(crashInfo, str(testcase_path))
+    assert post.call_count == 1
+    assert "testcase" not in post.call_args[0][1]
+
+    duplicate = CrashEntry.objects.get(pk=result["id"])
+    assert duplicate.testcase.test.name == entry.testcase.test.name
+    assert duplicate.testcase.size == len(exampleTestCase)
+    assert not duplicate.testcase.isBinary
+
+    # unknown testcases are uploaded after the hash, text that isn't valid UTF-8
+    # is sent encoded
+    encodedTestCase = b"foo(\xff);\n"
+    testcase_path = tmp_path / "testcase" / "encoded.js"
+    testcase_path.write_bytes(encodedTestCase)
+    with patch.object(collector, "post", wraps=collector.post) as post:
+        result = collector.submit(crashInfo, str(testcase_path))
+    assert post.call_count == 2
+    assert "testcase" not in post.call_args_list[0][0][1]
+    assert post.call_args[0][1]["testcase_encoding"] == "base64"
+    entry = CrashEntry.objects.get(pk=result["id"])
+    assert not entry.testcase.isBinary
+    assert entry.testcase.size == len(encodedTestCase)
+    with open(entry.testcase.test.path, "rb") as testcase_fp:
+        assert testcase_fp.read() == encodedTestCase
+
     # create a test config
     with (tmp_path / ".fuzzmanagerconf").open("w") as fp:
         fp.write("[Main]\n")
@@ -176,6 +222,33 @@ def test_collector_submit(mock_expanduser, live_server, tmp_path, fm_user):
     assert json.loads(entry.env) == {"PATH": "/home/ken", "LD_PRELOAD": "hack.so"}
     assert json.loads(entry.args) == ["./myprog"]
 
+    # stream the crash information, keeping only a window of it
+    with stdout_path.open("w") as fp:
+        fp.write("".join(f"stdout line {idx}\n" for idx in range(10)))
+    result = main(
+        [
+            "--submit",
+            "--tool",
+            "tool2",
+            "--product",
+            "mozilla-inbound",
+            "--os",
+            "minix",
+            "--platform",
+            "pdp11",
+            "--taillines",
+            "2",
+            "--stdout",
+            str(stdout_path),
+            "--crashdata",
+            str(crashdata_path),
+        ]
+    )
+    assert result == 0
+    entry = CrashEntry.objects.get(pk__gt=entry.id)
+    assert entry.rawStdout == "stdout line 8\nstdout line 9"
+    assert entry.rawCrashData == asan_trace_crash.rstrip()
+
     class response_t:
         status_code = 500
         text = "Error"
@@ -209,6 +282,7 @@ def test_collector_refresh(capsys, tmp_path):
             status_code = requests.codes["ok"]
             text = "OK"
             raw = fp
+            headers = {"ETag": '"1234"'}
 
         # this asserts the expected arguments and returns the open handle to out.zip as
         # 'raw' which is read by refresh()
@@ -234,7 +308,12 @@ def test_collector_refresh(capsys, tmp_path):
         collector.refresh()
 
     # check that it worked
-    assert {f.name for f in sigs_path.iterdir()} == {"test2.signature", "other.txt"}
+    assert {f.name for f in sigs_path.iterdir()} == {
+        "test2.signature",
+        "other.txt",
+        "signatures.idx",
+        "signatures.state",
+    }
     assert (sigs_path / "test2.signature").read_text() == "test2"
     assert (
         "other.txt" in capsys.readouterr()[1]
@@ -281,6 +360,119 @@ def test_collector_refresh(capsys, tmp_path):
             collector.refresh()
 
 
+def test_collector_refresh_delta(tmp_path):
+    """Test incremental signature updates"""
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    crashInfo = CrashInfo.fromRawCrashData([], ["Assertion failure: foo"], config)
+
+    def _sig(value):
+        return json.dumps({"symptoms": [{"type": "output", "value": value}]})
+
+    def _zip(files):
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, "w") as zf:
+            for name, content in files.items():
+                zf.writestr(name, content)
+        data.seek(0)
+        return data
+
+    responses = []
+    requested = []
+
+    def myget(url, stream=None, headers=None, params=None):
+        requested.append((url.split("/")[-2], params, headers))
+        status, content, resp_headers = responses.pop(0)
+
+        class response_t:
+            status_code = status
+            text = ""
+            raw = content
+            headers = resp_headers
+
+        return response_t()
+
+    sigs_path = tmp_path / "sigs"
+    sigs_path.mkdir()
+    collector = Collector(
+        sigCacheDir=str(sigs_path),
+        serverHost="aol.com",
+        serverPort=70,
+        serverProtocol="gopher",
+        serverAuthToken="token",
+        clientId="test-fuzzer1",
+        tool="test-tool",
+    )
+    collector._session.get = myget
+
+    # initial full download
+    responses.append(
+        (
+            200,
+            _zip({"1.signature": _sig("bar"), "2.signature": _sig("baz")}),
+            {"ETag": '"1"', "X-Signatures-Generation": "5"},
+        )
+    )
+    collector.refresh()
+    assert requested[-1][0] == "download"
+    assert collector.search(crashInfo) == (None, None)
+
+    # nothing changed, but signatures modified locally are indexed again
+    (sigs_path / "2.signature").write_text(_sig("Assertion failure: foo"))
+    responses.append((304, None, {}))
+    collector.refresh()
+    assert requested[-1][:2] == ("delta", {"since": 5})
+    _SIGNATURE_INDICES.clear()
+    assert collector.search(crashInfo)[0] == str(sigs_path / "2.signature")
+
+    # delta with a changed, an added and a removed signature
+    responses.append(
+        (
+            200,
+            _zip(
+                {
+                    "1.signature": _sig("foo"),
+                    "3.signature": _sig("qux"),
+                    "delta.json": json.dumps(
+                        {"generation": 6, "removed": ["2.signature"]}
+                    ),
+                }
+            ),
+            {"X-Signatures-Generation": "6"},
+        )
+    )
+    collector.refresh()
+    assert {f.name for f in sigs_path.iterdir()} == {
+        "1.signature",
+        "3.signature",
+        "signatures.idx",
+        "signatures.state",
+    }
+    assert collector.search(crashInfo)[0] == str(sigs_path / "1.signature")
+
+    # server doesn't have our generation anymore, fall back to full download
+    responses.append((410, None, {}))
+    responses.append((304, None, {}))
+    collector.refresh()
+    assert requested[-2][:2] == ("delta", {"since": 6})
+    assert requested[-1][0] == "download"
+
+    # delta must not write outside of the signature directory
+    responses.append(
+        (
+            200,
+            _zip(
+                {
+                    "../1.signature": _sig("foo"),
+                    "delta.json": json.dumps({"generation": 7, "removed": []}),
+                }
+            ),
+            {},
+        )
+    )
+    with pytest.raises(RuntimeError, match="Invalid file in signature delta"):
+        collector.refresh()
+
+
 def test_collector_generate_search(tmp_path):
     """Test sigcache generation and search"""
     # create a cache dir
@@ -323,6 +515,77 @@ def test_collector_generate_search(tmp_path):
     assert result is None
 
 
+def test_collector_search_index(mocker, tmp_path):
+    """Test that search uses an up-to-date signature index"""
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    crashInfo = CrashInfo.fromRawCrashData([], ["Assertion failure: foo"], config)
+
+    def _sig(value):
+        return json.dumps({"symptoms": [{"type": "output", "value": value}]})
+
+    outzip_path = tmp_path / "out.zip"
+    with zipfile.ZipFile(str(outzip_path), "w") as zf:
+        zf.writestr("1.signature", _sig("Assertion failure: foo"))
+        zf.writestr("2.signature", _sig("Assertion failure: bar"))
+
+    cache_dir = tmp_path / "sigcache"
+    cache_dir.mkdir()
+    collector = Collector(sigCacheDir=str(cache_dir))
+    collector.refreshFromZip(str(outzip_path))
+    assert (cache_dir / "signatures.idx").is_file()
+
+    sigMatch, _ = collector.search(crashInfo)
+    assert sigMatch == str(cache_dir / "1.signature")
+
+    # the index is loaded from disk and not parsed again
+    _SIGNATURE_INDICES.clear()
+    mocker.patch(
+        "Collector.Collector.CrashSignature", side_effect=RuntimeError("parsed")
+    )
+    sigMatch, _ = collector.search(crashInfo)
+    assert sigMatch == str(cache_dir / "1.signature")
+    mocker.stopall()
+
+    # the index is neither synced nor stored again by search unless the
+    # directory was modified
+    index_mtime = (cache_dir / "signatures.idx").stat().st_mtime_ns
+    mocker.patch("Collector.Collector._SIGNATURE_INDEX_RACY_NS", 0)
+    os.utime(str(cache_dir), ns=(10**9, 10**9))
+    collector.search(crashInfo)
+    scandir = mocker.spy(os, "scandir")
+    (cache_dir / "1.signature").write_text(_sig("Assertion failure: baz"))
+    sigMatch, _ = collector.search(crashInfo)
+    assert sigMatch == str(cache_dir / "1.signature")
+    assert not scandir.called
+
+    # signatures modified locally are parsed again once the directory changes
+    os.utime(str(cache_dir), ns=(2 * 10**9, 2 * 10**9))
+    sigMatch, _ = collector.search(crashInfo)
+    assert sigMatch is None
+    assert scandir.called
+    assert (cache_dir / "signatures.idx").stat().st_mtime_ns == index_mtime
+    mocker.stopall()
+    (cache_dir / "1.signature").write_text(_sig("Assertion failure: foo"))
+    _SIGNATURE_INDICES.clear()
+    sigMatch, _ = collector.search(crashInfo)
+    assert sigMatch == str(cache_dir / "1.signature")
+
+    # signatures added or removed locally are picked up
+    (cache_dir / "1.signature").unlink()
+    sigMatch, _ = collector.search(crashInfo)
+    assert sigMatch is None
+    (cache_dir / "3.signature").write_text(_sig("foo"))
+    sigMatch, _ = collector.search(crashInfo)
+    assert sigMatch == str(cache_dir / "3.signature")
+
+    # refreshing replaces the index
+    with zipfile.ZipFile(str(outzip_path), "w") as zf:
+        zf.writestr("2.signature", _sig("Assertion failure: foo"))
+    collector.refreshFromZip(str(outzip_path))
+    sigMatch, _ = collector.search(crashInfo)
+    assert sigMatch == str(cache_dir / "2.signature")
+
+
 def test_collector_download(tmp_path, monkeypatch):
     """Test testcase downloads"""
     # create Collector
@@ -0,0 +1,181 @@
+"""
+Tests for the collector daemon
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import threading
+from pathlib import Path
+from unittest.mock import Mock, patch
+from urllib.parse import urlsplit
+
+import pytest
+import requests
+
+from Collector.Collector import Collector
+from Collector.CollectorDaemon import CollectorDaemon, CollectorDaemonClient
+from crashmanager.models import CrashEntry
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
+from Reporter.Reporter import ServerError
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+
+pytestmark = pytest.mark.django_db(transaction=True)
+pytest_plugins = ("server.tests",)
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    started = []
+
+    def _start(collector, batchSize=100, flushInterval=60):
+        server = CollectorDaemon(
+            str(tmp_path / "collector.sock"), collector, batchSize, flushInterval
+        )
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        started.append((server, thread))
+        return server, CollectorDaemonClient(server.server_address)
+
+    yield _start
+
+    for server, thread in started:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+        # don't leave keep-alive connections to the live server behind
+        server.collector._session.close()
+
+
+@patch("time.sleep", new=Mock())
+def test_collector_daemon_submit(live_server, tmp_path, fm_user, daemon):
+    """Test that the daemon queues crashes and submits them in batches"""
+    url = urlsplit(live_server.url)
+    (tmp_path / "sigcache").mkdir()
+    collector = Collector(
+        sigCacheDir=str(tmp_path / "sigcache"),
+        serverHost=url.hostname,
+        serverPort=url.port,
+        serverProtocol=url.scheme,
+        serverAuthToken=fm_user.token,
+        clientId="test-fuzzer1",
+        tool="test-tool",
+    )
+    server, client = daemon(collector, batchSize=2)
+
+    config = ProgramConfiguration("mozilla-central", "x86-64", "linux")
+    asan_trace_crash = (FIXTURE_PATH / "asan_trace_crash.txt").read_text()
+    crashInfo = CrashInfo.fromRawCrashData([], asan_trace_crash.splitlines(), config)
+    testcase_path = tmp_path / "testcase.bin"
+    testcase_path.write_bytes(b"\0\1")
+
+    with patch.object(collector, "submitMany", wraps=collector.submitMany) as bulk:
+        assert client.submit(collector.prepareSubmission(crashInfo)) == 1
+        assert not CrashEntry.objects.exists()
+
+        # the batch is full, so the flusher submits it in the background
+        client.submit(collector.prepareSubmission(crashInfo, str(testcase_path)))
+        for _ in range(100):
+            if not server.queue:
+                break
+            threading.Event().wait(0.1)
+        assert not server.queue
+        assert bulk.call_count == 1
+        assert CrashEntry.objects.count() == 2
+
+        client.submit(collector.prepareSubmission(crashInfo))
+        assert client.flush() == 1
+        assert bulk.call_count == 2
+
+    entries = list(CrashEntry.objects.order_by("id"))
+    assert len(entries) == 3
+    for entry in entries:
+        assert entry.rawStderr == asan_trace_crash.rstrip()
+        assert entry.client.name == "test-fuzzer1"
+        assert entry.tool.name == "test-tool"
+    assert entries[1].testcase.isBinary
+    assert entries[1].testcase.size == 2
+
+
+def test_collector_daemon_search(tmp_path, daemon):
+    """Test searching through the daemon"""
+    (tmp_path / "sigcache").mkdir()
+    collector = Collector(sigCacheDir=str(tmp_path / "sigcache"))
+    _, client = daemon(collector)
+
+    config = ProgramConfiguration("mozilla-central", "x86-64", "linux")
+    asan_trace_crash = (FIXTURE_PATH / "asan_trace_crash.txt").read_text()
+    crashInfo = CrashInfo.fromRawCrashData([], asan_trace_crash.splitlines(), config)
+
+    assert client.search(collector.prepareSubmission(crashInfo)) == (None, None)
+
+    sig = collector.generate(crashInfo, False, False, 8)
+    assert client.search(collector.prepareSubmission(crashInfo)) == (sig, None)
+
+    other = CrashInfo.fromRawCrashData([], ["Assertion failure: foo"], config)
+    assert client.search(collector.prepareSubmission(other)) == (None, None)
+
+    with pytest.raises(RuntimeError, match="Unknown action"):
+        client.request("foo")
+
+
+def test_collector_daemon_submit_errors(tmp_path, daemon):
+    """Test that rejected batches are dropped and others are retried"""
+    collector = Mock(spec=Collector, _session=Mock())
+    (tmp_path / "rejected").mkdir()
+    server, client = daemon(collector, batchSize=2)
+    server.quarantineDir = str(tmp_path / "rejected")
+
+    # server and connection errors keep the crashes queued
+    for error in (
+        ServerError(Mock(status_code=503, text="unavailable")),
+        requests.exceptions.ConnectionError("refused"),
+    ):
+        collector.submitMany.side_effect = error
+        client.submit({"id": 1})
+        with pytest.raises(RuntimeError, match="Collector daemon error"):
+            client.flush()
+        assert server.queue == [{"id": 1}]
+        server.queue.clear()
+
+    # rejected batches are moved to the quarantine directory
+    collector.submitMany.side_effect = ServerError(Mock(status_code=400, text="bad"))
+    client.submit({"id": 2})
+    assert client.flush() == 0
+    assert not server.queue
+    (rejected,) = (tmp_path / "rejected").iterdir()
+    assert rejected.read_text() == '[{"id": 2}]'
+
+    # or dropped if there is none
+    server.quarantineDir = None
+    client.submit({"id": 3})
+    assert client.flush() == 0
+    assert not server.queue
+    assert len(list((tmp_path / "rejected").iterdir())) == 1
+
+    collector.submitMany.side_effect = None
+    client.submit({"id": 4})
+    assert client.flush() == 1
+
+
+def test_collector_daemon_queue_limit(tmp_path, daemon):
+    """Test that submissions are refused while the queue is full"""
+    collector = Mock(spec=Collector, _session=Mock())
+    collector.submitMany.side_effect = ServerError(Mock(status_code=502, text=""))
+    server, client = daemon(collector)
+    server.maxQueued = 2
+
+    assert client.submit({"id": 1}) == 1
+    assert client.submit({"id": 2}) == 2
+    with pytest.raises(RuntimeError, match="queue is full"):
+        client.submit({"id": 3})
+    assert server.queue == [{"id": 1}, {"id": 2}]
+
+    collector.submitMany.side_effect = None
+    assert client.flush() == 2
+    assert client.submit({"id": 3}) == 1
@@ -15,6 +15,8 @@ file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
 import re
+from bisect import bisect_right
+from itertools import accumulate
 
 RE_ASSERTION = re.compile(r"^ASSERTION \d+: \(.+\)")
 RE_MOZ_CRASH = re.compile(r"Hit MOZ_CRASH\([^\)]")
@@ -23,6 +25,101 @@ RE_PID = re.compile(r"^\[\d+\]\s+")
 RE_RUST_ASSERT = re.compile(r"^thread .*? panicked at '.+$")
 RE_RUST_END = re.compile(r".+?\.rs(:\d+)+$")
 RE_V8_END = re.compile(r"^")
+RE_RSS_LIMIT = re.compile(r" \(\d+Mb vs \d+Mb\)")
+RE_RSS_PID = re.compile(r"=+\d+=+")
+
+RE_ASAN_UNKNOWN_ADDRESS = re.compile(r"(SEGV|access-violation) on unknown address")
+RE_ASAN_STRIP = (
+    re.compile(r"on address 0x[0-9a-f]+"),
+    re.compile(r"(at |\()pc 0x[0-9a-f]+"),
+    re.compile(r"bp 0x[0-9a-f]+"),
+    re.compile(r"sp 0x[0-9a-f]+"),
+    re.compile(r"(\(thread\s)?T[0-9]+\)"),
+    re.compile(r"^[0-9=]+"),
+)
+RE_TSAN_PID = re.compile(r"\s*\(pid=\d+\)")
+RE_TSAN_RW = re.compile(r"\s*(?:Previous )?(?:[Aa]tomic )?(?:[Rr]ead|[Ww]rite) of size")
+RE_UBSAN_ERROR = re.compile(":\\d+:\\d+: runtime error: ")
+
+# Every line that getAssertion can pick up contains at least one of these.
+ASSERTION_CANDIDATES = (
+    "Assertion",
+    "ASSERTION",
+    "panicked at",
+    "# Fatal error in",
+    ": failed assertion",
+    ': fatal error: "assert',
+    "MOZ_CRASH",
+    "Self-hosted JavaScript assertion info",
+    "terminate called after throwing an instance of",
+    "[Non-crash bug] ",
+    "Sanitizer: hard rss limit exhausted",
+)
+
+# Every line that getAuxiliaryAbortMessage can pick up contains at least one of these.
+AUXILIARY_CANDIDATES = (
+    "ERROR: AddressSanitizer",
+    "READ of size",
+    "WRITE of size",
+    "ead of size",
+    "rite of size",
+    "WARNING: ThreadSanitizer:",
+    "glibc detected",
+    "runtime error",
+)
+
+
+def _stripPid(line):
+    # Remove any PID output at the beginning of the line
+    if line.startswith("["):
+        return RE_PID.sub("", line, count=1)
+    return line
+
+
+def findCandidateLines(output, candidates):
+    """
+    Find all lines containing any of the given strings. Instead of checking
+    every line individually, each string is searched once in the joined output,
+    which is much faster on large logs where only a few lines are of interest.
+
+    @type output: list
+    @param output: List of strings to be searched
+
+    @type candidates: tuple
+    @param candidates: Strings to search for (must not contain newlines)
+
+    @rtype: list
+    @return: Sorted indices of the lines containing any of the strings
+    """
+    text = "\n".join(output)
+    positions = []
+    for candidate in candidates:
+        pos = text.find(candidate)
+        while pos != -1:
+            positions.append(pos)
+            # Further occurrences in the same line don't matter
+            pos = text.find("\n", pos)
+            if pos == -1:
+                break
+            pos = text.find(candidate, pos + 1)
+
+    if not positions:
+        return []
+
+    # Map the positions back to lines by their start offsets. This doesn't
+    # rely on the newlines in the text, so lines may contain newlines too.
+    lineStarts = list(accumulate((len(line) + 1 for line in output), initial=0))
+    return sorted({bisect_right(lineStarts, pos) - 1 for pos in positions})
+
+
+def _collectLines(output, start, endRegex, lines):
+    """Append lines to a multi-line message until endRegex matches one."""
+    for idx in range(start, len(output)):
+        line = _stripPid(output[idx])
+        lines.append(line)
+        if endRegex.search(line) is not None:
+            return idx + 1
+    return len(output)
 
 
 def getAssertion(output):
@@ -35,8 +132,10 @@ def getAssertion(output):
     @type output: list
     @param output: List of strings to be searched
     """
+    if not isinstance(output, list):
+        output = list(output)
+
     lastLine = None
-    endRegex = None
 
     # Use this to ignore the ASan head line in case of an assertion
     haveFatalAssertion = False
@@ -48,15 +147,16 @@ def getAssertion(output):
     # JS assertion which we need to ignore in that case
     haveSelfHostedJSAssert = False
 
-    for line in output:
-        # Remove any PID output at the beginning of the line
-        line = re.sub(RE_PID, "", line, count=1)
+    # Lines before this index were consumed by a multi-line assertion
+    nextLine = 0
 
-        if endRegex is not None:
-            lastLine.append(line)
-            if endRegex.search(line) is not None:
-                endRegex = None
-        elif line.startswith("Assertion failure"):
+    for idx in findCandidateLines(output, ASSERTION_CANDIDATES):
+        if idx < nextLine:
+            continue
+
+        line = _stripPid(output[idx])
+
+        if line.startswith("Assertion failure"):
             # Firefox fatal assertion (MOZ_ASSERT, JS_ASSERT)
 
             # If we've seen a self-hosted JS assertion, then we ignore
@@ -70,8 +170,8 @@ def getAssertion(output):
         elif "panicked at" in line and RE_RUST_ASSERT.match(line) is not None:
             # Is this a single line assert?
             if RE_RUST_END.search(line) is None:
-                endRegex = RE_RUST_END
                 lastLine = [line]
+                nextLine = _collectLines(output, idx + 1, RE_RUST_END, lastLine)
             else:
                 lastLine = line
             haveFatalAssertion = True
@@ -79,8 +179,8 @@ def getAssertion(output):
             # Support v8 non-standard multi-line assertion output
             # We need to return this as array so we can create two
             # symptoms for it as the matchers work by line.
-            endRegex = RE_V8_END
             lastLine = [line]
+            nextLine = _collectLines(output, idx + 1, RE_V8_END, lastLine)
             haveFatalAssertion = True
         elif "Assertion" in line and "failed" in line:
             # Firefox ANGLE assertion
@@ -104,8 +204,8 @@ def getAssertion(output):
         ):
             # MOZ_CRASH line, but with a message (we should only look at these)
             if RE_MOZ_CRASH_END.search(line) is None:
-                endRegex = RE_MOZ_CRASH_END
                 lastLine = [line]
+                nextLine = _collectLines(output, idx + 1, RE_MOZ_CRASH_END, lastLine)
             else:
                 lastLine = line
             haveMozCrashLine = True
@@ -121,8 +221,8 @@ def getAssertion(output):
             # Magic string "added" to stderr by some fuzzers.
             lastLine = line
         elif "Sanitizer: hard rss limit exhausted" in line:
-            line = re.sub(r" \(\d+Mb vs \d+Mb\)", "", line)
-            line = re.sub(r"=+\d+=+", "", line)
+            line = RE_RSS_LIMIT.sub("", line)
+            line = RE_RSS_PID.sub("", line)
             lastLine = line
             haveFatalAssertion = True
 
@@ -139,25 +239,23 @@ def getAuxiliaryAbortMessage(output):
     @type output: list
     @param output: List of strings to be searched
     """
+    if not isinstance(output, list):
+        output = list(output)
+
     lastLine = None
     needASanRW = False
     needTSanRW = False
 
-    for line in output:
-        # Remove any PID output at the beginning of the line
-        line = re.sub("^\\[\\d+\\]\\s+", "", line, count=1)
+    for idx in findCandidateLines(output, AUXILIARY_CANDIDATES):
+        line = _stripPid(output[idx])
 
         if "ERROR: AddressSanitizer" in line:
             if "failed to allocate" in line:
                 lastLine = line.split(": ", 1)[-1].strip()
-            elif re.search(r"(SEGV|access-violation) on unknown address", line) is None:
+            elif RE_ASAN_UNKNOWN_ADDRESS.search(line) is None:
                 # Strip address, registers and PID prefix
-                line = re.sub(r"on address 0x[0-9a-f]+", "", line)
-                line = re.sub(r"(at |\()pc 0x[0-9a-f]+", "", line)
-                line = re.sub(r"bp 0x[0-9a-f]+", "", line)
-                line = re.sub(r"sp 0x[0-9a-f]+", "", line)
-                line = re.sub(r"(\(thread\s)?T[0-9]+\)", "", line)
-                line = re.sub(r"^[0-9=]+", "", line)
+                for stripRegex in RE_ASAN_STRIP:
+                    line = stripRegex.sub("", line)
                 lastLine = line.strip()
                 needASanRW = True
         elif needASanRW and "READ of size" in line or "WRITE of size" in line:
@@ -165,7 +263,7 @@ def getAuxiliaryAbortMessage(output):
             lastLine.append(line)
             needASanRW = False
         elif "WARNING: ThreadSanitizer:" in line:
-            line = re.sub(r"\s*\(pid=\d+\)", "", line)
+            line = RE_TSAN_PID.sub("", line)
             lastLine = line.strip()
 
             # If we have a data race, then we would like the read/write lines mentioning
@@ -174,14 +272,12 @@ def getAuxiliaryAbortMessage(output):
 
             if needTSanRW:
                 lastLine = [lastLine]
-        elif needTSanRW and re.match(
-            r"\s*(?:Previous )?(?:[Aa]tomic )?(?:[Rr]ead|[Ww]rite) of size", line
-        ):
+        elif needTSanRW and RE_TSAN_RW.match(line):
             lastLine.append(line.strip())
         elif "glibc detected" in line:
             # Aborts caused by glibc runtime error detection
             lastLine = line
-        elif "runtime error" in line and re.search(":\\d+:\\d+: runtime error: ", line):
+        elif "runtime error" in line and RE_UBSAN_ERROR.search(line):
             # UBSan error
             lastLine = line
 
@@ -21,12 +21,21 @@ import re
 import sys
 import unicodedata
 from abc import ABCMeta
+from collections import deque
 from functools import wraps
 
 from FTB import AssertionHelper
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Signatures import RegisterHelper
 from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.Fingerprint import CrashFingerprint
+from FTB.Signatures.FrameTable import FRAME_TABLE
+
+# Version of the format created by CrashInfo.toCompactCacheObject
+COMPACT_CACHE_VERSION = 1
+
+# Rust symbols have a source hash appended to them
+RE_RUST_HASH = re.compile(r"::h[0-9a-f]{16}$")
 
 
 def unicode_escape_result(func):
@@ -149,6 +158,139 @@ class TraceParsingError(RuntimeError):
         super().__init__(*args, **kwds)
 
 
+def _stripLineEnd(line):
+    if isinstance(line, bytes):
+        line = line.decode("utf-8", errors="replace")
+    return line.rstrip("\r\n")
+
+
+class CrashTypeDetector:
+    """
+    Detects the type of crash information line by line, preferring the first
+    line that clearly identifies a crash type.
+    """
+
+    asanString = "ERROR: AddressSanitizer"
+    asanString2 = "Sanitizer: hard rss limit exhausted"
+    gdbString = "received signal SIG"
+    gdbCoreString = "Program terminated with signal "
+    lsanString = "ERROR: LeakSanitizer:"
+    tsanString = "WARNING: ThreadSanitizer:"
+    tsanString2 = "ERROR: ThreadSanitizer:"
+    ubsanString = ": runtime error: "
+    ubsanString2 = "ERROR: UndefinedBehaviorSanitizer"
+    ubsanRegex = r".+?:\d+:\d+: runtime error:\s+.+"
+    appleString = "Mac OS X"
+    cdbString = "Microsoft (R) Windows Debugger"
+
+    # Use two strings for detecting rust backtraces to avoid false positives
+    rustFirstString = "panicked at"
+    rustSecondString = "stack backtrace:"
+
+    # Use two strings for detecting Minidumps to avoid false positives
+    minidumpFirstString = "OS|"
+    minidumpSecondString = "CPU|"
+
+    def __init__(self):
+        self.result = None
+
+        # some results are weak, meaning any other CrashInfo detected after it will
+        # take precedence
+        self.weakResult = None
+
+        self.rustFirstDetected = False
+        self.minidumpFirstDetected = False
+
+    def feed(self, line):
+        """
+        Check the next line of crash data.
+
+        @type line: string
+        @param line: The next line
+
+        @rtype: bool
+        @return: True if the crash type was detected and no further lines are needed
+        """
+        if self.ubsanString in line and re.match(self.ubsanRegex, line) is not None:
+            self.result = UBSanCrashInfo
+        elif (
+            self.asanString in line
+            or self.asanString2 in line
+            or self.ubsanString2 in line
+            or self.tsanString2 in line
+        ):
+            self.result = ASanCrashInfo
+        elif self.lsanString in line:
+            self.result = LSanCrashInfo
+        elif self.tsanString in line:
+            self.result = TSanCrashInfo
+        elif self.appleString in line and not line.startswith(self.minidumpFirstString):
+            self.result = AppleCrashInfo
+        elif self.cdbString in line:
+            self.result = CDBCrashInfo
+        elif self.gdbString in line or self.gdbCoreString in line:
+            self.result = GDBCrashInfo
+        elif not self.rustFirstDetected and self.rustFirstString in line:
+            self.rustFirstDetected = True
+            self.minidumpFirstDetected = False
+        elif self.rustFirstDetected and self.rustSecondString in line:
+            self.weakResult = RustCrashInfo
+            self.rustFirstDetected = False
+        elif not self.minidumpFirstDetected and self.minidumpFirstString in line:
+            # Only match Minidump output if the *next* line also contains
+            # the second search string defined above.
+            self.rustFirstDetected = False
+            self.minidumpFirstDetected = True
+        elif self.minidumpFirstDetected and self.minidumpSecondString in line:
+            self.result = MinidumpCrashInfo
+        elif line.startswith("==") and re.match(ValgrindCrashInfo.MSG_REGEX, line):
+            self.result = ValgrindCrashInfo
+        else:
+            self.minidumpFirstDetected = False
+
+        return self.result is not None
+
+    def getResult(self):
+        """
+        @rtype: type
+        @return: The CrashInfo subclass for the lines seen so far
+        """
+        # Default fallback to be used if there is neither ASan nor GDB output.
+        # This is still useful in case there is no crash but we want to match
+        # e.g. stdout/stderr output with signatures.
+        return self.result or self.weakResult or NoCrashInfo
+
+
+class _CrashDataWindow:
+    """Bounded selection of the lines of a stream: the start of the crash report
+    and the tail of the stream, including the lines leading up to the report."""
+
+    def __init__(self, tailLines, reportLines):
+        self.head = None
+        self.report = []
+        self.reportLines = reportLines
+        self.tail = deque(maxlen=tailLines)
+
+    def startReport(self):
+        if self.head is None:
+            self.head = list(self.tail)
+            self.tail.clear()
+
+    def append(self, line):
+        if self.head is not None and len(self.report) < self.reportLines:
+            self.report.append(line)
+        else:
+            self.tail.append(line)
+
+    def extend(self, lines):
+        for line in lines:
+            self.append(_stripLineEnd(line))
+        return self
+
+    def getLines(self):
+        return (self.head or []) + self.report + list(self.tail)
+
+
 class CrashInfo(metaclass=ABCMeta):
     """
     Abstract base class that provides a method to instantiate the right sub class.
@@ -161,11 +303,13 @@ class CrashInfo(metaclass=ABCMeta):
         self.rawStderr = []
         self.rawCrashData = []
 
-        # Store processed data
-        self.backtrace = []
-        self.registers = {}
-        self.crashAddress = None
-        self.crashInstruction = None
+        # Store processed data, parsed from the raw data on first access
+        self._pendingParse = None
+        self._backtrace = []
+        self._registers = {}
+        self._registersData = None
+        self._crashAddress = None
+        self._crashInstruction = None
 
         # Store configuration data (platform, product, os, etc.)
         self.configuration = None
@@ -176,7 +320,105 @@ class CrashInfo(metaclass=ABCMeta):
         self.testcase = None
 
         # This can be used to record failures during signature creation
-        self.failureReason = None
+        self._failureReason = None
+
+        # Memoized abort messages, see getAssertion
+        self._abortMessages = {}
+
+        # Frame ids of the backtrace, see backtraceIds
+        self._backtraceIds = None
+
+        # See fingerprint
+        self._fingerprint = None
+
+    def __getstate__(self):
+        # Frame ids are only valid within this process
+        state = self.__dict__.copy()
+        state["_backtraceIds"] = None
+        state["_fingerprint"] = None
+        return state
+
+    def _setBacktrace(self, frames):
+        # Frames repeat across many crashes, so share them in memory using the
+        # frame table and keep the ids for matching.
+        generation = FRAME_TABLE.generation
+        ids = FRAME_TABLE.getIds(frames)
+        self._backtrace = [FRAME_TABLE.getFrame(frameId) for frameId in ids]
+        self._backtraceIds = (self._backtrace, len(self._backtrace), ids, generation)
+
+    @property
+    def backtraceIds(self):
+        """
+        Ids of the backtrace frames in the frame table of this process, used by
+        the stack symptoms to match each distinct frame only once.
+
+        @rtype: array
+        @return: Frame ids, in the same order as the backtrace
+        """
+        backtrace = self.backtrace
+        cached = self._backtraceIds
+        if (
+            cached is None
+            or cached[0] is not backtrace
+            or cached[1] != len(backtrace)
+            # ids older than the previous generation can't be looked up
+            or cached[3] < FRAME_TABLE.generation - 1
+        ):
+            generation = FRAME_TABLE.generation
+            ids = FRAME_TABLE.getIds(backtrace)
+            cached = (backtrace, len(backtrace), ids, generation)
+            self._backtraceIds = cached
+        return cached[2]
+
+    @property
+    def fingerprint(self):
+        """
+        Features of this crash that signatures check before any of their
+        symptoms, see L{SignatureFingerprint.rejects}. Features that require the
+        crash data to be parsed are only looked up when a signature checks them.
+
+        @rtype: CrashFingerprint
+        @return: Fingerprint of this crash
+        """
+        outputs = (bool(self.rawStdout), bool(self.rawStderr), bool(self.rawCrashData))
+        cached = self._fingerprint
+        if cached is None or cached[0] != outputs:
+            cached = (outputs, CrashFingerprint(self))
+            self._fingerprint = cached
+        return cached[1]
+
+    def _getAbortMessage(self, extractor, output):
+        # Signature creation looks up the same messages several times, e.g. for
+        # the short and the full signature. The raw output is only checked for
+        # identity and length, as it is not modified after parsing.
+        key = (extractor, id(output))
+        cached = self._abortMessages.get(key)
+        if cached is None or cached[0] is not output or cached[1] != len(output):
+            cached = (output, len(output), extractor(output))
+            self._abortMessages[key] = cached
+
+        result = cached[2]
+        if isinstance(result, list):
+            return list(result)
+        return result
+
+    def getAssertion(self, output):
+        """
+        Memoized version of L{AssertionHelper.getAssertion}.
+
+        @type output: list
+        @param output: Raw output of this crash (e.g. rawStderr) to be searched
+        """
+        return self._getAbortMessage(AssertionHelper.getAssertion, output)
+
+    def getAuxiliaryAbortMessage(self, output):
+        """
+        Memoized version of L{AssertionHelper.getAuxiliaryAbortMessage}.
+
+        @type output: list
+        @param output: Raw output of this crash (e.g. rawStderr) to be searched
+        """
+        return self._getAbortMessage(AssertionHelper.getAuxiliaryAbortMessage, output)
 
     def __str__(self):
         buf = []
@@ -223,6 +465,138 @@ class CrashInfo(metaclass=ABCMeta):
 
         return cacheObject
 
+    def toCompactCacheObject(self):
+        """
+        Create a compact cache object, holding the same information as the one
+        created by L{toCacheObject}. The fields are stored by position rather than
+        by name and the registers are kept as a JSON string, so restoring the
+        object doesn't decode them until they are used. The object only consists
+        of lists, strings and integers and is meant to be stored in a binary
+        serialization format like msgpack.
+
+        @rtype: list
+        @return: List containing expensive class fields, starting with the format
+                 version L{COMPACT_CACHE_VERSION}
+        """
+        if self._registersData is not None:
+            registers = self._registersData
+        else:
+            registers = json.dumps(self.registers, separators=(",", ":"))
+
+        return [
+            COMPACT_CACHE_VERSION,
+            self.backtrace,
+            int(self.crashAddress) if self.crashAddress is not None else None,
+            self.crashInstruction,
+            self.failureReason,
+            registers,
+        ]
+
+    def _deferParse(self, stdout, stderr, crashData):
+        # The raw data is already stored, only remember which of it was given
+        self._pendingParse = (
+            stdout is not None,
+            stderr is not None,
+            crashData is not None,
+        )
+
+    def _ensureParsed(self):
+        pending = self._pendingParse
+        if pending is None:
+            return
+
+        self._pendingParse = None
+        try:
+            self._parse(
+                self.rawStdout if pending[0] else None,
+                self.rawStderr if pending[1] else None,
+                self.rawCrashData if pending[2] else None,
+            )
+        except Exception:
+            # Fail again on the next access rather than leaving partial results
+            self._pendingParse = pending
+            self._backtrace = []
+            self._registers = {}
+            self._crashAddress = None
+            self._crashInstruction = None
+            raise
+
+        # Rust symbols have a source hash appended to them. Strip this off regardless of
+        # the CrashInfo type
+        self._setBacktrace(
+            RE_RUST_HASH.sub("", frame) if "::h" in frame else frame
+            for frame in self._backtrace
+        )
+
+    def _parse(self, stdout, stderr, crashData):
+        """
+        Parse the raw crash data into the backtrace, registers, crash address and
+        instruction. Subclasses implement this and it is only called once, on
+        first access of any of these fields.
+
+        @type stdout: list
+        @param stdout: Lines as they appeared on stdout, or None
+        @type stderr: list
+        @param stderr: Lines as they appeared on stderr, or None
+        @type crashData: list
+        @param crashData: Additional crash output, or None
+        """
+
+    @property
+    def backtrace(self):
+        self._ensureParsed()
+        return self._backtrace
+
+    @backtrace.setter
+    def backtrace(self, backtrace):
+        self._ensureParsed()
+        self._backtrace = backtrace
+
+    @property
+    def registers(self):
+        self._ensureParsed()
+        # Registers restored from a compact cache object are decoded on first use
+        if self._registersData is not None:
+            self._registers = json.loads(self._registersData)
+            self._registersData = None
+        return self._registers
+
+    @registers.setter
+    def registers(self, registers):
+        self._ensureParsed()
+        self._registers = registers
+        self._registersData = None
+
+    @property
+    def crashAddress(self):
+        self._ensureParsed()
+        return self._crashAddress
+
+    @crashAddress.setter
+    def crashAddress(self, crashAddress):
+        self._ensureParsed()
+        self._crashAddress = crashAddress
+
+    @property
+    def crashInstruction(self):
+        self._ensureParsed()
+        return self._crashInstruction
+
+    @crashInstruction.setter
+    def crashInstruction(self, crashInstruction):
+        self._ensureParsed()
+        self._crashInstruction = crashInstruction
+
+    @property
+    def failureReason(self):
+        self._ensureParsed()
+        return self._failureReason
+
+    @failureReason.setter
+    def failureReason(self, failureReason):
+        self._ensureParsed()
+        self._failureReason = failureReason
+
     @staticmethod
     def fromRawCrashData(
         stdout, stderr, configuration, auxCrashData=None, cacheObject=None
@@ -240,10 +614,11 @@ class CrashInfo(metaclass=ABCMeta):
         @type auxCrashData: List of strings
         @param auxCrashData: Optional additional crash output (e.g. GDB). If not
                              specified, stderr is used.
-        @type cacheObject: Dictionary
+        @type cacheObject: Dictionary or list
         @param cacheObject: The cache object that should be used to restore the class
                             fields instead of parsing the crash data. The appropriate
-                            object can be created by calling the toCacheObject method.
+                            object can be created by calling the toCacheObject or the
+                            toCompactCacheObject method.
 
         @rtype: CrashInfo
         @return: Crash information object
@@ -277,41 +652,29 @@ class CrashInfo(metaclass=ABCMeta):
                 c.rawCrashData.extend(auxCrashData)
 
             c.configuration = configuration
-            c.backtrace = cacheObject["backtrace"]
-            c.registers = cacheObject["registers"]
-            c.crashAddress = cacheObject["crashAddress"]
-            c.crashInstruction = cacheObject["crashInstruction"]
-            c.failureReason = cacheObject["failureReason"]
+            if isinstance(cacheObject, dict):
+                c._setBacktrace(cacheObject["backtrace"])
+                c.registers = cacheObject["registers"]
+                c.crashAddress = cacheObject["crashAddress"]
+                c.crashInstruction = cacheObject["crashInstruction"]
+                c.failureReason = cacheObject["failureReason"]
+            else:
+                (
+                    version,
+                    backtrace,
+                    c.crashAddress,
+                    c.crashInstruction,
+                    c.failureReason,
+                    c._registersData,
+                ) = cacheObject
+                if version != COMPACT_CACHE_VERSION:
+                    raise RuntimeError(
+                        f"Unsupported compact cache object version: {version}"
+                    )
+                c._setBacktrace(backtrace)
 
             return c
 
-        # some results are weak, meaning any other CrashInfo detected after it will take
-        # precedence
-        weakResult = None
-
-        asanString = "ERROR: AddressSanitizer"
-        asanString2 = "Sanitizer: hard rss limit exhausted"
-        gdbString = "received signal SIG"
-        gdbCoreString = "Program terminated with signal "
-        lsanString = "ERROR: LeakSanitizer:"
-        tsanString = "WARNING: ThreadSanitizer:"
-        tsanString2 = "ERROR: ThreadSanitizer:"
-        ubsanString = ": runtime error: "
-        ubsanString2 = "ERROR: UndefinedBehaviorSanitizer"
-        ubsanRegex = r".+?:\d+:\d+: runtime error:\s+.+"
-        appleString = "Mac OS X"
-        cdbString = "Microsoft (R) Windows Debugger"
-
-        # Use two strings for detecting rust backtraces to avoid false positives
-        rustFirstString = "panicked at"
-        rustSecondString = "stack backtrace:"
-        rustFirstDetected = False
-
-        # Use two strings for detecting Minidumps to avoid false positives
-        minidumpFirstString = "OS|"
-        minidumpSecondString = "CPU|"
-        minidumpFirstDetected = False
-
         # Search both crashData and stderr, but prefer crashData
         lines = []
         if auxCrashData is not None:
@@ -319,69 +682,84 @@ class CrashInfo(metaclass=ABCMeta):
         if stderr is not None:
             lines.extend(stderr)
 
-        result = None
+        detector = CrashTypeDetector()
         for line in lines:
-            if ubsanString in line and re.match(ubsanRegex, line) is not None:
-                result = UBSanCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
-            elif (
-                asanString in line
-                or asanString2 in line
-                or ubsanString2 in line
-                or tsanString2 in line
-            ):
-                result = ASanCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
-            elif lsanString in line:
-                result = LSanCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
-            elif tsanString in line:
-                result = TSanCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
-            elif appleString in line and not line.startswith(minidumpFirstString):
-                result = AppleCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
-            elif cdbString in line:
-                result = CDBCrashInfo(stdout, stderr, configuration, auxCrashData)
+            if detector.feed(line):
                 break
-            elif gdbString in line or gdbCoreString in line:
-                result = GDBCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
-            elif not rustFirstDetected and rustFirstString in line:
-                rustFirstDetected = True
-                minidumpFirstDetected = False
-            elif rustFirstDetected and rustSecondString in line:
-                weakResult = RustCrashInfo(stdout, stderr, configuration, auxCrashData)
-                rustFirstDetected = False
-            elif not minidumpFirstDetected and minidumpFirstString in line:
-                # Only match Minidump output if the *next* line also contains
-                # the second search string defined above.
-                rustFirstDetected = False
-                minidumpFirstDetected = True
-            elif minidumpFirstDetected and minidumpSecondString in line:
-                result = MinidumpCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
-            elif line.startswith("==") and re.match(ValgrindCrashInfo.MSG_REGEX, line):
-                result = ValgrindCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
-            else:
-                minidumpFirstDetected = False
 
-        # Default fallback to be used if there is neither ASan nor GDB output.
-        # This is still useful in case there is no crash but we want to match
-        # e.g. stdout/stderr output with signatures.
-        if result is None:
-            result = weakResult or NoCrashInfo(
-                stdout, stderr, configuration, auxCrashData
-            )
+        return CrashInfo._create(
+            detector.getResult(), stdout, stderr, configuration, auxCrashData
+        )
 
-        # Rust symbols have a source hash appended to them. Strip this off regardless of
-        # the CrashInfo type
-        result.backtrace = [
-            re.sub(r"::h[0-9a-f]{16}$", "", frame) for frame in result.backtrace
-        ]
+    @staticmethod
+    def fromRawCrashStreams(
+        stdout,
+        stderr,
+        configuration,
+        auxCrashData=None,
+        tailLines=1000,
+        reportLines=10000,
+    ):
+        """
+        Create appropriate CrashInfo instance from raw crash data streams, without
+        holding the complete output in memory.
+
+        The crash type is detected while reading each stream once. Of each stream,
+        only the last tailLines lines are kept, plus up to reportLines lines
+        starting at the detected crash report. The crash information is parsed
+        from these lines, and they are the raw output of the resulting CrashInfo
+        that output symptoms are matched against.
+
+        @type stdout: Iterable of strings
+        @param stdout: Lines as they appeared on stdout, e.g. a file object
+        @type stderr: Iterable of strings
+        @param stderr: Lines as they appeared on stderr, e.g. a file object
+        @type configuration: ProgramConfiguration
+        @param configuration: Exact program configuration that is associated with the
+                              crash
+        @type auxCrashData: Iterable of strings
+        @param auxCrashData: Optional additional crash output (e.g. GDB). If not
+                             specified, stderr is used.
+        @type tailLines: int
+        @param tailLines: Number of lines kept from the end of each stream
+        @type reportLines: int
+        @param reportLines: Number of lines kept from the start of the crash report
 
-        return result
+        @rtype: CrashInfo
+        @return: Crash information object
+        """
+        assert isinstance(configuration, ProgramConfiguration)
+
+        detector = CrashTypeDetector()
+
+        # Search both crashData and stderr, but prefer crashData
+        windows = []
+        for stream in (auxCrashData, stderr):
+            if stream is None:
+                windows.append(None)
+                continue
+            window = _CrashDataWindow(tailLines, reportLines)
+            for line in stream:
+                line = _stripLineEnd(line)
+                if detector.result is None:
+                    weakResult = detector.weakResult
+                    if detector.feed(line) or detector.weakResult is not weakResult:
+                        window.startReport()
+                window.append(line)
+            windows.append(window.getLines())
+        auxCrashData, stderr = windows
+
+        if stdout is not None:
+            stdout = _CrashDataWindow(tailLines, 0).extend(stdout).getLines()
+
+        return CrashInfo._create(
+            detector.getResult(), stdout, stderr, configuration, auxCrashData
+        )
+
+    @staticmethod
+    def _create(cls, stdout, stderr, configuration, auxCrashData):
+        # The crash data is only parsed once any of the parsed fields is used
+        return cls(stdout, stderr, configuration, auxCrashData)
 
     @unicode_escape_result
     def createShortSignature(self):
@@ -390,11 +768,11 @@ class CrashInfo(metaclass=ABCMeta):
         @return: A string representing this crash (short signature)
         """
         # See if we have an abort message and if so, use that as short signature
-        abortMsg = AssertionHelper.getAssertion(self.rawStderr)
+        abortMsg = self.getAssertion(self.rawStderr)
 
         # See if we have an abort message in our crash data maybe
         if not abortMsg and self.rawCrashData:
-            abortMsg = AssertionHelper.getAssertion(self.rawCrashData)
+            abortMsg = self.getAssertion(self.rawCrashData)
 
         if abortMsg is not None:
             if isinstance(abortMsg, list):
@@ -444,25 +822,25 @@ class CrashInfo(metaclass=ABCMeta):
         abortMsgInCrashdata = False
 
         # See if we have an abort message and if so, get a sanitized version of it
-        abortMsgs = AssertionHelper.getAssertion(self.rawStderr)
+        abortMsgs = self.getAssertion(self.rawStderr)
 
         if abortMsgs is None and minimumSupportedVersion >= 13:
             # Look for abort messages also inside crashdata
             # only on version 1.3 or higher, because the "crashdata" source
             # type for output matching was added in that version.
-            abortMsgs = AssertionHelper.getAssertion(self.rawCrashData)
+            abortMsgs = self.getAssertion(self.rawCrashData)
             if abortMsgs is not None:
                 abortMsgInCrashdata = True
 
         # Still no abort message, fall back to auxiliary abort messages (ASan/UBSan)
         if abortMsgs is None:
-            abortMsgs = AssertionHelper.getAuxiliaryAbortMessage(self.rawStderr)
+            abortMsgs = self.getAuxiliaryAbortMessage(self.rawStderr)
 
         if abortMsgs is None and minimumSupportedVersion >= 13:
             # Look for auxiliary abort messages also inside crashdata
             # only on version 1.3 or higher, because the "crashdata" source
             # type for output matching was added in that version.
-            abortMsgs = AssertionHelper.getAuxiliaryAbortMessage(self.rawCrashData)
+            abortMsgs = self.getAuxiliaryAbortMessage(self.rawCrashData)
             if abortMsgs is not None:
                 abortMsgInCrashdata = True
 
@@ -685,7 +1063,9 @@ class ASanCrashInfo(CrashInfo):
             self.rawCrashData.extend(crashData)
 
         self.configuration = configuration
+        self._deferParse(stdout, stderr, crashData)
 
+    def _parse(self, stdout, stderr, crashData):
         # If crashData is given, use that to find the ASan trace, otherwise use stderr
         asanOutput = crashData if crashData else stderr
 
@@ -829,12 +1209,12 @@ class ASanCrashInfo(CrashInfo):
         @return: A string representing this crash (short signature)
         """
         # Always prefer using regular program aborts
-        abortMsg = AssertionHelper.getAssertion(self.rawStderr)
+        abortMsg = self.getAssertion(self.rawStderr)
 
         # Also check the crash data for program abort data
         # (sometimes happens e.g. with MOZ_CRASH)
         if not abortMsg and self.rawCrashData:
-            abortMsg = AssertionHelper.getAssertion(self.rawCrashData)
+            abortMsg = self.getAssertion(self.rawCrashData)
 
         if abortMsg is not None:
             if isinstance(abortMsg, list):
@@ -844,11 +1224,11 @@ class ASanCrashInfo(CrashInfo):
 
         # If we don't have a program abort message, see if we have an ASan
         # specific abort message other than a crash message that we can use.
-        abortMsg = AssertionHelper.getAuxiliaryAbortMessage(self.rawStderr)
+        abortMsg = self.getAuxiliaryAbortMessage(self.rawStderr)
 
         # Also check the crash data again
         if not abortMsg and self.rawCrashData:
-            abortMsg = AssertionHelper.getAuxiliaryAbortMessage(self.rawCrashData)
+            abortMsg = self.getAuxiliaryAbortMessage(self.rawCrashData)
 
         if abortMsg is not None:
             rwMsg = None
@@ -915,7 +1295,9 @@ class LSanCrashInfo(CrashInfo):
             self.rawCrashData.extend(crashData)
 
         self.configuration = configuration
+        self._deferParse(stdout, stderr, crashData)
 
+    def _parse(self, stdout, stderr, crashData):
         # If crashData is given, use that to find the LSan trace, otherwise use stderr
         lsanOutput = crashData if crashData else stderr
         lsanErrorPattern = "ERROR: LeakSanitizer:"
@@ -969,11 +1351,11 @@ class LSanCrashInfo(CrashInfo):
         @return: A string representing this crash (short signature)
         """
         # Try to find the LSan message on stderr and use that as short signature
-        abortMsg = AssertionHelper.getAuxiliaryAbortMessage(self.rawStderr)
+        abortMsg = self.getAuxiliaryAbortMessage(self.rawStderr)
 
         # See if we have it in our crash data maybe instead
         if not abortMsg and self.rawCrashData:
-            abortMsg = AssertionHelper.getAuxiliaryAbortMessage(self.rawCrashData)
+            abortMsg = self.getAuxiliaryAbortMessage(self.rawCrashData)
 
         if abortMsg is not None:
             if isinstance(abortMsg, list):
@@ -1004,7 +1386,9 @@ class UBSanCrashInfo(CrashInfo):
             self.rawCrashData.extend(crashData)
 
         self.configuration = configuration
+        self._deferParse(stdout, stderr, crashData)
 
+    def _parse(self, stdout, stderr, crashData):
         # If crashData is given, use that to find the UBSan trace, otherwise use stderr
         ubsanOutput = crashData if crashData else stderr
         ubsanErrorPattern = r":\d+:\d+:\s+runtime\s+error:\s+"
@@ -1052,11 +1436,11 @@ class UBSanCrashInfo(CrashInfo):
         @return: A string representing this crash (short signature)
         """
         # Try to find the UBSan message on stderr and use that as short signature
-        abortMsg = AssertionHelper.getAuxiliaryAbortMessage(self.rawStderr)
+        abortMsg = self.getAuxiliaryAbortMessage(self.rawStderr)
 
         # See if we have it in our crash data maybe instead
         if not abortMsg and self.rawCrashData:
-            abortMsg = AssertionHelper.getAuxiliaryAbortMessage(self.rawCrashData)
+            abortMsg = self.getAuxiliaryAbortMessage(self.rawCrashData)
 
         if abortMsg is not None:
             if isinstance(abortMsg, list):
@@ -1087,7 +1471,9 @@ class GDBCrashInfo(CrashInfo):
             self.rawCrashData.extend(crashData)
 
         self.configuration = configuration
+        self._deferParse(stdout, stderr, crashData)
 
+    def _parse(self, stdout, stderr, crashData):
         # If crashData is given, use that to find the GDB trace, otherwise use stderr
         if crashData:
             gdbOutput = crashData
@@ -1581,7 +1967,9 @@ class MinidumpCrashInfo(CrashInfo):
             self.rawCrashData.extend(crashData)
 
         self.configuration = configuration
+        self._deferParse(stdout, stderr, crashData)
 
+    def _parse(self, stdout, stderr, crashData):
         # If crashData is given, use that to find the Minidump trace, otherwise use
         # stderr
         if crashData:
@@ -1634,7 +2022,9 @@ class AppleCrashInfo(CrashInfo):
             self.rawCrashData.extend(crashData)
 
         self.configuration = configuration
+        self._deferParse(stdout, stderr, crashData)
 
+    def _parse(self, stdout, stderr, crashData):
         apple_crash_data = crashData or stderr
 
         inCrashingThread = False
@@ -1703,7 +2093,9 @@ class CDBCrashInfo(CrashInfo):
             self.rawCrashData.extend(crashData)
 
         self.configuration = configuration
+        self._deferParse(stdout, stderr, crashData)
 
+    def _parse(self, stdout, stderr, crashData):
         cdbRegisterPattern = RegisterHelper.getRegisterPattern() + "=([0-9a-f]+)"
 
         address = ""
@@ -1862,7 +2254,9 @@ class RustCrashInfo(CrashInfo):
             self.rawCrashData.extend(crashData)
 
         self.configuration = configuration
+        self._deferParse(stdout, stderr, crashData)
 
+    def _parse(self, stdout, stderr, crashData):
         # If crashData is given, use that to find the rust backtrace, otherwise use
         # stderr
         rustOutput = crashData or stderr
@@ -1907,7 +2301,9 @@ class TSanCrashInfo(CrashInfo):
             self.rawCrashData.extend(crashData)
 
         self.configuration = configuration
+        self._deferParse(stdout, stderr, crashData)
 
+    def _parse(self, stdout, stderr, crashData):
         # If crashData is given, use that to find the ASan trace, otherwise use stderr
         tsanOutput = crashData if crashData else stderr
 
@@ -2001,6 +2397,7 @@ class TSanCrashInfo(CrashInfo):
         @rtype: String
         @return: A string representing this crash (short signature)
         """
+        self._ensureParsed()
         if self.tsanWarnLine:
             msg = re.sub(r"\s*\(pid=\d+\)", "", self.tsanWarnLine)
             msg = msg.replace("WARNING: ", "")
@@ -2067,7 +2464,9 @@ class ValgrindCrashInfo(CrashInfo):
             self.rawCrashData.extend(crashData)
 
         self.configuration = configuration
+        self._deferParse(stdout, stderr, crashData)
 
+    def _parse(self, stdout, stderr, crashData):
         # If crashData is given, use that to find the Valgrind trace, otherwise use
         # stderr
         vgdOutput = crashData if crashData else stderr
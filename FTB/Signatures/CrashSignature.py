@@ -19,6 +19,7 @@ import difflib
 import json
 
 from FTB.Signatures import JSONHelper
+from FTB.Signatures.Fingerprint import SignatureFingerprint
 from FTB.Signatures.Symptom import (
     OutputSymptom,
     StackFramesSymptom,
@@ -65,6 +66,13 @@ class CrashSignature:
         self.operatingSystems = JSONHelper.getArrayChecked(obj, "operatingSystems")
         self.products = JSONHelper.getArrayChecked(obj, "products")
 
+        # Symptoms in the order they are checked when matching. All of them have
+        # to match, so the cheap ones go first to reject crashes early.
+        self.matchPlan = sorted(self.symptoms, key=lambda symptom: symptom.matchCost)
+
+        # Features a crash must have to match, checked before any symptom
+        self.fingerprint = SignatureFingerprint(self.symptoms)
+
     @staticmethod
     def fromFile(signatureFile):
         with open(signatureFile) as sigFd:
@@ -73,51 +81,81 @@ class CrashSignature:
     def __str__(self):
         return str(self.rawSignature)
 
-    def matches(self, crashInfo):
+    def matches(self, crashInfo, outputMatches=None):
         """
         Match this signature against the given crash information
 
         @type crashInfo: CrashInfo
         @param crashInfo: The crash info to match the signature against
 
+        @type outputMatches: set
+        @param outputMatches: Keys of the output symptoms matching the crash, as
+                              returned by L{OutputMatcher.match} for a matcher
+                              containing this signature. If None, the output
+                              symptoms are checked against the crash directly.
+
         @rtype: bool
         @return: True if the signature matches, False otherwise
         """
-        if (
-            self.platforms is not None
-            and crashInfo.configuration.platform not in self.platforms
-        ):
+        if not self._matchesConfiguration(crashInfo.configuration):
             return False
 
-        if (
-            self.operatingSystems is not None
-            and crashInfo.configuration.os not in self.operatingSystems
-        ):
+        if self.fingerprint.rejects(crashInfo.fingerprint):
             return False
 
-        if (
-            self.products is not None
-            and crashInfo.configuration.product not in self.products
-        ):
-            return False
+        for symptom in self.matchPlan:
+            if outputMatches is not None and isinstance(symptom, OutputSymptom):
+                if symptom.key not in outputMatches:
+                    return False
+            elif not symptom.matches(crashInfo):
+                return False
 
-        deferredSymptoms = []
+        return True
 
-        for symptom in self.symptoms:
-            # We want to defer matching Testcase and Output symptoms as they can be slow
-            # and pretty much all other symptoms are instant in matching.
-            if isinstance(symptom, TestcaseSymptom) or isinstance(
-                symptom, OutputSymptom
-            ):
-                deferredSymptoms.append(symptom)
-                continue
+    def matchesMany(self, crashInfos):
+        """
+        Match this signature against many crashes at once. This gives the same
+        results as calling L{matches} for each crash, but evaluates the
+        signature symptom by symptom over all crashes that still match, so
+        each symptom can share work across the crashes (e.g. the function
+        names of the stack symptoms are only checked once per distinct frame).
 
-            if not symptom.matches(crashInfo):
-                return False
+        @type crashInfos: list
+        @param crashInfos: The crash infos to match the signature against
 
-        for symptom in deferredSymptoms:
-            if not symptom.matches(crashInfo):
-                return False
+        @rtype: list(bool)
+        @return: For each crash, True if the signature matches, False otherwise
+        """
+        remaining = [
+            idx
+            for (idx, crashInfo) in enumerate(crashInfos)
+            if self._matchesConfiguration(crashInfo.configuration)
+            and not self.fingerprint.rejects(crashInfo.fingerprint)
+        ]
+
+        for symptom in self.matchPlan:
+            if not remaining:
+                break
+            results = symptom.matchesMany([crashInfos[idx] for idx in remaining])
+            remaining = [idx for (idx, result) in zip(remaining, results) if result]
+
+        results = [False] * len(crashInfos)
+        for idx in remaining:
+            results[idx] = True
+        return results
+
+    def _matchesConfiguration(self, configuration):
+        if self.platforms is not None and configuration.platform not in self.platforms:
+            return False
+
+        if (
+            self.operatingSystems is not None
+            and configuration.os not in self.operatingSystems
+        ):
+            return False
+
+        if self.products is not None and configuration.product not in self.products:
+            return False
 
         return True
 
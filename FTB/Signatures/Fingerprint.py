@@ -0,0 +1,198 @@
+"""
+Fingerprints
+
+Summaries of the features of crashes and signatures that allow rejecting most
+signatures for a crash without evaluating any of their symptoms.
+
+A L{SignatureFingerprint} records what a crash must have for the signature to
+match at all: a crash address (or none), a minimum number of stack frames,
+literal function names at fixed stack positions and non-empty output sources.
+A L{CrashFingerprint} is computed once per crash and holds the corresponding
+features. Checking one against the other takes a few comparisons and at most
+one lookup of a memoized frame match per fixed frame, so regular expressions
+are only evaluated for signatures that pass.
+
+A fingerprint never rejects a crash that the signature would match, it only
+serves as a quick precheck for L{CrashSignature.matches}.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+from FTB.Signatures.Matchers import NumberMatchType
+from FTB.Signatures.Symptom import (
+    CrashAddressSymptom,
+    OutputSymptom,
+    StackFramesSymptom,
+    StackFrameSymptom,
+    StackSizeSymptom,
+)
+
+
+class CrashFingerprint:
+    __slots__ = ("crashInfo", "outputSources")
+
+    def __init__(self, crashInfo):
+        """
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash to summarize
+        """
+        # The features depending on the parsed crash data are looked up on use,
+        # so signatures without such requirements don't cause parsing.
+        self.crashInfo = crashInfo
+        self.outputSources = frozenset(
+            src
+            for (src, output) in (
+                ("stdout", crashInfo.rawStdout),
+                ("stderr", crashInfo.rawStderr),
+                ("crashdata", crashInfo.rawCrashData),
+            )
+            if output
+        )
+
+    @property
+    def hasCrashAddress(self):
+        return self.crashInfo.crashAddress is not None
+
+    @property
+    def frameIds(self):
+        return self.crashInfo.backtraceIds
+
+    @property
+    def stackSize(self):
+        return len(self.frameIds)
+
+
+class SignatureFingerprint:
+    def __init__(self, symptoms):
+        """
+        @type symptoms: list
+        @param symptoms: Symptoms of the signature to summarize
+        """
+        # True if a crash address is required, False if the crash must not
+        # have one and None if the address is not relevant
+        self.crashAddress = None
+
+        # Rejects any crash, e.g. for conflicting crash address symptoms
+        self.impossible = False
+
+        self.minStackSize = 0
+
+        # Literal function names by stack position as (position, StringMatch)
+        self.fixedFrames = []
+
+        # Output sources that must not be empty
+        self.outputSources = set()
+
+        # Set if any of the output sources must not be empty
+        self.anyOutput = False
+
+        for symptom in symptoms:
+            if isinstance(symptom, CrashAddressSymptom):
+                self._requireCrashAddress(symptom.address.value is not None)
+            elif isinstance(symptom, StackSizeSymptom):
+                self._requireStackSize(
+                    SignatureFingerprint._minValue(symptom.stackSize)
+                )
+            elif isinstance(symptom, StackFrameSymptom):
+                self._addStackFrame(symptom)
+            elif isinstance(symptom, StackFramesSymptom):
+                self._addStackFrames(symptom)
+            elif isinstance(symptom, OutputSymptom):
+                if symptom.src is None:
+                    self.anyOutput = True
+                else:
+                    self.outputSources.add(symptom.src)
+
+        if self.outputSources:
+            # Implied by any of the required sources
+            self.anyOutput = False
+
+    @staticmethod
+    def _minValue(numberMatch):
+        # Smallest non-negative value that the number match can accept
+        if numberMatch.value is None:
+            return 0
+        if numberMatch.matchType is None or numberMatch.matchType == NumberMatchType.GE:
+            return max(numberMatch.value, 0)
+        if numberMatch.matchType == NumberMatchType.GT:
+            return max(numberMatch.value + 1, 0)
+        return 0
+
+    def _requireCrashAddress(self, required):
+        if self.crashAddress is not None and self.crashAddress != required:
+            self.impossible = True
+        self.crashAddress = required
+
+    def _requireStackSize(self, size):
+        self.minStackSize = max(self.minStackSize, size)
+
+    def _addStackFrame(self, symptom):
+        frameNumber = symptom.frameNumber
+        if frameNumber.value is None:
+            return
+
+        self._requireStackSize(SignatureFingerprint._minValue(frameNumber) + 1)
+
+        if (
+            frameNumber.matchType is None
+            and frameNumber.value >= 0
+            and not symptom.functionName.isPCRE
+        ):
+            self.fixedFrames.append((frameNumber.value, symptom.functionName))
+
+    def _addStackFrames(self, symptom):
+        wildcards = 0
+        fixed = True
+        for idx, functionName in enumerate(symptom.functionNames):
+            if functionName.value in {"?", "???"}:
+                # Wildcards match a variable number of frames, so the positions
+                # of the following names are unknown.
+                wildcards += 1
+                fixed = False
+            elif fixed and not functionName.isPCRE:
+                self.fixedFrames.append((idx, functionName))
+
+        self._requireStackSize(len(symptom.functionNames) - wildcards)
+
+    def rejects(self, crashFingerprint):
+        """
+        Check if the signature can't match a crash with the given fingerprint.
+
+        @type crashFingerprint: CrashFingerprint
+        @param crashFingerprint: Fingerprint of the crash, see L{CrashInfo.fingerprint}
+
+        @rtype: bool
+        @return: True if the signature does not match the crash, False if the
+                 symptoms of the signature need to be checked
+        """
+        if self.impossible:
+            return True
+
+        if self.anyOutput and not crashFingerprint.outputSources:
+            return True
+
+        if not self.outputSources.issubset(crashFingerprint.outputSources):
+            return True
+
+        if (
+            self.crashAddress is not None
+            and self.crashAddress != crashFingerprint.hasCrashAddress
+        ):
+            return True
+
+        if not self.minStackSize:
+            return False
+
+        if crashFingerprint.stackSize < self.minStackSize:
+            return True
+
+        frameIds = crashFingerprint.frameIds
+        for idx, functionName in self.fixedFrames:
+            if not functionName.matchesFrame(frameIds[idx]):
+                return True
+
+        return False
@@ -0,0 +1,114 @@
+"""
+Frame Table
+
+Maps the function names of stack frames to small integer ids, so the
+backtraces of many crashes can share a single copy of each name and matching
+results can be remembered per distinct frame instead of per crash.
+
+The ids are only valid within the current process and must never be stored.
+
+To bound the memory used by long running processes, the table starts a new
+generation once it holds a given number of frames. Ids are never reused, and
+the frames of the previous generation can still be looked up, so ids handed
+out shortly before stay valid. Users keeping ids for longer check the
+generation and get new ids once theirs are older than that.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import sys
+import threading
+from array import array
+
+# Number of frames after which a new generation is started
+MAX_FRAMES = 200000
+
+
+class FrameTable:
+    def __init__(self, maxFrames=MAX_FRAMES):
+        self.maxFrames = maxFrames
+        self.generation = 0
+        self.nextId = 0
+        self.ids = {}
+        self.frames = {}
+        self.previousFrames = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def _getId(self, frame):
+        # Must be called with the lock held
+        frameId = self.ids.get(frame)
+        if frameId is None:
+            frameId = self.nextId
+            self.nextId += 1
+            frame = sys.intern(frame)
+            self.frames[frameId] = frame
+            self.ids[frame] = frameId
+        return frameId
+
+    def _checkSize(self, required):
+        # Must be called with the lock held
+        if self.frames and len(self.frames) + required > self.maxFrames:
+            self.previousFrames = self.frames
+            self.frames = {}
+            self.ids = {}
+            self.generation += 1
+
+    def getId(self, frame):
+        """
+        Get the id of a frame, adding it to the table if required.
+
+        @type frame: str
+        @param frame: Function name of the frame
+
+        @rtype: int
+        @return: Id of the frame
+        """
+        frameId = self.ids.get(frame)
+        if frameId is None:
+            with self.lock:
+                self._checkSize(1)
+                frameId = self._getId(frame)
+        return frameId
+
+    def getIds(self, frames):
+        """
+        Get the ids of all frames of a backtrace. All ids are from the same
+        generation.
+
+        @type frames: list
+        @param frames: Function names of the frames
+
+        @rtype: array
+        @return: Array of the frame ids
+        """
+        frames = list(frames)
+        with self.lock:
+            self._checkSize(len(frames))
+            return array("I", map(self._getId, frames))
+
+    def getFrame(self, frameId):
+        """
+        @type frameId: int
+        @param frameId: Id of a frame of the current or previous generation
+
+        @rtype: str
+        @return: Function name of the frame
+        """
+        frame = self.frames.get(frameId)
+        if frame is None:
+            with self.lock:
+                frame = self.frames.get(frameId)
+                if frame is None:
+                    frame = self.previousFrames[frameId]
+        return frame
+
+
+# The table shared by all crashes of this process
+FRAME_TABLE = FrameTable()
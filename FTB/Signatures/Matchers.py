@@ -19,6 +19,10 @@ import re
 from abc import ABCMeta, abstractmethod
 
 from FTB.Signatures import JSONHelper
+from FTB.Signatures.FrameTable import FRAME_TABLE
+
+# Number of frames a string match remembers the result for
+MAX_FRAME_MATCHES = 10000
 
 
 class Match(metaclass=ABCMeta):
@@ -33,6 +37,10 @@ class StringMatch(Match):
         self.compiledValue = None
         self.patternContainsSlash = False
 
+        # Results of matchesFrame by frame id, see _frameMatchesGeneration
+        self._frameMatches = {}
+        self._frameMatchesGeneration = FRAME_TABLE.generation
+
         if isinstance(obj, bytes):
             obj = obj.decode("utf-8")
 
@@ -82,6 +90,46 @@ class StringMatch(Match):
         else:
             return self.value in value
 
+    def matchesFrame(self, frameId):
+        """
+        Check if the function name of a stack frame matches. The result is
+        remembered, so each distinct frame is only checked once.
+
+        @type frameId: int
+        @param frameId: Id of the frame in L{FRAME_TABLE}
+
+        @rtype: bool
+        @return: True if the frame matches, False otherwise
+        """
+        frameMatches = self._frameMatches
+        result = frameMatches.get(frameId)
+        if result is None:
+            result = self.matches(FRAME_TABLE.getFrame(frameId))
+            if (
+                len(frameMatches) >= MAX_FRAME_MATCHES
+                or self._frameMatchesGeneration != FRAME_TABLE.generation
+            ):
+                # Keep the memory bounded, and drop the results of frames that
+                # are no longer in the frame table. The dictionary is replaced
+                # rather than cleared, as other threads may be using it.
+                frameMatches = {}
+                self._frameMatches = frameMatches
+                self._frameMatchesGeneration = FRAME_TABLE.generation
+            frameMatches[frameId] = result
+        return result
+
+    def __getstate__(self):
+        # Frame ids are only valid within this process
+        state = self.__dict__.copy()
+        state["_frameMatches"] = {}
+        state["_frameMatchesGeneration"] = 0
+        return state
+
+    def __setstate__(self, state):
+        state["_frameMatches"] = {}
+        state["_frameMatchesGeneration"] = FRAME_TABLE.generation
+        self.__dict__.update(state)
+
     def __str__(self):
         return self.value
 
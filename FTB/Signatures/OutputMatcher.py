@@ -0,0 +1,309 @@
+"""
+Output Matcher
+
+Matches the output symptoms of many signatures against a crash at once.
+
+Checking a crash against many signatures with L{OutputSymptom.matches} scans
+the crash output once per output symptom. This matcher collects the output
+symptoms of all signatures instead and scans each output stream of a crash
+only once: literal values are searched with an Aho-Corasick automaton, regular
+expressions are prefiltered with a single alternation of all of them and only
+checked individually on lines that the alternation matches.
+
+The result is the set of L{OutputSymptom.key} values that match, which can be
+passed to L{CrashSignature.matches} for all signatures that were added.
+
+Scanning for many symptoms only pays off if many of them need to be checked.
+L{OutputMatches} checks the symptoms of a few candidate signatures one by one
+when they are looked up and only scans the output once that gets too many.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import re
+from collections import deque
+
+from FTB.Signatures.Symptom import OutputSymptom
+
+OUTPUT_SOURCES = ("stdout", "stderr", "crashdata")
+
+# Regular expressions that refer to groups by number or use global flags
+# change their meaning or fail to compile inside of a larger expression.
+_NOT_COMBINABLE_RE = re.compile(r"\\[1-9]|\(\?P=|\(\?\(|^\(\?[aiLmsux]+\)")
+
+
+class AhoCorasick:
+    """Automaton finding all occurrences of a set of literal strings in one pass"""
+
+    def __init__(self, needles):
+        """
+        @type needles: list
+        @param needles: Strings to search for
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]
+
+        for idx, needle in enumerate(needles):
+            state = 0
+            for char in needle:
+                nextState = self.goto[state].get(char)
+                if nextState is None:
+                    nextState = len(self.goto)
+                    self.goto[state][char] = nextState
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                state = nextState
+            self.out[state] += (idx,)
+
+        # Compute the failure links breadth first, so the failure state of each
+        # state is complete before it is used.
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nextState in self.goto[state].items():
+                queue.append(nextState)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nextState] = self.goto[fallback].get(char, 0)
+                self.out[nextState] += self.out[self.fail[nextState]]
+
+    def search(self, text, found):
+        """
+        Add the indices of all needles occurring in the given text to found.
+
+        @type text: str
+        @param text: Text to search
+
+        @type found: set
+        @param found: Set to add the indices of the needles found to
+        """
+        goto = self.goto
+        fail = self.fail
+        out = self.out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+
+
+class OutputMatcher:
+    def __init__(self, signatures=()):
+        # Distinct matchers by (isPCRE, value), each can be used by many symptoms
+        self.matchers = {}
+        # Output symptom keys by (isPCRE, value)
+        self.keys = {}
+        # Output sources needed by any symptom, None meaning all of them
+        self.sources = set()
+
+        # Compiled on first use
+        self.literals = None
+        self.automaton = None
+        self.combined = None
+        self.combinedRegexes = None
+        self.separateRegexes = None
+
+        for signature in signatures:
+            self.addSignature(signature)
+
+    def __len__(self):
+        return sum(len(keys) for keys in self.keys.values())
+
+    def add(self, symptom):
+        """
+        Add an output symptom to the matcher.
+
+        @type symptom: OutputSymptom
+        @param symptom: The symptom to add
+        """
+        match = (symptom.output.isPCRE, symptom.output.value)
+        self.matchers.setdefault(match, symptom.output)
+        self.keys.setdefault(match, set()).add(symptom.key)
+        self.sources.add(symptom.src)
+        self.literals = None
+
+    def addSignature(self, signature):
+        """
+        Add all output symptoms of a signature to the matcher.
+
+        @type signature: CrashSignature
+        @param signature: The signature to add the output symptoms of
+        """
+        for symptom in signature.symptoms:
+            if isinstance(symptom, OutputSymptom):
+                self.add(symptom)
+
+    def _compile(self):
+        self.literals = []
+        self.combinedRegexes = []
+        self.separateRegexes = []
+        for match, matcher in self.matchers.items():
+            if not match[0]:
+                self.literals.append(match)
+            elif _NOT_COMBINABLE_RE.search(matcher.value):
+                self.separateRegexes.append((match, matcher))
+            else:
+                self.combinedRegexes.append((match, matcher))
+
+        self.automaton = AhoCorasick([value for (_, value) in self.literals])
+
+        self.combined = None
+        if self.combinedRegexes:
+            try:
+                self.combined = re.compile(
+                    "|".join(
+                        f"(?:{matcher.value})" for (_, matcher) in self.combinedRegexes
+                    )
+                )
+            except re.error:
+                # e.g. the same group name used in several expressions
+                self.separateRegexes.extend(self.combinedRegexes)
+                self.combinedRegexes = []
+
+    @staticmethod
+    def _checkRegexes(regexes, line, found, windowsSlashWorkaround):
+        remaining = []
+        for match, matcher in regexes:
+            if matcher.matches(line, windowsSlashWorkaround=windowsSlashWorkaround):
+                found.add(match)
+            else:
+                remaining.append((match, matcher))
+        return remaining
+
+    def _matchStream(self, lines, windowsSlashWorkaround):
+        found = set()
+        if not lines:
+            return found
+
+        # An empty literal matches any line
+        literalIndices = set(self.automaton.out[0])
+        combinedRegexes = self.combinedRegexes
+        separateRegexes = self.separateRegexes
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode("utf-8", errors="replace")
+
+            if self.literals:
+                self.automaton.search(line, literalIndices)
+
+            if separateRegexes:
+                separateRegexes = self._checkRegexes(
+                    separateRegexes, line, found, windowsSlashWorkaround
+                )
+
+            if combinedRegexes:
+                # A line that none of the expressions matches can be skipped
+                # after a single search with the combined expression.
+                hit = self.combined.search(line) is not None
+                if not hit and windowsSlashWorkaround and "\\" in line:
+                    hit = self.combined.search(line.replace("\\", "/")) is not None
+                if hit:
+                    combinedRegexes = self._checkRegexes(
+                        combinedRegexes, line, found, windowsSlashWorkaround
+                    )
+
+        found.update(self.literals[idx] for idx in literalIndices)
+        return found
+
+    def match(self, crashInfo):
+        """
+        Find all output symptoms matching the given crash.
+
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash to check
+
+        @rtype: set
+        @return: Keys of all matching output symptoms, as in L{OutputSymptom.key}
+        """
+        if self.literals is None:
+            self._compile()
+
+        windowsSlashWorkaround = crashInfo.configuration.os == "windows"
+        outputs = {
+            "stdout": crashInfo.rawStdout,
+            "stderr": crashInfo.rawStderr,
+            "crashdata": crashInfo.rawCrashData,
+        }
+
+        result = set()
+        for src in OUTPUT_SOURCES:
+            if None not in self.sources and src not in self.sources:
+                continue
+            for match in self._matchStream(outputs[src], windowsSlashWorkaround):
+                for key in self.keys[match]:
+                    if key[0] is None or key[0] == src:
+                        result.add(key)
+        return result
+
+
+class OutputMatches:
+    """Output symptom keys matching a crash, computed on lookup"""
+
+    # Number of distinct output symptoms to check one by one, before scanning
+    # the output for all of them at once is expected to be cheaper
+    SCAN_THRESHOLD = 32
+
+    def __init__(self, crashInfo, symptoms, matcher=None):
+        """
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash to check
+
+        @type symptoms: dict
+        @param symptoms: One output symptom for each key that can be looked up
+
+        @type matcher: OutputMatcher
+        @param matcher: Matcher for all of the symptoms, built on first use if
+                        not given
+        """
+        self.crashInfo = crashInfo
+        self.symptoms = symptoms
+        self.matcher = matcher
+        self.checked = {}
+        self.keys = None
+
+    @classmethod
+    def forSignatures(cls, crashInfo, signatures):
+        """
+        Look up the output symptoms of the given signatures for a crash.
+
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash to check
+
+        @type signatures: iterable
+        @param signatures: The signatures that will be matched against the crash
+
+        @rtype: OutputMatches
+        @return: Object to pass to L{CrashSignature.matches}
+        """
+        symptoms = {}
+        for signature in signatures:
+            for symptom in signature.symptoms:
+                if isinstance(symptom, OutputSymptom):
+                    symptoms.setdefault(symptom.key, symptom)
+        return cls(crashInfo, symptoms)
+
+    def __contains__(self, key):
+        if self.keys is not None:
+            return key in self.keys
+
+        result = self.checked.get(key)
+        if result is None:
+            if len(self.checked) >= OutputMatches.SCAN_THRESHOLD:
+                if self.matcher is None:
+                    self.matcher = OutputMatcher()
+                    for symptom in self.symptoms.values():
+                        self.matcher.add(symptom)
+                self.keys = self.matcher.match(self.crashInfo)
+                return key in self.keys
+            result = self.symptoms[key].matches(self.crashInfo)
+            self.checked[key] = result
+        return result
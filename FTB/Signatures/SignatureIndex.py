@@ -0,0 +1,231 @@
+"""
+Signature Index
+
+Provides a lookup structure over a collection of crash signatures that
+returns only those signatures that can possibly match a given crash.
+
+Each signature is filed under at most one discriminating symptom that is
+cheap to check (a literal top stack frame, a literal output substring or
+a crash address range). Signatures without such a symptom are always
+returned as candidates. The candidates still need to be checked using
+L{CrashSignature.matches}, the index only guarantees that no signature
+is left out that could match.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+from FTB.Signatures.Symptom import (
+    CrashAddressSymptom,
+    OutputSymptom,
+    StackFramesSymptom,
+    StackFrameSymptom,
+)
+
+
+class SignatureIndex:
+    def __init__(self):
+        # All signatures in this index, by key
+        self.signatures = {}
+
+        # Maps each key to the discriminator it is filed under
+        self.discriminators = {}
+
+        # Discriminator -> set of keys
+        self.topFrames = {}
+        self.outputs = {}
+        self.addresses = {}
+
+        # Keys of signatures without any usable discriminator
+        self.unindexed = set()
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __contains__(self, key):
+        return key in self.signatures
+
+    def get(self, key):
+        return self.signatures.get(key)
+
+    def add(self, key, signature):
+        """
+        Add a signature to the index, replacing any signature that was
+        previously stored under the same key.
+
+        @type key: hashable
+        @param key: Key to identify the signature with (e.g. a bucket id)
+
+        @type signature: CrashSignature
+        @param signature: The signature to index
+        """
+        self.remove(key)
+
+        self.signatures[key] = signature
+
+        discriminator = SignatureIndex.getDiscriminator(signature)
+        self.discriminators[key] = discriminator
+
+        if discriminator is None:
+            self.unindexed.add(key)
+            return
+
+        kind, value, matcher = discriminator
+        if kind == "frame":
+            self.topFrames.setdefault(value, set()).add(key)
+        elif kind == "output":
+            self.outputs.setdefault(value, set()).add(key)
+        else:
+            self.addresses.setdefault(value, (matcher, set()))[1].add(key)
+
+    def remove(self, key):
+        """
+        Remove the signature with the given key from the index. Unknown keys
+        are ignored.
+
+        @type key: hashable
+        @param key: Key of the signature to remove
+        """
+        if key not in self.signatures:
+            return
+
+        del self.signatures[key]
+        discriminator = self.discriminators.pop(key)
+
+        if discriminator is None:
+            self.unindexed.discard(key)
+            return
+
+        kind, value, _ = discriminator
+        if kind == "frame":
+            keys = self.topFrames[value]
+        elif kind == "output":
+            keys = self.outputs[value]
+        else:
+            keys = self.addresses[value][1]
+
+        keys.discard(key)
+        if not keys:
+            if kind == "frame":
+                del self.topFrames[value]
+            elif kind == "output":
+                del self.outputs[value]
+            else:
+                del self.addresses[value]
+
+    def clear(self):
+        self.signatures.clear()
+        self.discriminators.clear()
+        self.topFrames.clear()
+        self.outputs.clear()
+        self.addresses.clear()
+        self.unindexed.clear()
+
+    def candidates(self, crashInfo):
+        """
+        Return the keys of all signatures that could match the given crash.
+
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash to look up candidate signatures for
+
+        @rtype: set
+        @return: Keys of all signatures that need to be checked
+        """
+        result = set(self.unindexed)
+
+        if self.topFrames and crashInfo.backtrace:
+            topFrame = crashInfo.backtrace[0]
+            for literal, keys in self.topFrames.items():
+                if literal in topFrame:
+                    result.update(keys)
+
+        if self.outputs:
+            # Output symptoms match line by line, so a literal without line breaks
+            # is found in the joined output if and only if it is found in one line.
+            joinedOutputs = {}
+            for (src, literal), keys in self.outputs.items():
+                if src not in joinedOutputs:
+                    joinedOutputs[src] = "\n".join(
+                        SignatureIndex._getOutput(crashInfo, src)
+                    )
+                if literal in joinedOutputs[src]:
+                    result.update(keys)
+
+        for matcher, keys in self.addresses.values():
+            if matcher.matches(crashInfo.crashAddress):
+                result.update(keys)
+
+        return result
+
+    @staticmethod
+    def _getOutput(crashInfo, src):
+        if src == "stdout":
+            return crashInfo.rawStdout
+        if src == "stderr":
+            return crashInfo.rawStderr
+        if src == "crashdata":
+            return crashInfo.rawCrashData
+        return crashInfo.rawStdout + crashInfo.rawStderr + crashInfo.rawCrashData
+
+    @staticmethod
+    def getDiscriminator(signature):
+        """
+        Determine the symptom of a signature that is used to file it in the
+        index. Literal top frames are preferred over literal output, which is
+        preferred over the crash address.
+
+        @type signature: CrashSignature
+        @param signature: The signature to inspect
+
+        @rtype: tuple
+        @return: Tuple of (kind, value, matcher) or None if the signature has no
+                 symptom usable for indexing
+        """
+        frame = None
+        output = None
+        address = None
+
+        for symptom in signature.symptoms:
+            if isinstance(symptom, StackFramesSymptom):
+                if not symptom.functionNames:
+                    continue
+                match = symptom.functionNames[0]
+                if str(match) in {"?", "???"}:
+                    continue
+                if not match.isPCRE and match.value:
+                    frame = match.value
+            elif isinstance(symptom, StackFrameSymptom):
+                if (
+                    symptom.frameNumber.matchType is None
+                    and symptom.frameNumber.value == 0
+                    and not symptom.functionName.isPCRE
+                    and symptom.functionName.value
+                ):
+                    frame = symptom.functionName.value
+            elif isinstance(symptom, OutputSymptom):
+                # Literals are looked up in the joined output lines, which is
+                # only equivalent to matching line by line without line breaks
+                if (
+                    not symptom.output.isPCRE
+                    and symptom.output.value
+                    and "\n" not in symptom.output.value
+                ):
+                    output = (symptom.src, symptom.output.value)
+            elif isinstance(symptom, CrashAddressSymptom):
+                address = (symptom.address.matchType, symptom.address.value)
+                addressMatcher = symptom.address
+
+            if frame is not None:
+                # Can't get any better than this
+                return ("frame", frame, None)
+
+        if output is not None:
+            return ("output", output, None)
+
+        if address is not None:
+            return ("address", address, addressMatcher)
+
+        return None
@@ -0,0 +1,109 @@
+"""
+Signature Set
+
+An ordered collection of crash signatures that can be matched against a crash
+at once.
+
+Matching a crash against each signature in turn repeats the same work for every
+signature. A signature set groups the signatures by a literal function name at
+a fixed stack position (see L{SignatureFingerprint}) and checks it only once
+per crash for the whole group, so most signatures are rejected without looking
+at them at all. Output symptoms are only checked for signatures whose
+other symptoms match, each distinct one once per crash. If many of them need
+to be checked, the crash output is scanned once for the output symptoms of all
+signatures instead (see L{OutputMatcher}).
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+from FTB.Signatures.OutputMatcher import OutputMatcher, OutputMatches
+from FTB.Signatures.Symptom import OutputSymptom
+
+
+class SignatureSet:
+    def __init__(self, signatures=()):
+        """
+        @type signatures: iterable
+        @param signatures: Pairs of (key, CrashSignature) to add to the set
+        """
+        # (key, signature) in the order they were added
+        self.signatures = []
+
+        # Indices of the signatures by (position, function name) of a fixed
+        # frame required by all of them, with the matcher to check it
+        self.frameGroups = {}
+
+        # Indices of the signatures without any fixed frame
+        self.ungrouped = []
+        self.outputMatcher = OutputMatcher()
+
+        # One of the output symptoms for each distinct key
+        self.outputSymptoms = {}
+
+        for key, signature in signatures:
+            self.add(key, signature)
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def add(self, key, signature):
+        """
+        Add a signature to the set.
+
+        @type key: hashable
+        @param key: Key to identify the signature with (e.g. a bucket id)
+
+        @type signature: CrashSignature
+        @param signature: The signature to add
+        """
+        fixedFrames = signature.fingerprint.fixedFrames
+        if fixedFrames:
+            (frameIdx, functionName) = fixedFrames[0]
+            group = self.frameGroups.setdefault(
+                (frameIdx, functionName.value), (functionName, [])
+            )
+            group[1].append(len(self.signatures))
+        else:
+            self.ungrouped.append(len(self.signatures))
+
+        self.signatures.append((key, signature))
+        self.outputMatcher.addSignature(signature)
+        for symptom in signature.symptoms:
+            if isinstance(symptom, OutputSymptom):
+                self.outputSymptoms.setdefault(symptom.key, symptom)
+
+    def matchAll(self, crashInfo):
+        """
+        Find all signatures in the set that match the given crash.
+
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash to match
+
+        @rtype: list
+        @return: Keys of the matching signatures, in the order they were added
+        """
+        # Output symptoms are last in the match plan of each signature, so they
+        # are only looked up if everything else matches
+        outputMatches = OutputMatches(
+            crashInfo, self.outputSymptoms, self.outputMatcher
+        )
+
+        frameIds = crashInfo.backtraceIds
+        candidates = list(self.ungrouped)
+        for (frameIdx, _), (functionName, indices) in self.frameGroups.items():
+            if frameIdx < len(frameIds) and functionName.matchesFrame(
+                frameIds[frameIdx]
+            ):
+                candidates.extend(indices)
+        candidates.sort()
+
+        result = []
+        for idx in candidates:
+            key, signature = self.signatures[idx]
+            if signature.matches(crashInfo, outputMatches):
+                result.append(key)
+        return result
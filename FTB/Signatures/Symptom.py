@@ -18,6 +18,7 @@ import json
 from abc import ABCMeta, abstractmethod
 
 from FTB.Signatures import JSONHelper
+from FTB.Signatures.FrameTable import FRAME_TABLE
 from FTB.Signatures.Matchers import NumberMatch, StringMatch
 
 
@@ -27,6 +28,10 @@ class Symptom(metaclass=ABCMeta):
     It also supports generating a CrashSignature based on the stored information.
     """
 
+    # Relative cost of matching the symptom against a crash. Signatures check
+    # their symptoms in the order of increasing cost, see CrashSignature.matchPlan
+    matchCost = 0
+
     def __init__(self, jsonObj):
         # Store the original source so we can return it if someone wants to stringify us
         self.jsonsrc = json.dumps(jsonObj, indent=2)
@@ -81,8 +86,22 @@ class Symptom(metaclass=ABCMeta):
         """
         return
 
+    def matchesMany(self, crashInfos):
+        """
+        Check if the symptom matches each of the given crashes
+
+        @type crashInfos: list
+        @param crashInfos: The crash information to check against
+
+        @rtype: list(bool)
+        @return: For each crash, True if the symptom matches, False otherwise
+        """
+        return [self.matches(crashInfo) for crashInfo in crashInfos]
+
 
 class OutputSymptom(Symptom):
+    matchCost = 4
+
     def __init__(self, obj):
         """
         Private constructor, called by L{Symptom.fromJSONObject}. Do not use directly.
@@ -102,6 +121,9 @@ class OutputSymptom(Symptom):
             ):
                 raise RuntimeError(f"Invalid source specified: {self.src}")
 
+        # Identifies symptoms that always match the same crashes
+        self.key = (self.src, self.output.isPCRE, self.output.value)
+
     def matches(self, crashInfo):
         """
         Check if the symptom matches the given crash information
@@ -112,28 +134,56 @@ class OutputSymptom(Symptom):
         @rtype: bool
         @return: True if the symptom matches, False otherwise
         """
-        checkedOutput = []
-
-        if self.src is None:
-            checkedOutput.extend(crashInfo.rawStdout)
-            checkedOutput.extend(crashInfo.rawStderr)
-            checkedOutput.extend(crashInfo.rawCrashData)
-        elif self.src == "stdout":
-            checkedOutput = crashInfo.rawStdout
-        elif self.src == "stderr":
-            checkedOutput = crashInfo.rawStderr
-        else:
-            checkedOutput = crashInfo.rawCrashData
-
         windowsSlashWorkaround = crashInfo.configuration.os == "windows"
-        for line in reversed(checkedOutput):
+        for line in reversed(self._getOutput(crashInfo)):
             if self.output.matches(line, windowsSlashWorkaround=windowsSlashWorkaround):
                 return True
 
         return False
 
+    def matchesMany(self, crashInfos):
+        """
+        Check if the symptom matches each of the given crashes. Crashes of the
+        same kind mostly share their output lines, so each distinct line is
+        only checked once.
+
+        @type crashInfos: list
+        @param crashInfos: The crash information to check against
+
+        @rtype: list(bool)
+        @return: For each crash, True if the symptom matches, False otherwise
+        """
+        lineMatches = {}
+        results = []
+        for crashInfo in crashInfos:
+            windowsSlashWorkaround = crashInfo.configuration.os == "windows"
+            result = False
+            for line in reversed(self._getOutput(crashInfo)):
+                lineMatch = lineMatches.get((line, windowsSlashWorkaround))
+                if lineMatch is None:
+                    lineMatch = self.output.matches(
+                        line, windowsSlashWorkaround=windowsSlashWorkaround
+                    )
+                    lineMatches[(line, windowsSlashWorkaround)] = lineMatch
+                if lineMatch:
+                    result = True
+                    break
+            results.append(result)
+        return results
+
+    def _getOutput(self, crashInfo):
+        if self.src is None:
+            return [*crashInfo.rawStdout, *crashInfo.rawStderr, *crashInfo.rawCrashData]
+        elif self.src == "stdout":
+            return crashInfo.rawStdout
+        elif self.src == "stderr":
+            return crashInfo.rawStderr
+        return crashInfo.rawCrashData
+
 
 class StackFrameSymptom(Symptom):
+    matchCost = 2
+
     def __init__(self, obj):
         """
         Private constructor, called by L{Symptom.fromJSONObject}. Do not use directly.
@@ -161,16 +211,19 @@ class StackFrameSymptom(Symptom):
         @return: True if the symptom matches, False otherwise
         """
 
-        for idx in range(len(crashInfo.backtrace)):
+        backtraceIds = crashInfo.backtraceIds
+        for idx in range(len(backtraceIds)):
             # Not the most efficient way for very long stacks with a small match area
             if self.frameNumber.matches(idx):
-                if self.functionName.matches(crashInfo.backtrace[idx]):
+                if self.functionName.matchesFrame(backtraceIds[idx]):
                     return True
 
         return False
 
 
 class StackSizeSymptom(Symptom):
+    matchCost = 0
+
     def __init__(self, obj):
         """
         Private constructor, called by L{Symptom.fromJSONObject}. Do not use directly.
@@ -194,6 +247,8 @@ class StackSizeSymptom(Symptom):
 
 
 class CrashAddressSymptom(Symptom):
+    matchCost = 0
+
     def __init__(self, obj):
         """
         Private constructor, called by L{Symptom.fromJSONObject}. Do not use directly.
@@ -219,6 +274,8 @@ class CrashAddressSymptom(Symptom):
 
 
 class InstructionSymptom(Symptom):
+    matchCost = 1
+
     def __init__(self, obj):
         """
         Private constructor, called by L{Symptom.fromJSONObject}. Do not use directly.
@@ -263,6 +320,8 @@ class InstructionSymptom(Symptom):
 
 
 class TestcaseSymptom(Symptom):
+    matchCost = 5
+
     def __init__(self, obj):
         """
         Private constructor, called by L{Symptom.fromJSONObject}. Do not use directly.
@@ -297,6 +356,8 @@ class TestcaseSymptom(Symptom):
 
 
 class StackFramesSymptom(Symptom):
+    matchCost = 3
+
     def __init__(self, obj):
         """
         Private constructor, called by L{Symptom.fromJSONObject}. Do not use directly.
@@ -320,15 +381,24 @@ class StackFramesSymptom(Symptom):
         @return: True if the symptom matches, False otherwise
         """
 
-        return StackFramesSymptom._match(crashInfo.backtrace, self.functionNames)
+        return StackFramesSymptom._match(crashInfo.backtraceIds, self.functionNames)
 
     def diff(self, crashInfo):
         if self.matches(crashInfo):
             return (0, None)
 
-        for depth in range(1, 4):
+        stack = crashInfo.backtraceIds
+
+        # The search below only finds modifications of up to 3 wildcards. The
+        # minimum number of modifications tells us upfront if there is any such
+        # solution, and that there is none at the depths below it. The cache is
+        # shared between the depths, as they visit the same guesses again.
+        minDepth = StackFramesSymptom._minDiff(stack, self.functionNames, 3)
+        cache = {}
+
+        for depth in range(minDepth, 4):
             (bestDepth, bestGuess) = StackFramesSymptom._diff(
-                crashInfo.backtrace, self.functionNames, 0, 1, depth
+                stack, self.functionNames, 0, 1, depth, cache
             )
             if bestDepth is not None:
                 guessedFunctionNames = [repr(x) for x in bestGuess]
@@ -354,7 +424,96 @@ class StackFramesSymptom(Symptom):
         return (None, None)
 
     @staticmethod
-    def _diff(stack, signatureGuess, startIdx, depth, maxDepth):
+    def _minDiff(stack, functionNames, limit):
+        """
+        Compute the minimum number of modifications that _diff needs to make
+        the function names match the stack, by aligning both with dynamic
+        programming. Each modification either inserts a '?' or replaces a
+        function name with a wildcard. The result is a lower bound for the
+        depth of any match found by _diff.
+
+        @type limit: int
+        @param limit: Maximum number of modifications of interest
+
+        @rtype: int
+        @return: Minimum number of modifications, or limit + 1 if more than
+                 limit modifications are required
+        """
+        namesLen = len(functionNames)
+        if all(fn.value != "???" for fn in functionNames):
+            # Without a '???', the function names (and the '?' inserted among them)
+            # can only match the top of the stack.
+            stack = stack[: namesLen + limit]
+        stackLen = len(stack)
+        exceeded = limit + 1
+
+        # cost[j] holds the cost of matching functionNames[i:] to stack[j:],
+        # computed from the last function name backwards. A '?' matches zero or
+        # one frames, a '???' any number of frames.
+        cost = [0] * (stackLen + 1)
+        for i in range(namesLen - 1, -1, -1):
+            fn = functionNames[i]
+            value = fn.value
+            nextCost = cost
+            cost = [exceeded] * (stackLen + 1)
+
+            for j in range(stackLen, -1, -1):
+                if value == "???":
+                    best = nextCost[j]
+                    if j < stackLen and cost[j + 1] < best:
+                        best = cost[j + 1]
+                elif value == "?":
+                    best = nextCost[j]
+                    if j < stackLen and nextCost[j + 1] < best:
+                        best = nextCost[j + 1]
+                else:
+                    # Replace the function name with a wildcard
+                    best = nextCost[j] + 1
+                    if j < stackLen:
+                        if fn.matchesFrame(stack[j]):
+                            if nextCost[j + 1] < best:
+                                best = nextCost[j + 1]
+                        elif nextCost[j + 1] + 1 < best:
+                            best = nextCost[j + 1] + 1
+
+                # Insert a '?' in front of the function name
+                if j < stackLen and cost[j + 1] + 1 < best:
+                    best = cost[j + 1] + 1
+
+                if best < exceeded:
+                    cost[j] = best
+
+            if min(cost) == exceeded:
+                # Matching the remaining function names alone is too expensive
+                return exceeded
+
+        return cost[0]
+
+    @staticmethod
+    def _diff(stack, signatureGuess, startIdx, depth, maxDepth, cache=None):
+        # The cache holds the results of _match and _minDiff by guess, as the
+        # same guesses are reached on different paths through the search.
+        if cache is None:
+            cache = {}
+
+        def _guessKey(guess):
+            return tuple((x.isPCRE, x.value) for x in guess)
+
+        def _cachedMatch(guess):
+            key = ("match", _guessKey(guess))
+            if key not in cache:
+                cache[key] = StackFramesSymptom._match(stack, guess)
+            return cache[key]
+
+        def _canMatch(guess, modifications):
+            if modifications < 2:
+                # Checking a single modification is cheaper than the bound
+                return True
+            key = ("minDiff", _guessKey(guess), modifications)
+            if key not in cache:
+                cache[key] = StackFramesSymptom._minDiff(stack, guess, modifications)
+            return cache[key] <= modifications
+
         singleWildcardMatch = StringMatch("?")
 
         newSignatureGuess = []
@@ -363,12 +522,12 @@ class StackFramesSymptom(Symptom):
         bestDepth = None
         bestGuess = None
 
-        hasVariableStackLengthQuantifier = "???" in [str(x) for x in newSignatureGuess]
+        hasVariableStackLengthQuantifier = "???" in [x.value for x in newSignatureGuess]
 
         for idx in range(startIdx, len(newSignatureGuess)):
             if idx == startIdx or (
-                str(newSignatureGuess[idx - 1]) != "?"
-                and str(newSignatureGuess[idx - 1]) != "???"
+                newSignatureGuess[idx - 1].value != "?"
+                and newSignatureGuess[idx - 1].value != "???"
             ):
                 # Inserting '?' after another '?' or '???' does not make a difference
                 # because it is equivalent to inserting it before that last wildcard
@@ -377,14 +536,15 @@ class StackFramesSymptom(Symptom):
                 newSignatureGuess.insert(idx, singleWildcardMatch)
 
                 # Check if we have a match with our modification
-                if StackFramesSymptom._match(stack, newSignatureGuess):
+                if _cachedMatch(newSignatureGuess):
                     return (depth, newSignatureGuess)
 
                 # If we don't have a match but we're not at our current depth limit,
-                # add one more level of depth for our search.
-                if depth < maxDepth:
+                # add one more level of depth for our search. Skip it if there
+                # are not enough modifications left to get a match at all.
+                if depth < maxDepth and _canMatch(newSignatureGuess, maxDepth - depth):
                     (newBestDepth, newBestGuess) = StackFramesSymptom._diff(
-                        stack, newSignatureGuess, idx, depth + 1, maxDepth
+                        stack, newSignatureGuess, idx, depth + 1, maxDepth, cache
                     )
 
                     if newBestDepth is not None and (
@@ -399,8 +559,8 @@ class StackFramesSymptom(Symptom):
             # unless the match at idx is a wildcard itself
 
             if (
-                str(newSignatureGuess[idx]) == "?"
-                or str(newSignatureGuess[idx]) == "???"
+                newSignatureGuess[idx].value == "?"
+                or newSignatureGuess[idx].value == "???"
             ):
                 continue
 
@@ -409,7 +569,7 @@ class StackFramesSymptom(Symptom):
                 # We can perform some optimizations here if we have a signature that
                 # does not contain any quantifiers that can match multiple stack frames.
 
-                if newSignatureGuess[idx].matches(stack[idx]):
+                if newSignatureGuess[idx].matchesFrame(stack[idx]):
                     # Our frame matches, so it doesn't make sense to try and mess with
                     # it
                     continue
@@ -418,24 +578,25 @@ class StackFramesSymptom(Symptom):
                     # If our match is not PCRE, try some heuristics to generalize the
                     # match
 
-                    if stack[idx] in str(newSignatureGuess[idx]):
+                    frame = FRAME_TABLE.getFrame(stack[idx])
+                    if frame in newSignatureGuess[idx].value:
                         # The stack frame is a substring of the what we try to match,
                         # use the stack frame as new matcher to ensure a match without
                         # using a wildcard.
-                        newMatch = StringMatch(stack[idx])
+                        newMatch = StringMatch(frame)
 
             origMatch = newSignatureGuess[idx]
             newSignatureGuess[idx] = newMatch
 
             # Check if we have a match with our modification
-            if StackFramesSymptom._match(stack, newSignatureGuess):
+            if _cachedMatch(newSignatureGuess):
                 return (depth, newSignatureGuess)
 
             # If we don't have a match but we're not at our current depth limit,
             # add one more level of depth for our search.
-            if depth < maxDepth:
+            if depth < maxDepth and _canMatch(newSignatureGuess, maxDepth - depth):
                 (newBestDepth, newBestGuess) = StackFramesSymptom._diff(
-                    stack, newSignatureGuess, idx, depth + 1, maxDepth
+                    stack, newSignatureGuess, idx, depth + 1, maxDepth, cache
                 )
 
                 if newBestDepth is not None and (
@@ -449,46 +610,61 @@ class StackFramesSymptom(Symptom):
         return (bestDepth, bestGuess)
 
     @staticmethod
-    def _match(partialStack, partialFunctionNames):
+    def _match(stack, functionNames, stackIdx=0, nameIdx=0, failed=None):
+        """
+        Check if the function names match the stack, starting at the given
+        positions. The stack holds frame ids (see L{CrashInfo.backtraceIds}).
+        Positions that were already found not to match are collected in failed,
+        so wildcards don't check the same remainder again and again.
+        """
+        stackLen = len(stack)
+        namesLen = len(functionNames)
+
         while True:
             # Process as many non-wildcard chars as we can find iteratively for
             # performance reasons
             while (
-                partialFunctionNames
-                and partialStack
-                and str(partialFunctionNames[0]) not in {"?", "???"}
+                nameIdx < namesLen
+                and stackIdx < stackLen
+                and functionNames[nameIdx].value not in {"?", "???"}
             ):
-                if not partialFunctionNames[0].matches(partialStack[0]):
+                if not functionNames[nameIdx].matchesFrame(stack[stackIdx]):
                     return False
 
-                # Change the view on partialStack and partialFunctionNames without
-                # actually modifying the underlying arrays. They have to be preserved
-                # for the caller.
-                partialStack = partialStack[1:]
-                partialFunctionNames = partialFunctionNames[1:]
+                # Only advance the positions, the stack and the function names
+                # have to be preserved for the caller.
+                stackIdx += 1
+                nameIdx += 1
 
-            if not partialFunctionNames:
+            if nameIdx == namesLen:
                 # End of function names to match, accept
                 return True
 
-            if str(partialFunctionNames[0]) in {"?", "???"}:
-                if StackFramesSymptom._match(partialStack, partialFunctionNames[1:]):
+            if functionNames[nameIdx].value in {"?", "???"}:
+                if failed is None:
+                    failed = set()
+
+                if (stackIdx, nameIdx + 1) not in failed and StackFramesSymptom._match(
+                    stack, functionNames, stackIdx, nameIdx + 1, failed
+                ):
                     # We recursively consumed 0 to N stack frames and can now
                     # get a match for the remaining stack without the current
                     # wildcard element, so we're done and accept the stack.
                     return True
                 else:
-                    if not partialStack:
+                    failed.add((stackIdx, nameIdx + 1))
+
+                    if stackIdx == stackLen:
                         # Out of stack to match, reject
                         return False
 
                     # Consume one stack frame and continue
-                    partialStack = partialStack[1:]
+                    stackIdx += 1
 
-                    if str(partialFunctionNames[0]) == "?":
+                    if functionNames[nameIdx].value == "?":
                         # Consume the question mark too
-                        partialFunctionNames = partialFunctionNames[1:]
+                        nameIdx += 1
 
-            elif not partialStack:
+            elif stackIdx == stackLen:
                 # Out of stack to match, reject
                 return False
@@ -17,6 +17,7 @@ from pathlib import Path
 
 import pytest
 
+from FTB import AssertionHelper
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Signatures import RegisterHelper
 from FTB.Signatures.CrashInfo import (
@@ -3043,3 +3044,163 @@ def test_unicode_escape():
         return """ü\ufffdシ\u008dAن"""
 
     assert testfunc() == r"""ü\u{fffd}シ\u{8d}Aن"""
+
+
+@pytest.mark.parametrize(
+    "fixture",
+    [
+        "trace_asan_uaf.txt",
+        "trace_asan_long.txt",
+        "trace_gdb_sample_1.txt",
+        "trace_lsan_leak_detected.txt",
+        "trace_minidump_swrast.txt",
+        "trace_rust_sample_1.txt",
+        "trace_tsan_crash.txt",
+        "trace_ubsan_div_by_zero.txt",
+        "cdb-1a-crashlog.txt",
+        "valgrind-ir-01.txt",
+        "apple-crash-report-example.txt",
+        "trace_assertion_path_fwd_slash.txt",
+    ],
+)
+def test_CrashInfoStreamsMatchRawCrashData(fixture):
+    """test that parsing streams gives the same result as parsing the full data"""
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    data = (FIXTURE_PATH / fixture).read_text()
+
+    expected = CrashInfo.fromRawCrashData(["out"], [], config, data.splitlines())
+    with open(FIXTURE_PATH / fixture) as fp:
+        crashInfo = CrashInfo.fromRawCrashStreams(iter(["out\n"]), [], config, fp)
+
+    assert type(crashInfo) is type(expected)
+    assert crashInfo.rawStdout == ["out"]
+    assert crashInfo.rawCrashData == expected.rawCrashData
+    assert crashInfo.toCacheObject() == expected.toCacheObject()
+    assert crashInfo.createShortSignature() == expected.createShortSignature()
+
+
+def test_CrashInfoStreamsBoundedWindow():
+    """test that only a window of a huge output is kept"""
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    trace = (FIXTURE_PATH / "trace_asan_segv.txt").read_text().splitlines()
+    expected = CrashInfo.fromRawCrashData([], trace, config)
+
+    def stderr():
+        for idx in range(100000):
+            yield f"noise {idx}\n"
+        yield from trace
+        for idx in range(100000):
+            yield f"trailing noise {idx}\n"
+
+    crashInfo = CrashInfo.fromRawCrashStreams(
+        None, stderr(), config, tailLines=10, reportLines=len(trace)
+    )
+    assert isinstance(crashInfo, ASanCrashInfo)
+    assert len(crashInfo.rawStderr) <= 20 + len(trace)
+    assert crashInfo.rawStderr[0].startswith("noise ")
+    # the lines before the detection are kept as part of the leading context
+    start = crashInfo.rawStderr.index(trace[0])
+    assert crashInfo.rawStderr[start : start + len(trace)] == trace
+    assert crashInfo.rawStderr[-10:] == [
+        f"trailing noise {idx}" for idx in range(99990, 100000)
+    ]
+    assert crashInfo.backtrace == expected.backtrace
+    assert crashInfo.crashAddress == expected.crashAddress
+
+    # without a crash, only the tail is kept
+    crashInfo = CrashInfo.fromRawCrashStreams(
+        (f"{idx}" for idx in range(1000)), iter([]), config, tailLines=5
+    )
+    assert isinstance(crashInfo, NoCrashInfo)
+    assert crashInfo.rawStdout == ["995", "996", "997", "998", "999"]
+    assert crashInfo.rawStderr == []
+
+
+def test_CrashInfoMemoizesAbortMessages(mocker):
+    """test that abort messages are only extracted once per output"""
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    crashInfo = CrashInfo.fromRawCrashData(
+        [],
+        ["Assertion failure: foo", "==1==ERROR: AddressSanitizer: foo"],
+        config,
+    )
+    getAssertion = mocker.spy(AssertionHelper, "getAssertion")
+
+    assert crashInfo.createShortSignature() == "Assertion failure: foo"
+    crashInfo.createCrashSignature()
+    assert crashInfo.getAssertion(crashInfo.rawStderr) == "Assertion failure: foo"
+    assert getAssertion.call_count == 1
+
+    # changing the output invalidates the result
+    crashInfo.rawStderr.append("Assertion failure: bar")
+    assert crashInfo.createShortSignature() == "Assertion failure: bar"
+    assert getAssertion.call_count == 2
+
+
+@pytest.mark.parametrize(
+    "fixture", ["trace_gdb_sample_1.txt", "trace_asan_segv.txt", "minidump-example.txt"]
+)
+def test_CrashInfoCompactCacheObject(fixture):
+    """test restoring a crash from a compact cache object"""
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    trace = (FIXTURE_PATH / fixture).read_text().splitlines()
+    crashInfo = CrashInfo.fromRawCrashData([], [], config, trace)
+
+    cacheObject = json.loads(json.dumps(crashInfo.toCompactCacheObject()))
+    restored = CrashInfo.fromRawCrashData(
+        [], [], config, trace, cacheObject=cacheObject
+    )
+    # the registers are only decoded when used
+    assert restored._registersData is not None
+    assert restored.toCacheObject() == crashInfo.toCacheObject()
+    assert restored._registersData is None
+    assert restored.createShortSignature() == crashInfo.createShortSignature()
+
+    # re-encoding doesn't need to decode the registers
+    restored = CrashInfo.fromRawCrashData([], [], config, cacheObject=cacheObject)
+    assert restored.toCompactCacheObject() == cacheObject
+    assert restored._registersData is not None
+
+    with pytest.raises(RuntimeError, match="Unsupported compact cache object"):
+        CrashInfo.fromRawCrashData([], [], config, cacheObject=[0] + cacheObject[1:])
+
+
+def test_CrashInfoLazyParse(mocker):
+    """test that the crash data is only parsed once the parsed fields are used"""
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    trace = (FIXTURE_PATH / "trace_asan_segv.txt").read_text().splitlines()
+    parse = mocker.spy(ASanCrashInfo, "_parse")
+    crashInfo = CrashInfo.fromRawCrashData([], [], config, trace)
+    assert isinstance(crashInfo, ASanCrashInfo)
+
+    # signatures only checking the output don't need the parsed data
+    outputSig = CrashSignature(
+        json.dumps({"symptoms": [{"type": "output", "value": "/AddressSanitizer/"}]})
+    )
+    assert outputSig.matches(crashInfo)
+    assert parse.call_count == 0
+
+    assert crashInfo.backtrace
+    assert crashInfo.crashAddress is not None
+    assert crashInfo.registers
+    assert parse.call_count == 1
+
+    # assigned values aren't overwritten by a later parse
+    crashInfo = CrashInfo.fromRawCrashData([], [], config, trace)
+    crashInfo.backtrace = ["foo"]
+    assert crashInfo.backtrace == ["foo"]
+    assert crashInfo.crashAddress is not None
+    assert parse.call_count == 2
+
+
+def test_CrashInfoLazyParseError(mocker):
+    """test that parse errors are raised again on the next access"""
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    trace = (FIXTURE_PATH / "trace_asan_segv.txt").read_text().splitlines()
+    crashInfo = CrashInfo.fromRawCrashData([], [], config, trace)
+    mocker.patch.object(ASanCrashInfo, "_parse", side_effect=RuntimeError("failed"))
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match="failed"):
+            crashInfo.backtrace
+    assert crashInfo._backtrace == []
@@ -0,0 +1,108 @@
+"""
+Benchmarks for parsing crashes and creating signatures
+
+Run with "pytest FTB/Signatures/tests/test_CrashInfoBenchmark.py
+--benchmark-only", the crashes or lines parsed per second are reported in the
+extra info column ("--benchmark-columns" or "--benchmark-json").
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+from collections import defaultdict
+from pathlib import Path
+
+import pytest
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
+
+pytest.importorskip("pytest_benchmark")
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+
+LOG_LINES = 100000
+
+CRASH_TYPES = [
+    "ASanCrashInfo",
+    "CDBCrashInfo",
+    "GDBCrashInfo",
+    "MinidumpCrashInfo",
+    "RustCrashInfo",
+    "TSanCrashInfo",
+    "UBSanCrashInfo",
+    "ValgrindCrashInfo",
+]
+
+
+@pytest.fixture(scope="module")
+def config():
+    return ProgramConfiguration("test", "x86-64", "linux")
+
+
+@pytest.fixture(scope="module")
+def traces(config):
+    """Crash data of the test fixtures by the type of crash detected"""
+    result = defaultdict(list)
+    for path in sorted(FIXTURE_PATH.glob("*.txt")):
+        lines = path.read_text(errors="replace").splitlines()
+        crashInfo = CrashInfo.fromRawCrashData([], [], config, lines)
+        result[type(crashInfo).__name__].append(lines)
+    return result
+
+
+@pytest.mark.parametrize("crashType", CRASH_TYPES)
+def test_fromRawCrashDataThroughput(
+    benchmark, benchmark_rate, config, traces, crashType
+):
+    crashData = traces[crashType]
+    assert crashData, f"no fixtures for {crashType}"
+
+    def _run():
+        return [
+            CrashInfo.fromRawCrashData([], [], config, lines) for lines in crashData
+        ]
+
+    crashInfos = benchmark.pedantic(_run, rounds=5, iterations=1)
+    assert {type(crashInfo).__name__ for crashInfo in crashInfos} == {crashType}
+    benchmark_rate("crashes", len(crashData))
+
+
+@pytest.mark.parametrize(
+    "fixture", ["trace_asan_uaf.txt", "trace_gdb_sample_1.txt", "tsan-report.txt"]
+)
+def test_fromRawCrashDataLargeLog(benchmark, benchmark_rate, config, fixture):
+    trace = (FIXTURE_PATH / fixture).read_text().splitlines()
+    noise = [
+        f"[{idx}] INFO: noise line {idx} of a long running fuzzer, 0x{idx:08x}"
+        for idx in range(LOG_LINES)
+    ]
+    stderr = noise + trace + noise
+
+    crashInfo = benchmark.pedantic(
+        CrashInfo.fromRawCrashData,
+        args=([], stderr, config),
+        rounds=3,
+        iterations=1,
+    )
+    assert crashInfo.backtrace == (
+        CrashInfo.fromRawCrashData([], trace, config).backtrace
+    )
+    benchmark_rate("lines", len(stderr))
+
+
+def test_createCrashSignature(benchmark, config, traces):
+    crashInfos = [
+        CrashInfo.fromRawCrashData([], [], config, lines)
+        for crashData in traces.values()
+        for lines in crashData
+    ]
+
+    def _run():
+        return [crashInfo.createCrashSignature() for crashInfo in crashInfos]
+
+    benchmark.pedantic(_run, rounds=5, iterations=1)
+    benchmark.extra_info["crashes"] = len(crashInfos)
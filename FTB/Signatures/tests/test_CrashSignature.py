@@ -5,11 +5,13 @@ Created on Oct 9, 2014
 """
 
 import json
+import random
 from pathlib import Path
 
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Signatures.CrashInfo import CrashInfo
 from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.FrameTable import FRAME_TABLE
 from FTB.Signatures.Matchers import StringMatch
 from FTB.Signatures.Symptom import OutputSymptom, StackFramesSymptom
 
@@ -152,12 +154,50 @@ def test_SignatureStackFramesAlgorithmsTest():
     for stack, rawSig, expectedDepth, expectedSig in testArray:
         for maxDepth in (expectedDepth, 3):
             (actualDepth, actualSig) = StackFramesSymptom._diff(
-                stack, [StringMatch(x) for x in rawSig], 0, 1, maxDepth
+                FRAME_TABLE.getIds(stack),
+                [StringMatch(x) for x in rawSig],
+                0,
+                1,
+                maxDepth,
             )
             assert expectedDepth == actualDepth
             assert expectedSig == [str(x) for x in actualSig]
 
 
+def _bruteForceMinDiff(stack, functionNames, limit):
+    # Try all guesses with up to limit inserted or replaced wildcards
+    guesses = [list(functionNames)]
+    for depth in range(limit + 1):
+        if any(StackFramesSymptom._match(stack, guess) for guess in guesses):
+            return depth
+        nextGuesses = []
+        for guess in guesses:
+            for idx in range(len(guess)):
+                nextGuesses.append(guess[:idx] + [StringMatch("?")] + guess[idx:])
+                if guess[idx].value not in {"?", "???"}:
+                    nextGuesses.append(
+                        guess[:idx] + [StringMatch("?")] + guess[idx + 1 :]
+                    )
+        guesses = nextGuesses
+    return limit + 1
+
+
+def test_SignatureStackFramesMinDiffTest():
+    rnd = random.Random(42)
+    for _ in range(300):
+        stack = FRAME_TABLE.getIds(rnd.choices("abcd", k=rnd.randint(0, 6)))
+        functionNames = [
+            StringMatch(x)
+            for x in rnd.choices(
+                ["a", "b", "c", "?", "???", "/^[ab]$/"], k=rnd.randint(1, 4)
+            )
+        ]
+        for limit in (1, 2, 3):
+            assert StackFramesSymptom._minDiff(
+                stack, functionNames, limit
+            ) == _bruteForceMinDiff(stack, functionNames, limit)
+
+
 def test_SignaturePCREShortTest():
     config = ProgramConfiguration("test", "x86", "linux")
 
@@ -577,3 +617,40 @@ def test_SignatureSanitizerHardRssLimitHeapProfile():
     )
     assert testSig.symptoms[0].output.isPCRE
     assert isinstance(testSig.symptoms[1], StackFramesSymptom)
+
+
+def test_SignatureMatchesManyTest():
+    crashInfos = []
+    for os in ("linux", "windows"):
+        config = ProgramConfiguration("test", "x86-64", os)
+        for path in sorted(FIXTURE_PATH.glob("trace_*.txt")):
+            lines = path.read_text().splitlines()
+            crashInfos.append(CrashInfo.fromRawCrashData([], [], config, lines))
+            crashInfos.append(CrashInfo.fromRawCrashData(lines[:5], lines, config))
+
+    signatures = [
+        crashInfo.createCrashSignature(maxFrames=3) for crashInfo in crashInfos[:40]
+    ]
+    for symptom in (
+        {"type": "output", "value": "/SEGV/"},
+        {"type": "output", "value": "c:/", "src": "stderr"},
+        {"type": "stackFrames", "functionNames": ["?", "/^js::/", "???"]},
+        {"type": "stackSize", "size": "> 10"},
+    ):
+        signatures.append(CrashSignature(json.dumps({"symptoms": [symptom]})))
+    signatures.append(
+        CrashSignature(
+            json.dumps(
+                {
+                    "symptoms": [{"type": "output", "value": "ERROR"}],
+                    "operatingSystems": ["windows"],
+                }
+            )
+        )
+    )
+
+    for signature in filter(None, signatures):
+        assert signature.matchesMany(crashInfos) == [
+            signature.matches(crashInfo) for crashInfo in crashInfos
+        ], str(signature)
+    assert signatures[0].matchesMany([]) == []
@@ -0,0 +1,148 @@
+"""
+Benchmarks for matching and fitting signatures to crashes
+
+The signatures are created from the crashes of the test fixtures, and for
+scaling a large set of synthetic signatures is derived from them.
+
+Run with "pytest FTB/Signatures/tests/test_CrashSignatureBenchmark.py
+--benchmark-only".
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+import random
+import re
+from pathlib import Path
+
+import pytest
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
+from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.SignatureSet import SignatureSet
+
+pytest.importorskip("pytest_benchmark")
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+
+SYNTHETIC_SIGNATURES = 10000
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    """Crashes of the test fixtures with a backtrace and their signatures"""
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    crashes = []
+    for path in sorted(FIXTURE_PATH.glob("trace_*.txt")):
+        crashInfo = CrashInfo.fromRawCrashData(
+            [], [], config, path.read_text(errors="replace").splitlines()
+        )
+        if len(crashInfo.backtrace) > 2:
+            crashes.append(crashInfo)
+    signatures = [crashInfo.createCrashSignature() for crashInfo in crashes]
+    return (crashes, signatures)
+
+
+def _syntheticSymptoms(rng, idx, crashInfo):
+    frames = crashInfo.backtrace[: rng.randint(1, 8)]
+    kind = rng.randrange(4)
+    if kind == 0:
+        # Most buckets differ in one of the frames
+        frames = list(frames)
+        frames[rng.randrange(len(frames))] += f"_{idx}"
+    elif kind == 1:
+        frames = frames[:1] + ["?"] + frames[2:] + ["???"]
+    elif kind == 2:
+        frames = frames[:-1] + [f"/^{re.escape(frames[-1])}(<.*>)?$/"]
+    else:
+        return [
+            {"type": "output", "value": f"Assertion failure: check {idx}"},
+            {"type": "stackFrames", "functionNames": frames},
+        ]
+    return [{"type": "stackFrames", "functionNames": frames}]
+
+
+@pytest.fixture(scope="module")
+def synthetic(corpus):
+    """Synthetic signatures, similar to the buckets of a large server"""
+    (crashes, _) = corpus
+    rng = random.Random(1)
+    return [
+        CrashSignature(
+            json.dumps(
+                {"symptoms": _syntheticSymptoms(rng, idx, crashes[idx % len(crashes)])}
+            )
+        )
+        for idx in range(SYNTHETIC_SIGNATURES)
+    ]
+
+
+def test_matches(benchmark, benchmark_rate, corpus):
+    (crashes, signatures) = corpus
+
+    def _run():
+        return [sig.matches(crash) for sig in signatures for crash in crashes]
+
+    matches = benchmark.pedantic(_run, rounds=5, iterations=1)
+    benchmark_rate("pairs", len(matches))
+
+
+def test_matchesMany(benchmark, corpus):
+    (crashes, signatures) = corpus
+
+    def _run():
+        return [sig.matchesMany(crashes) for sig in signatures]
+
+    matches = benchmark.pedantic(_run, rounds=5, iterations=1)
+    assert matches == [[sig.matches(crash) for crash in crashes] for sig in signatures]
+
+
+def test_matchesSynthetic(benchmark, benchmark_rate, corpus, synthetic):
+    (crashes, _) = corpus
+    crashes = crashes[:10]
+
+    def _run():
+        return [sig.matches(crash) for sig in synthetic for crash in crashes]
+
+    matches = benchmark.pedantic(_run, rounds=3, iterations=1)
+    benchmark_rate("pairs", len(matches))
+
+
+def test_matchAllSynthetic(benchmark, corpus, synthetic):
+    (crashes, _) = corpus
+    crashes = crashes[:10]
+    signatureSet = SignatureSet(enumerate(synthetic))
+
+    def _run():
+        return [signatureSet.matchAll(crash) for crash in crashes]
+
+    matches = benchmark.pedantic(_run, rounds=3, iterations=1)
+    assert matches[0] == [
+        idx for (idx, sig) in enumerate(synthetic) if sig.matches(crashes[0])
+    ]
+    benchmark.extra_info["signatures"] = len(synthetic)
+
+
+def test_getDistance(benchmark, corpus):
+    (crashes, signatures) = corpus
+
+    def _run():
+        return [sig.getDistance(crash) for sig in signatures for crash in crashes]
+
+    distances = benchmark.pedantic(_run, rounds=3, iterations=1)
+    benchmark.extra_info["pairs"] = len(distances)
+    assert len(distances) == len(signatures) * len(crashes)
+
+
+def test_fit(benchmark, corpus):
+    (crashes, signatures) = corpus
+
+    def _run():
+        return [sig.fit(crash) for sig in signatures[:10] for crash in crashes]
+
+    benchmark.pedantic(_run, rounds=3, iterations=1)
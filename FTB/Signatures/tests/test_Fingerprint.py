@@ -0,0 +1,154 @@
+"""
+Tests for the crash and signature fingerprints
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+import pickle
+from pathlib import Path
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
+from FTB.Signatures.CrashSignature import CrashSignature
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+
+
+def _sig(*symptoms):
+    return CrashSignature(json.dumps({"symptoms": list(symptoms)}))
+
+
+def _crashInfo():
+    config = ProgramConfiguration("test", "x86", "linux")
+    return CrashInfo.fromRawCrashData(
+        [],
+        ["Assertion failure: foo == bar"],
+        config,
+        auxCrashData=(FIXTURE_PATH / "trace_1.txt").read_text().splitlines(),
+    )
+
+
+def test_SignatureFingerprint():
+    fingerprint = _sig(
+        {"type": "stackFrames", "functionNames": ["foo", "/ba.*/", "?", "baz", "qux"]},
+        {"type": "stackFrame", "functionName": "quux", "frameNumber": 5},
+        {"type": "stackSize", "size": "> 3"},
+        {"type": "crashAddress", "address": "< 0x100"},
+        {"type": "output", "src": "stderr", "value": "foo"},
+    ).fingerprint
+    assert fingerprint.crashAddress is True
+    assert fingerprint.minStackSize == 6
+    # only literal frames before the first wildcard have a fixed position
+    assert [(idx, str(match)) for (idx, match) in fingerprint.fixedFrames] == [
+        (0, "foo"),
+        (5, "quux"),
+    ]
+    assert fingerprint.outputSources == {"stderr"}
+    assert not fingerprint.anyOutput
+    assert not fingerprint.impossible
+
+    fingerprint = _sig(
+        {"type": "crashAddress", "address": ""},
+        {"type": "output", "value": "foo"},
+        {"type": "stackFrame", "functionName": "foo", "frameNumber": ">= 2"},
+    ).fingerprint
+    assert fingerprint.crashAddress is False
+    assert fingerprint.minStackSize == 3
+    assert fingerprint.fixedFrames == []
+    assert fingerprint.anyOutput
+
+    fingerprint = _sig(
+        {"type": "crashAddress", "address": ""},
+        {"type": "crashAddress", "address": "0x10"},
+    ).fingerprint
+    assert fingerprint.impossible
+
+
+def test_SignatureFingerprintRejects():
+    crashInfo = _crashInfo()
+    topFrames = crashInfo.backtrace[:2]
+    stackSize = len(crashInfo.backtrace)
+
+    accepted = [
+        _sig({"type": "stackFrames", "functionNames": topFrames + ["?", "nope"]}),
+        _sig({"type": "stackFrame", "functionName": topFrames[1], "frameNumber": 1}),
+        _sig({"type": "stackSize", "size": stackSize}),
+        _sig({"type": "crashAddress", "address": "> 0"}),
+        _sig({"type": "output", "src": "stderr", "value": "nope"}),
+        _sig({"type": "output", "value": "nope"}),
+    ]
+    rejected = [
+        _sig({"type": "stackFrames", "functionNames": ["nope"] + topFrames}),
+        _sig({"type": "stackFrame", "functionName": topFrames[0], "frameNumber": 1}),
+        _sig({"type": "stackSize", "size": f"> {stackSize}"}),
+        _sig({"type": "stackFrames", "functionNames": ["/./"] * (stackSize + 1)}),
+        _sig({"type": "crashAddress", "address": ""}),
+        _sig({"type": "output", "src": "stdout", "value": "foo"}),
+    ]
+
+    for signature in accepted:
+        assert not signature.fingerprint.rejects(crashInfo.fingerprint), str(signature)
+    for signature in rejected:
+        assert signature.fingerprint.rejects(crashInfo.fingerprint), str(signature)
+        assert not signature.matches(crashInfo)
+
+
+def test_SignatureFingerprintNeverRejectsMatches():
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    crashInfos = [
+        CrashInfo.fromRawCrashData([], [], config, path.read_text().splitlines())
+        for path in sorted(FIXTURE_PATH.glob("trace_*.txt"))
+    ]
+    signatures = []
+    for crashInfo in crashInfos:
+        signatures.append(crashInfo.createCrashSignature())
+        signatures.append(
+            crashInfo.createCrashSignature(maxFrames=2, forceCrashAddress=True)
+        )
+
+    for signature in filter(None, signatures):
+        for crashInfo in crashInfos:
+            if signature.fingerprint.rejects(crashInfo.fingerprint):
+                assert not signature.matches(crashInfo)
+
+
+def test_CrashFingerprint():
+    crashInfo = _crashInfo()
+    fingerprint = crashInfo.fingerprint
+    assert fingerprint.hasCrashAddress
+    assert fingerprint.stackSize == len(crashInfo.backtrace)
+    assert fingerprint.outputSources == {"stderr", "crashdata"}
+    # computed once
+    assert crashInfo.fingerprint is fingerprint
+
+    # and updated when the crash changes
+    crashInfo.crashAddress = None
+    crashInfo.backtrace = crashInfo.backtrace[:1]
+    crashInfo.rawStdout.append("foo")
+    fingerprint = crashInfo.fingerprint
+    assert not fingerprint.hasCrashAddress
+    assert fingerprint.stackSize == 1
+    assert fingerprint.outputSources == {"stdout", "stderr", "crashdata"}
+
+    # frame ids are not pickled
+    assert pickle.loads(pickle.dumps(crashInfo)).fingerprint.stackSize == 1
+
+
+def test_CrashSignatureMatchPlan():
+    signature = _sig(
+        {"type": "testcase", "value": "foo"},
+        {"type": "output", "value": "foo"},
+        {"type": "stackFrames", "functionNames": ["foo"]},
+        {"type": "crashAddress", "address": "0x10"},
+    )
+    assert [type(symptom).__name__ for symptom in signature.matchPlan] == [
+        "CrashAddressSymptom",
+        "StackFramesSymptom",
+        "OutputSymptom",
+        "TestcaseSymptom",
+    ]
@@ -0,0 +1,141 @@
+"""
+Tests for the frame table and the frame based stack matching
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+import pickle
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
+from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.FrameTable import FRAME_TABLE, FrameTable
+from FTB.Signatures.Matchers import StringMatch
+
+
+def _asan_trace(*frames):
+    trace = ["==1==ERROR: AddressSanitizer: SEGV on unknown address 0x000000000010"]
+    for idx, frame in enumerate(frames):
+        trace.append(f"    #{idx} 0x4c9ed{idx} in {frame} /src/foo.cpp:1:2")
+    return trace
+
+
+def test_FrameTable():
+    table = FrameTable()
+    ids = table.getIds(["foo", "bar", "foo"])
+    assert list(ids) == [0, 1, 0]
+    assert ids.typecode == "I"
+    assert table.getId("bar") == 1
+    assert table.getId("baz") == 2
+    assert table.getFrame(2) == "baz"
+    assert len(table) == 3
+
+
+def test_FrameTableGenerations():
+    table = FrameTable(maxFrames=3)
+    ids = table.getIds(["foo", "bar"])
+    assert table.generation == 0
+
+    # a new generation is started for frames that don't fit anymore
+    newIds = table.getIds(["foo", "baz"])
+    assert table.generation == 1
+    assert len(table) == 2
+    assert set(ids).isdisjoint(newIds)
+
+    # the frames of the previous generation can still be looked up
+    assert [table.getFrame(x) for x in ids] == ["foo", "bar"]
+    table.getIds(["a", "b", "c"])
+    assert table.generation == 2
+    assert table.getFrame(newIds[1]) == "baz"
+
+
+def test_FrameTableGenerationsCrashInfo(mocker):
+    table = FrameTable(maxFrames=2)
+    mocker.patch("FTB.Signatures.CrashInfo.FRAME_TABLE", table)
+    mocker.patch("FTB.Signatures.Matchers.FRAME_TABLE", table)
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    crashInfo = CrashInfo.fromRawCrashData([], [], config, _asan_trace("foo", "bar"))
+    sig = CrashSignature(
+        json.dumps({"symptoms": [{"type": "stackFrames", "functionNames": ["foo"]}]})
+    )
+    assert sig.matches(crashInfo)
+    ids = crashInfo.backtraceIds
+
+    # the ids are renewed once they can't be looked up anymore
+    table.getIds(["a", "b"])
+    assert crashInfo.backtraceIds is ids
+    table.getIds(["c", "d"])
+    assert crashInfo.backtraceIds is not ids
+    assert [table.getFrame(x) for x in crashInfo.backtraceIds] == ["foo", "bar"]
+    assert sig.matches(crashInfo)
+
+
+def test_StringMatchMemoIsBounded(mocker):
+    mocker.patch("FTB.Signatures.Matchers.MAX_FRAME_MATCHES", 2)
+    match = StringMatch("foo")
+    for frame in ("foo", "bar", "baz"):
+        match.matchesFrame(FRAME_TABLE.getId(frame))
+    assert len(match._frameMatches) == 1
+
+
+def test_FrameTableSharesFrames():
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    trace = _asan_trace("js::foo::h0123456789abcdef", "bar")
+    crash1 = CrashInfo.fromRawCrashData([], [], config, trace)
+    crash2 = CrashInfo.fromRawCrashData([], [], config, list(trace))
+
+    assert crash1.backtrace == ["js::foo", "bar"]
+    assert all(a is b for (a, b) in zip(crash1.backtrace, crash2.backtrace))
+    assert crash1.backtraceIds == crash2.backtraceIds
+    assert [FRAME_TABLE.getFrame(x) for x in crash1.backtraceIds] == crash1.backtrace
+
+    # a changed backtrace gets new ids
+    crash1.backtrace = ["baz"] + crash1.backtrace
+    assert list(crash1.backtraceIds) == [FRAME_TABLE.getId("baz")] + list(
+        crash2.backtraceIds
+    )
+
+    # the ids are not kept when pickling
+    assert pickle.loads(pickle.dumps(crash1))._backtraceIds is None
+
+
+def test_StringMatchMemoizesFrames(mocker):
+    match = StringMatch("/^js::f/")
+    matches = mocker.spy(match, "matches")
+    frameId = FRAME_TABLE.getId("js::foo")
+    assert match.matchesFrame(frameId)
+    assert match.matchesFrame(frameId)
+    assert not match.matchesFrame(FRAME_TABLE.getId("bar"))
+    assert matches.call_count == 2
+    mocker.stopall()
+
+    restored = pickle.loads(pickle.dumps(match))
+    assert restored._frameMatches == {}
+    assert restored.matchesFrame(frameId)
+
+
+def test_StackSymptomsMatchFrames():
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    crashInfo = CrashInfo.fromRawCrashData(
+        [], [], config, _asan_trace("foo", "bar", "baz")
+    )
+
+    def _sig(symptom):
+        return CrashSignature(json.dumps({"symptoms": [symptom]}))
+
+    frames = {"type": "stackFrames", "functionNames": ["foo", "?", "/^ba/"]}
+    assert _sig(frames).matches(crashInfo)
+    frames = {"type": "stackFrames", "functionNames": ["???", "baz"]}
+    assert _sig(frames).matches(crashInfo)
+    frames = {"type": "stackFrames", "functionNames": ["foo", "baz"]}
+    assert not _sig(frames).matches(crashInfo)
+
+    frame = {"type": "stackFrame", "functionName": "baz", "frameNumber": "> 1"}
+    assert _sig(frame).matches(crashInfo)
+    frame = {"type": "stackFrame", "functionName": "baz", "frameNumber": "< 2"}
+    assert not _sig(frame).matches(crashInfo)
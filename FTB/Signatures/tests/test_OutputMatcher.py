@@ -0,0 +1,134 @@
+"""
+Tests for the combined output symptom matcher
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
+from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.OutputMatcher import AhoCorasick, OutputMatcher, OutputMatches
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+
+OUTPUT_SYMPTOMS = [
+    {"value": "Assertion failure"},
+    {"value": "Assertion failure", "src": "stdout"},
+    {"value": "Assertion failure", "src": "stderr"},
+    {"value": "Assertion failure: foo == bar", "src": "crashdata"},
+    {"value": "foo"},
+    {"value": ""},
+    {"value": "doesNotExist"},
+    {"value": "/Assertion failure: (foo|bar)/"},
+    {"value": "/^Assertion/", "src": "stderr"},
+    {"value": "/^Assertion/", "src": "stdout"},
+    {"value": "/doesNotExist.*/"},
+    {"value": "/(f)o\\1/"},
+    {"value": "/(?i)ASSERTION/"},
+    {"value": "/(?P<name>bar)/"},
+    {"value": "/(?P<name>foo)/"},
+    {"value": "/c:/foo/bar.cpp/"},
+    {"value": {"value": "Assertion", "matchType": "contains"}},
+    {"value": {"value": "foo\\s==", "matchType": "pcre"}},
+]
+
+
+def _sig(symptom):
+    symptom = dict(symptom, type="output")
+    return CrashSignature(json.dumps({"symptoms": [symptom]}))
+
+
+@pytest.mark.parametrize("os", ["linux", "windows"])
+def test_OutputMatcherMatchesSymptoms(os):
+    config = ProgramConfiguration("test", "x86", os)
+    crashInfos = [
+        CrashInfo.fromRawCrashData(
+            ["stdout line", "c:\\foo\\bar.cpp"],
+            ["Assertion failure: foo == bar", "foo"],
+            config,
+            auxCrashData=["Assertion failure: foo == bar"],
+        ),
+        CrashInfo.fromRawCrashData(
+            ["Assertion failure: bar"], [], config, auxCrashData=[]
+        ),
+        CrashInfo.fromRawCrashData([], [], config),
+        CrashInfo.fromRawCrashData(
+            [],
+            (FIXTURE_PATH / "trace_1.txt").read_text().splitlines(),
+            config,
+        ),
+    ]
+    signatures = [_sig(symptom) for symptom in OUTPUT_SYMPTOMS]
+    matcher = OutputMatcher(signatures)
+    assert len(matcher) == len(OUTPUT_SYMPTOMS)
+
+    for crashInfo in crashInfos:
+        outputMatches = matcher.match(crashInfo)
+        for signature in signatures:
+            expected = signature.matches(crashInfo)
+            assert signature.matches(crashInfo, outputMatches) == expected, str(
+                signature
+            )
+
+
+def test_OutputMatcherSharesSymptoms():
+    config = ProgramConfiguration("test", "x86", "linux")
+    crashInfo = CrashInfo.fromRawCrashData([], ["Assertion failure: foo"], config)
+
+    matcher = OutputMatcher()
+    matcher.addSignature(_sig({"value": "foo"}))
+    assert matcher.match(crashInfo) == {(None, False, "foo")}
+
+    # adding more symptoms after matching recompiles the matcher
+    matcher.addSignature(_sig({"value": "foo", "src": "stderr"}))
+    matcher.addSignature(_sig({"value": "foo", "src": "stdout"}))
+    matcher.addSignature(_sig({"value": "/fo+$/", "src": "stderr"}))
+    assert matcher.match(crashInfo) == {
+        (None, False, "foo"),
+        ("stderr", False, "foo"),
+        ("stderr", True, "fo+$"),
+    }
+
+
+@pytest.mark.parametrize("scanThreshold", [0, 32])
+def test_OutputMatchesForSignatures(mocker, scanThreshold):
+    mocker.patch.object(OutputMatches, "SCAN_THRESHOLD", scanThreshold)
+    match = mocker.spy(OutputMatcher, "match")
+    config = ProgramConfiguration("test", "x86", "linux")
+    crashInfo = CrashInfo.fromRawCrashData([], ["Assertion failure: foo"], config)
+    signatures = [_sig(symptom) for symptom in OUTPUT_SYMPTOMS]
+
+    outputMatches = OutputMatches.forSignatures(crashInfo, signatures[4:7])
+    assert set(outputMatches.symptoms) == {
+        (None, False, "foo"),
+        (None, False, ""),
+        (None, False, "doesNotExist"),
+    }
+    # nothing is checked before the first lookup
+    assert not match.called
+    assert (None, False, "foo") in outputMatches
+    assert (None, False, "doesNotExist") not in outputMatches
+    assert match.call_count == (1 if scanThreshold == 0 else 0)
+    if scanThreshold == 0:
+        # the output is only scanned for the symptoms of these signatures
+        assert len(outputMatches.matcher) == 3
+
+
+def test_AhoCorasick():
+    automaton = AhoCorasick(["he", "she", "his", "hers", "s"])
+    found = set()
+    automaton.search("ushers", found)
+    assert found == {0, 1, 3, 4}
+
+    found = set()
+    automaton.search("hi", found)
+    assert found == set()
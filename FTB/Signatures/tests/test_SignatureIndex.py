@@ -0,0 +1,111 @@
+"""
+Tests for the signature index
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+from pathlib import Path
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
+from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.SignatureIndex import SignatureIndex
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+
+
+def _sig(*symptoms):
+    return CrashSignature(json.dumps({"symptoms": list(symptoms)}))
+
+
+def _crashInfo():
+    config = ProgramConfiguration("test", "x86", "linux")
+    return CrashInfo.fromRawCrashData(
+        [],
+        ["Assertion failure: foo == bar"],
+        config,
+        auxCrashData=(FIXTURE_PATH / "trace_1.txt").read_text().splitlines(),
+    )
+
+
+def test_SignatureIndexDiscriminators():
+    # Literal top frames win over everything else
+    sig = _sig(
+        {"type": "output", "value": "foo"},
+        {"type": "stackFrames", "functionNames": ["js::foo", "?", "bar"]},
+    )
+    assert SignatureIndex.getDiscriminator(sig) == ("frame", "js::foo", None)
+
+    # Wildcards and regular expressions can't be indexed by frame
+    sig = _sig(
+        {"type": "stackFrames", "functionNames": ["?", "bar"]},
+        {"type": "output", "src": "stderr", "value": "foo"},
+    )
+    assert SignatureIndex.getDiscriminator(sig) == ("output", ("stderr", "foo"), None)
+
+    sig = _sig(
+        {"type": "stackFrames", "functionNames": ["/js::.*/"]},
+        {"type": "crashAddress", "address": "< 0x100"},
+    )
+    assert SignatureIndex.getDiscriminator(sig)[0] == "address"
+
+    # Frame symptoms only count if they are fixed to the top frame
+    sig = _sig({"type": "stackFrame", "functionName": "foo", "frameNumber": 1})
+    assert SignatureIndex.getDiscriminator(sig) is None
+    sig = _sig({"type": "stackFrame", "functionName": "foo"})
+    assert SignatureIndex.getDiscriminator(sig) == ("frame", "foo", None)
+
+    sig = _sig({"type": "output", "value": "/foo/"})
+    assert SignatureIndex.getDiscriminator(sig) is None
+
+    # Literals spanning lines would be found in the joined output
+    sig = _sig({"type": "output", "value": "foo\nbar"})
+    assert SignatureIndex.getDiscriminator(sig) is None
+
+
+def test_SignatureIndexCandidates():
+    crashInfo = _crashInfo()
+    topFrame = crashInfo.backtrace[0]
+
+    signatures = {
+        1: _sig({"type": "stackFrames", "functionNames": [topFrame]}),
+        2: _sig({"type": "stackFrames", "functionNames": ["doesNotExist"]}),
+        3: _sig({"type": "output", "value": "Assertion failure: foo"}),
+        4: _sig({"type": "output", "src": "stdout", "value": "Assertion failure"}),
+        5: _sig({"type": "crashAddress", "address": str(crashInfo.crashAddress)}),
+        6: _sig({"type": "crashAddress", "address": "< 0x10"}),
+        7: _sig({"type": "output", "value": "/foo.+bar/"}),
+        8: _sig({"type": "stackFrames", "functionNames": ["?", "doesNotExist"]}),
+    }
+
+    index = SignatureIndex()
+    for key, signature in signatures.items():
+        index.add(key, signature)
+
+    assert len(index) == len(signatures)
+    candidates = index.candidates(crashInfo)
+    assert candidates == {1, 3, 5, 7, 8}
+
+    # The index must never drop a matching signature
+    for key, signature in signatures.items():
+        if signature.matches(crashInfo):
+            assert key in candidates
+
+    index.remove(1)
+    index.remove(7)
+    index.remove(100)
+    assert 1 not in index
+    assert index.candidates(crashInfo) == {3, 5, 8}
+
+    # Replacing a signature refiles it
+    index.add(3, signatures[2])
+    assert index.candidates(crashInfo) == {5, 8}
+
+    index.clear()
+    assert not index
+    assert index.candidates(crashInfo) == set()
@@ -0,0 +1,66 @@
+"""
+Tests for the signature set
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
+from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.OutputMatcher import OutputMatches
+from FTB.Signatures.SignatureSet import SignatureSet
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+
+
+def _sig(*symptoms):
+    return CrashSignature(json.dumps({"symptoms": list(symptoms)}))
+
+
+@pytest.mark.parametrize("scanThreshold", [0, 32])
+def test_SignatureSetMatchAll(monkeypatch, scanThreshold):
+    # with a threshold of 0, the output is always scanned for all symptoms
+    monkeypatch.setattr(OutputMatches, "SCAN_THRESHOLD", scanThreshold)
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    crashInfos = []
+    for path in sorted(FIXTURE_PATH.glob("trace_*.txt")):
+        lines = path.read_text().splitlines()
+        crashInfos.append(CrashInfo.fromRawCrashData([], lines, config))
+
+    signatures = [
+        (idx, crashInfo.createCrashSignature(maxFrames=2))
+        for (idx, crashInfo) in enumerate(crashInfos)
+    ]
+    signatures = [(key, signature) for (key, signature) in signatures if signature]
+    signatures.append(("output", _sig({"type": "output", "value": "/SEGV/"})))
+    signatures.append(("address", _sig({"type": "crashAddress", "address": "< 0x100"})))
+    signatures.append(("empty", _sig({"type": "output", "src": "stdout", "value": ""})))
+    signatures.append(
+        (
+            "frames",
+            _sig(
+                {"type": "output", "value": "ERROR"},
+                {"type": "stackFrames", "functionNames": crashInfos[0].backtrace[:2]},
+            ),
+        )
+    )
+
+    signatureSet = SignatureSet(signatures)
+    assert len(signatureSet) == len(signatures)
+
+    assert len(signatureSet.frameGroups) > 1
+    assert signatureSet.ungrouped
+
+    for crashInfo in crashInfos:
+        assert signatureSet.matchAll(crashInfo) == [
+            key for (key, signature) in signatures if signature.matches(crashInfo)
+        ]
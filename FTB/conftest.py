@@ -0,0 +1,26 @@
+"""Common utilities for FTB tests
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import pytest
+
+
+@pytest.fixture
+def benchmark_rate(benchmark):
+    """Report the number of items processed per run of a benchmark and the
+    number of items processed per second in its extra info"""
+
+    def _record(name, count):
+        benchmark.extra_info[name] = count
+        # no statistics are collected with --benchmark-disable or under xdist
+        if benchmark.stats:
+            benchmark.extra_info[f"{name}_per_sec"] = int(
+                count / benchmark.stats["min"]
+            )
+
+    return _record
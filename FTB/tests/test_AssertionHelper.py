@@ -291,3 +291,37 @@ def test_AssertionHelperTestRustPanic03():
         == r" right: `Block`', ([a-zA-Z]:)?/.+/style_adjuster\.rs(:[0-9]+)+"
     )
     _check_regex_matches(err, sanitizedMsg)
+
+
+def test_AssertionHelperFindCandidateLines():
+    output = [
+        "[1234] Assertion failure: foo, at foo.cpp:1",
+        "nothing to see here",
+        "multi\nline Assertion Assertion",
+        "",
+        "MOZ_CRASH",
+    ]
+    assert AssertionHelper.findCandidateLines(output, ("Assertion", "MOZ_CRASH")) == [
+        0,
+        2,
+        4,
+    ]
+    assert AssertionHelper.findCandidateLines(output, ("doesNotExist",)) == []
+    assert AssertionHelper.findCandidateLines([], ("Assertion",)) == []
+
+
+def test_AssertionHelperLargeOutput():
+    noise = [f"[{idx}] noise line {idx}" for idx in range(10000)]
+    err = (FIXTURE_PATH / "assert_moz_crash_multiline.txt").read_text().splitlines()
+    expected = AssertionHelper.getAssertion(err)
+    assert expected is not None
+
+    assert AssertionHelper.getAssertion(noise + err + noise) == expected
+    # a later assertion takes precedence
+    assert (
+        AssertionHelper.getAssertion(
+            noise + err + noise + ["[1] Assertion failure: bar"]
+        )
+        == "Assertion failure: bar"
+    )
+    assert AssertionHelper.getAssertion(iter(noise + err)) == expected
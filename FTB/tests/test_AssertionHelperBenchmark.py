@@ -0,0 +1,74 @@
+"""
+Benchmarks for the assertion extraction on large logs
+
+Run with "pytest FTB/tests/test_AssertionHelperBenchmark.py --benchmark-only",
+the extracted lines per second are reported in the extra info column
+("--benchmark-columns" or "--benchmark-json").
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+from pathlib import Path
+
+import pytest
+
+from FTB import AssertionHelper
+
+pytest.importorskip("pytest_benchmark")
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+
+LOG_LINES = 100000
+
+
+def _large_log(fixture):
+    trace = (FIXTURE_PATH / fixture).read_text().splitlines()
+    noise = [
+        f"[{idx}] INFO: noise line {idx} of a long running fuzzer, 0x{idx:08x}"
+        for idx in range(LOG_LINES)
+    ]
+    return noise + trace + noise
+
+
+def _run(benchmark, benchmark_rate, func, output):
+    result = benchmark.pedantic(func, args=(output,), rounds=5, iterations=1)
+    benchmark_rate("lines", len(output))
+    return result
+
+
+@pytest.mark.parametrize(
+    "fixture",
+    [
+        "assert_moz_crash_multiline.txt",
+        "assert_rust_panic1.txt",
+        "assert_v8_abort.txt",
+        "assert_asan_heap_buffer_overflow.txt",
+    ],
+)
+def test_getAssertionThroughput(benchmark, benchmark_rate, fixture):
+    output = _large_log(fixture)
+    assert _run(benchmark, benchmark_rate, AssertionHelper.getAssertion, output) == (
+        AssertionHelper.getAssertion((FIXTURE_PATH / fixture).read_text().splitlines())
+    )
+
+
+@pytest.mark.parametrize(
+    "fixture",
+    [
+        "assert_asan_heap_buffer_overflow.txt",
+        "assert_asan_negative_size.txt",
+    ],
+)
+def test_getAuxiliaryAbortMessageThroughput(benchmark, benchmark_rate, fixture):
+    output = _large_log(fixture)
+    assert _run(
+        benchmark, benchmark_rate, AssertionHelper.getAuxiliaryAbortMessage, output
+    ) == (
+        AssertionHelper.getAuxiliaryAbortMessage(
+            (FIXTURE_PATH / fixture).read_text().splitlines()
+        )
+    )
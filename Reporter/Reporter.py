@@ -74,6 +74,8 @@ def requests_retry(wrapped):
     @functools.wraps(wrapped)
     def wrapper(*args, **kwds):
         success = kwds.pop("expected")
+        if isinstance(success, int):
+            success = (success,)
         current_timeout = 2
         while True:
             try:
@@ -86,7 +88,7 @@ def requests_retry(wrapped):
                     continue
                 raise
 
-            if response.status_code != success:
+            if response.status_code not in success:
                 # Allow for a total sleep time of up to 2 minutes if it's
                 # likely that the response codes indicate a temporary error
                 retry_codes = [500, 502, 503, 504]
@@ -197,8 +199,8 @@ class Reporter(ABC):
         """requests.get, with added support for FuzzManager authentication and retry on
         5xx errors.
 
-        @type expected: int
-        @param expected: HTTP status code for successful response
+        @type expected: int or tuple
+        @param expected: HTTP status code(s) for successful response
                          (default: requests.codes["ok"])
         """
         kwds.setdefault("expected", requests.codes["ok"])
@@ -237,7 +239,15 @@ class Reporter(ABC):
 
     @staticmethod
     def serverError(response):
-        return RuntimeError(
+        return ServerError(response)
+
+
+class ServerError(RuntimeError):
+    """The server responded with an unexpected status code"""
+
+    def __init__(self, response):
+        super().__init__(
             "Server unexpectedly responded with status code %s: %s"
             % (response.status_code, response.text)
         )
+        self.status_code = response.status_code
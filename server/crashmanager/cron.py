@@ -1,7 +1,6 @@
 import itertools
 import os
-import shutil
-from datetime import timedelta
+from datetime import datetime, timedelta
 from tempfile import mkstemp
 
 from celeryconf import app
@@ -12,6 +11,8 @@ from django.db.models import F, Q
 from django.db.models.aggregates import Count
 from django.utils import timezone
 
+from .signature_manifest import load_manifest, update_manifest
+
 SIGNATURES_ZIP = os.path.realpath(
     os.path.join(getattr(settings, "SIGNATURE_STORAGE", None), "signatures.zip")
 )
@@ -19,7 +20,7 @@ SIGNATURES_ZIP = os.path.realpath(
 
 @app.task(ignore_result=True)
 def update_crash_stats():
-    from .models import CrashEntry, CrashHit, Tool
+    from .models import CrashEntry, CrashHit, Tool, ToolHit
 
     max_history = timedelta(days=getattr(settings, "CRASH_STATS_MAX_HISTORY_DAYS", 14))
     now = timezone.now()
@@ -62,6 +63,8 @@ def update_crash_stats():
     # trim old stats
     old_cutoff = cur_period - max_history
     CrashHit.objects.filter(lastUpdate__lt=old_cutoff).delete()
+    # the crash statistics only count the entries of the last week
+    ToolHit.objects.filter(begin__lt=cur_period - timedelta(days=8)).delete()
 
 
 @app.task(ignore_result=True)
@@ -81,14 +84,48 @@ def triage_new_crashes():
 
 @app.task(ignore_result=True)
 def export_signatures():
-    fd, tmpf = mkstemp(prefix="fm-sigs-", suffix=".zip")
+    from .management.commands.export_signatures import write_signatures_zip
+
+    started = timezone.now()
+    previous = load_manifest()
+
+    # Only buckets changed since the previous export are generated again. The
+    # margin covers changes that were saved before, but committed after the
+    # previous export started, and a full export is done every few generations
+    # in case any were missed anyway.
+    since = None
+    full_interval = getattr(settings, "SIGNATURE_FULL_EXPORT_INTERVAL", 24)
+    if (
+        previous is not None
+        and "exported" in previous
+        and os.path.exists(SIGNATURES_ZIP)
+        and full_interval
+        and (previous["generation"] + 1) % full_interval != 0
+    ):
+        since = datetime.fromisoformat(previous["exported"]) - timedelta(
+            seconds=getattr(settings, "SIGNATURE_EXPORT_MARGIN", 300)
+        )
+
+    fd, tmpf = mkstemp(
+        dir=os.path.dirname(SIGNATURES_ZIP), prefix="fm-sigs-", suffix=".zip"
+    )
     os.close(fd)
     try:
-        call_command("export_signatures", tmpf)
+        if since is None:
+            files = write_signatures_zip(tmpf)
+        else:
+            files = write_signatures_zip(
+                tmpf,
+                since=since,
+                previousZip=SIGNATURES_ZIP,
+                previousFiles=previous["files"],
+            )
         os.chmod(tmpf, 0o644)
-        shutil.copy(tmpf, SIGNATURES_ZIP)
+        os.replace(tmpf, SIGNATURES_ZIP)
+        update_manifest(files, exported=started)
     finally:
-        os.unlink(tmpf)
+        if os.path.exists(tmpf):
+            os.unlink(tmpf)
 
 
 @app.task(ignore_result=True)
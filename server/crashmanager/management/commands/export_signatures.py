@@ -1,10 +1,123 @@
+import hashlib
 import json
 from zipfile import ZipFile
 
 from django.core.management.base import BaseCommand
-from django.db.models.aggregates import Count, Min
 
-from crashmanager.models import Bucket, CrashEntry
+from crashmanager.models import Bucket, BucketAggregate
+
+# Number of buckets fetched per query
+EXPORT_BATCH_SIZE = 1000
+
+
+def _bucket_files(bucket, aggregate):
+    (size, quality, _, bestEntrySize) = aggregate or (0, None, None, None)
+
+    metadata = {}
+    metadata["size"] = size
+    metadata["shortDescription"] = bucket.shortDescription
+    metadata["frequent"] = bucket.frequent
+    if bucket.bug is not None:
+        metadata["bug__id"] = bucket.bug.externalId
+
+    if quality is not None:
+        metadata["testcase__quality"] = quality
+        metadata["testcase__size"] = bestEntrySize
+
+    return [
+        ("%d.signature" % bucket.pk, bucket.signature),
+        ("%d.metadata" % bucket.pk, json.dumps(metadata, indent=4)),
+    ]
+
+
+def write_signatures_zip(filename, since=None, previousZip=None, previousFiles=None):
+    """
+    Write the signatures and metadata of all buckets to a zip file.
+
+    Buckets are fetched in batches and written as they come. If a previous
+    export and its manifest are given, the files of buckets that were not
+    modified since the given time are copied from the previous export instead
+    of being generated again.
+
+    @type filename: str
+    @param filename: The zip file to write
+
+    @type since: datetime
+    @param since: Time up to which the previous export includes all changes
+
+    @type previousZip: str
+    @param previousZip: The previous signatures zip file
+
+    @type previousFiles: dict
+    @param previousFiles: Mapping of file names in the previous export to
+                          the SHA1 of their content
+
+    @rtype: dict
+    @return: Mapping of file names in the export to the SHA1 of their content
+    """
+    incremental = since is not None and previousZip is not None
+    changed = set()
+    if incremental:
+        changed.update(
+            Bucket.objects.filter(lastModified__gte=since).values_list("pk", flat=True)
+        )
+        changed.update(
+            BucketAggregate.objects.filter(lastModified__gte=since).values_list(
+                "bucket_id", flat=True
+            )
+        )
+
+    bucket_ids = list(Bucket.objects.order_by("pk").values_list("pk", flat=True))
+    files = {}
+
+    with ZipFile(filename, "w") as zipFile:
+        previous = ZipFile(previousZip) if incremental else None
+        try:
+            previousNames = set(previous.namelist()) if incremental else set()
+            for offset in range(0, len(bucket_ids), EXPORT_BATCH_SIZE):
+                batch = bucket_ids[offset : offset + EXPORT_BATCH_SIZE]
+
+                unchanged = {}
+                for pk in batch:
+                    names = ("%d.signature" % pk, "%d.metadata" % pk)
+                    if (
+                        incremental
+                        and pk not in changed
+                        and all(
+                            name in previousNames and name in previousFiles
+                            for name in names
+                        )
+                    ):
+                        unchanged[pk] = names
+
+                generated = {}
+                regenerate = [pk for pk in batch if pk not in unchanged]
+                if regenerate:
+                    aggregates = BucketAggregate.for_buckets(regenerate)
+                    for bucket in Bucket.objects.filter(
+                        pk__in=regenerate
+                    ).select_related("bug"):
+                        generated[bucket.pk] = _bucket_files(
+                            bucket, aggregates.get(bucket.pk)
+                        )
+
+                for pk in batch:
+                    if pk in unchanged:
+                        for name in unchanged[pk]:
+                            zipFile.writestr(name, previous.read(name))
+                            files[name] = previousFiles[name]
+                    else:
+                        # Skip buckets deleted since the list was fetched
+                        for name, content in generated.get(pk, []):
+                            zipFile.writestr(name, content)
+                            files[name] = hashlib.sha1(
+                                content.encode("utf-8")
+                            ).hexdigest()
+        finally:
+            if previous is not None:
+                previous.close()
+
+    return files
 
 
 class Command(BaseCommand):
@@ -16,37 +129,4 @@ class Command(BaseCommand):
         )
 
     def handle(self, filename, **options):
-        with ZipFile(filename, "w") as zipFile:
-            for bucket in Bucket.objects.annotate(
-                size=Count("crashentry"), quality=Min("crashentry__testcase__quality")
-            ):
-                bestEntryQuery = (
-                    CrashEntry.objects.filter(bucket_id=bucket.pk)
-                    .filter(testcase__quality=bucket.quality)
-                    .defer("rawCrashData", "rawStderr", "rawStdout")
-                    .order_by("testcase__size", "-id")
-                )
-                if bestEntryQuery.count():
-                    bucket.bestEntry = bestEntryQuery[0]
-                else:
-                    bucket.bestEntry = None
-
-                metadata = {}
-                metadata["size"] = bucket.size
-                metadata["shortDescription"] = bucket.shortDescription
-                metadata["frequent"] = bucket.frequent
-                if bucket.bug is not None:
-                    metadata["bug__id"] = bucket.bug.externalId
-
-                if (
-                    bucket.bestEntry is not None
-                    and bucket.bestEntry.testcase is not None
-                ):
-                    metadata["testcase__quality"] = bucket.bestEntry.testcase.quality
-                    metadata["testcase__size"] = bucket.bestEntry.testcase.size
-
-                sigFileName = "%d.signature" % bucket.pk
-                metaFileName = "%d.metadata" % bucket.pk
-
-                zipFile.writestr(sigFileName, bucket.signature)
-                zipFile.writestr(metaFileName, json.dumps(metadata, indent=4))
+        write_signatures_zip(filename)
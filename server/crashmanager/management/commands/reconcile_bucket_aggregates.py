@@ -0,0 +1,101 @@
+import logging
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models.aggregates import Count
+from django.utils import timezone
+
+from crashmanager.models import Bucket, BucketAggregate, CrashEntry
+
+LOG = logging.getLogger("fm.crashmanager.reconcile_bucket_aggregates")
+
+
+def compute_bucket_aggregates():
+    """
+    Compute the aggregates of all buckets from their crash entries.
+
+    @rtype: dict
+    @return: Tuples of (size, quality, best entry, best entry testcase size)
+             by (bucket id, tool id)
+    """
+    entries = CrashEntry.objects.exclude(bucket=None).order_by()
+    result = {
+        (bucket_id, tool_id): (size, None, None, None)
+        for bucket_id, tool_id, size in entries.values("bucket_id", "tool_id")
+        .annotate(size=Count("id"))
+        .values_list("bucket_id", "tool_id", "size")
+    }
+
+    # The first entry of each bucket and tool in this order is the best one
+    best = (
+        entries.filter(testcase__isnull=False)
+        .order_by("bucket_id", "tool_id", "testcase__quality", "testcase__size", "-id")
+        .values_list(
+            "bucket_id", "tool_id", "testcase__quality", "id", "testcase__size"
+        )
+    )
+    seen = set()
+    for bucket_id, tool_id, quality, bestEntry, bestEntrySize in best.iterator():
+        if (bucket_id, tool_id) in seen:
+            continue
+        seen.add((bucket_id, tool_id))
+        size = result[(bucket_id, tool_id)][0]
+        result[(bucket_id, tool_id)] = (size, quality, bestEntry, bestEntrySize)
+
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the size and best testcase of all buckets from their crash "
+        "entries, repairing any aggregates that drifted."
+    )
+
+    def handle(self, *args, **options):
+        fields = ("size", "quality", "bestEntry", "bestEntrySize")
+
+        with transaction.atomic():
+            expected = compute_bucket_aggregates()
+            now = timezone.now()
+
+            changed = []
+            stale = []
+            buckets = set()
+            for aggregate in BucketAggregate.objects.select_for_update():
+                key = (aggregate.bucket_id, aggregate.tool_id)
+                values = expected.pop(key, None)
+                if values is None:
+                    stale.append(aggregate.pk)
+                    buckets.add(aggregate.bucket_id)
+                    continue
+                if tuple(getattr(aggregate, field) for field in fields) != values:
+                    for field, value in zip(fields, values):
+                        setattr(aggregate, field, value)
+                    aggregate.lastModified = now
+                    changed.append(aggregate)
+
+            BucketAggregate.objects.filter(pk__in=stale).delete()
+            BucketAggregate.objects.bulk_update(
+                changed, fields + ("lastModified",), batch_size=500
+            )
+            BucketAggregate.objects.bulk_create(
+                [
+                    BucketAggregate(
+                        bucket_id=bucket_id,
+                        tool_id=tool_id,
+                        lastModified=now,
+                        **dict(zip(fields, values)),
+                    )
+                    for (bucket_id, tool_id), values in expected.items()
+                ],
+                batch_size=500,
+            )
+
+            # Removed aggregates leave nothing behind to mark the bucket as
+            # changed for the signatures export
+            Bucket.objects.filter(pk__in=buckets).update(lastModified=now)
+
+        repaired = len(changed) + len(stale) + len(expected)
+        if repaired:
+            LOG.warning("Repaired %d bucket aggregates", repaired)
+        self.stdout.write(f"Repaired {repaired} bucket aggregates")
@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from crashmanager.triage_cache import get_triage_cache
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss statistics of the triage cache shared between workers."
+
+    def handle(self, *args, **options):
+        for name, value in sorted(get_triage_cache().stats().items()):
+            print(f"{name}: {value}")
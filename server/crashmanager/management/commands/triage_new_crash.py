@@ -1,17 +1,15 @@
-from collections import OrderedDict
-
-from django.conf import settings
 from django.core.management import BaseCommand
 
-from crashmanager.models import Bucket, CrashEntry
+from crashmanager.models import BUCKET_INDEX, Bucket, CrashEntry
+from crashmanager.triage_cache import get_triage_cache
 
 # This is a per-worker global cache mapping short descriptions of
-# crashes to a list of bucket candidates to try first.
+# crashes to a list of bucket candidates to try first. Depending on
+# the configuration, it is shared between all workers through Redis.
 #
 # although this cache looks pointless within this command,
-# the command is called in a loop from triage_new_crashes.py
-# and may be called multiple times in one process by celery
-TRIAGE_CACHE = OrderedDict()
+# the command may be called multiple times in one process by celery
+TRIAGE_CACHE = get_triage_cache()
 
 
 class Command(BaseCommand):
@@ -30,7 +28,7 @@ class Command(BaseCommand):
 
         cacheHit = False
 
-        triage_cache_hint = TRIAGE_CACHE.get(entry.shortSignature, [])
+        triage_cache_hint = TRIAGE_CACHE.get(entry.shortSignature)
 
         if triage_cache_hint:
             buckets = Bucket.objects.filter(pk__in=triage_cache_hint).order_by("-id")
@@ -42,32 +40,23 @@ class Command(BaseCommand):
                     cacheHit = True
                     break
 
+        TRIAGE_CACHE.record(cacheHit)
+
         if not cacheHit:
-            buckets = Bucket.objects.exclude(pk__in=triage_cache_hint).order_by("-id")
+            # Only buckets whose signature can possibly match need to be checked
+            BUCKET_INDEX.refresh()
+            candidates = BUCKET_INDEX.candidates(crashInfo)
+            buckets = (
+                Bucket.objects.filter(pk__in=candidates)
+                .exclude(pk__in=triage_cache_hint)
+                .order_by("-id")
+            )
 
             for bucket in buckets:
                 signature = bucket.getSignature()
                 if signature.matches(crashInfo):
                     entry.bucket = bucket
-
-                    cacheList = [bucket.pk]
-                    if triage_cache_hint:
-                        cacheList = TRIAGE_CACHE[entry.shortSignature]
-
-                        # We delete the current entry and add it again to ensure
-                        # that our dictionary remains ordered by the time of last
-                        # use. We can then just pop the first element if the cache
-                        # grows too large, evicting the least used item.
-                        del TRIAGE_CACHE[entry.shortSignature]
-                        cacheList.append(bucket.pk)
-
-                    TRIAGE_CACHE[entry.shortSignature] = cacheList
-
-                    if len(TRIAGE_CACHE) > getattr(
-                        settings, "CELERY_TRIAGE_MEMCACHE_ENTRIES", 100
-                    ):
-                        TRIAGE_CACHE.popitem(last=False)
-
+                    TRIAGE_CACHE.add(entry.shortSignature, bucket.pk)
                     break
 
         entry.triagedOnce = True
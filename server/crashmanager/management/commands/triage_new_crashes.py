@@ -1,6 +1,132 @@
-from django.core.management import BaseCommand, call_command
+from collections import Counter, defaultdict
 
-from crashmanager.models import CrashEntry
+from django.core.management import BaseCommand
+from notifications.signals import notify
+
+from crashmanager.models import (
+    BUCKET_INDEX,
+    Bucket,
+    BucketAggregate,
+    BucketHit,
+    CrashEntry,
+)
+from FTB.Signatures.OutputMatcher import OutputMatches
+
+
+def triage_entries(entry_ids, buckets=None):
+    """
+    Triage the given crash entries into the existing buckets.
+
+    Every signature is only checked against the entries in the batch that
+    the bucket index considers candidates for it. If several buckets match an
+    entry, the newest bucket wins. All entries are marked as triaged.
+
+    @type entry_ids: list
+    @param entry_ids: Primary keys of the crash entries to triage
+
+    @type buckets: list
+    @param buckets: Pairs of (bucket, signature) to triage into, newest first.
+                    Loaded from the database if not given.
+
+    @rtype: int
+    @return: Number of entries assigned to a bucket
+    """
+    if buckets is None:
+        buckets = [
+            (bucket, bucket.getSignature()) for bucket in Bucket.objects.order_by("-id")
+        ]
+
+    requiredOutputs = set()
+    needTest = False
+    signatures = {}
+    for bucket, signature in buckets:
+        requiredOutputs.update(signature.getRequiredOutputSources())
+        needTest = needTest or signature.matchRequiresTest()
+        signatures[bucket.pk] = signature
+
+    entries = CrashEntry.objects.filter(pk__in=entry_ids, bucket=None)
+    entries = entries.select_related("product", "platform", "os")
+    if needTest:
+        entries = entries.select_related("testcase")
+    entries = CrashEntry.deferRawFields(entries, requiredOutputs)
+
+    # Group the entries by the buckets that could possibly match them
+    BUCKET_INDEX.refresh()
+    crashInfos = {}
+    candidates = defaultdict(list)
+    for entry in entries:
+        crashInfo = entry.getCrashInfo(
+            attachTestcase=needTest, requiredOutputSources=requiredOutputs
+        )
+        entryCandidates = BUCKET_INDEX.candidates(crashInfo)
+        if not entryCandidates:
+            continue
+        # Only the output symptoms of the candidates are checked, and only if
+        # the rest of their signature matches
+        outputMatches = OutputMatches.forSignatures(
+            crashInfo,
+            (
+                signatures[bucket_id]
+                for bucket_id in entryCandidates
+                if bucket_id in signatures
+            ),
+        )
+        crashInfos[entry.pk] = (entry, crashInfo, outputMatches)
+        for bucket_id in entryCandidates:
+            candidates[bucket_id].append(entry.pk)
+
+    assigned = defaultdict(list)
+    for bucket, signature in buckets:
+        for entry_id in candidates.get(bucket.pk, ()):
+            if entry_id not in crashInfos:
+                # Already matched by a newer bucket
+                continue
+            entry, crashInfo, outputMatches = crashInfos[entry_id]
+            if signature.matches(crashInfo, outputMatches):
+                assigned[bucket].append(entry)
+                del crashInfos[entry_id]
+
+    for bucket, matched in assigned.items():
+        updated = CrashEntry.objects.filter(
+            pk__in=[entry.pk for entry in matched], bucket=None
+        ).update(bucket=bucket, triagedOnce=True)
+        if updated != len(matched):
+            # Some entries were bucketed concurrently, only count our own
+            matched = list(
+                CrashEntry.objects.filter(
+                    pk__in=[entry.pk for entry in matched], bucket=bucket
+                ).only("tool", "created")
+            )
+
+        hits = Counter(
+            (entry.tool_id, entry.created.replace(microsecond=0, second=0, minute=0))
+            for entry in matched
+        )
+        for (tool_id, begin), count in hits.items():
+            BucketHit.increment_count(bucket.pk, tool_id, begin, value=count)
+        BucketAggregate.add_entry_ids(bucket.pk, [entry.pk for entry in matched])
+
+        watchers = bucket.watchers
+        if watchers.exists():
+            for entry in matched:
+                notify.send(
+                    bucket,
+                    recipient=watchers,
+                    actor=bucket,
+                    verb="bucket_hit",
+                    target=entry,
+                    level="info",
+                    description=(
+                        f"The bucket {bucket.pk} received a new crash entry "
+                        f"{entry.pk}"
+                    ),
+                )
+
+    CrashEntry.objects.filter(pk__in=entry_ids, triagedOnce=False).update(
+        triagedOnce=True
+    )
+
+    return sum(len(matched) for matched in assigned.values())
 
 
 class Command(BaseCommand):
@@ -9,13 +135,33 @@ class Command(BaseCommand):
         "before to assign them into the existing buckets."
     )
 
-    def handle(self, *args, **options):
-        entries = CrashEntry.objects.filter(triagedOnce=False, bucket=None).values_list(
-            "id", flat=True
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of crash entries to triage at once",
         )
 
-        for entry in entries:
-            call_command("triage_new_crash", entry)
+    def handle(self, *args, **options):
+        buckets = [
+            (bucket, bucket.getSignature()) for bucket in Bucket.objects.order_by("-id")
+        ]
+
+        entries = CrashEntry.objects.filter(triagedOnce=False, bucket=None).order_by(
+            "id"
+        )
+        lastId = 0
+        while True:
+            entry_ids = list(
+                entries.filter(id__gt=lastId).values_list("id", flat=True)[
+                    : options["batch_size"]
+                ]
+            )
+            if not entry_ids:
+                break
+            lastId = entry_ids[-1]
+            triage_entries(entry_ids, buckets)
 
         # This query ensures that all issues that have been bucketed manually before
         # the server had a chance to triage them will have their triageOnce flag set,
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.19 on 2026-10-18 18:27
+
+import re
+
+from django.db import migrations, models
+
+# Binary testcases were already stored as tests/<sha1 of the content>.<ext>, names
+# with a suffix added by the storage are duplicates and not shared.
+LEGACY_BINARY_NAME = re.compile(r"^tests/([0-9a-f]{40})\.[^/]*$")
+
+
+def add_binary_testcase_sha1(apps, schema_editor):
+    TestCase = apps.get_model("crashmanager", "TestCase")
+
+    batch = []
+    for testcase in (
+        TestCase.objects.filter(isBinary=True, sha1="").only("test").iterator()
+    ):
+        match = LEGACY_BINARY_NAME.match(testcase.test.name)
+        if match is None:
+            continue
+        testcase.sha1 = match.group(1)
+        batch.append(testcase)
+        if len(batch) >= 1000:
+            TestCase.objects.bulk_update(batch, ["sha1"])
+            batch = []
+    TestCase.objects.bulk_update(batch, ["sha1"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crashmanager", "0017_buckethit_unique_buckethits_per_period"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="testcase",
+            name="sha1",
+            field=models.CharField(
+                blank=True, db_index=True, default="", max_length=40
+            ),
+        ),
+        migrations.RunPython(
+            add_binary_testcase_sha1,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 4.2.19 on 2026-10-18 20:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def add_bucket_aggregates(apps, schema_editor):
+    BucketAggregate = apps.get_model("crashmanager", "BucketAggregate")
+    CrashEntry = apps.get_model("crashmanager", "CrashEntry")
+
+    entries = CrashEntry.objects.filter(bucket__isnull=False).order_by()
+    aggregates = {
+        (bucket, tool): BucketAggregate(bucket_id=bucket, tool_id=tool, size=size)
+        for bucket, tool, size in entries.values("bucket_id", "tool_id")
+        .annotate(size=Count("id"))
+        .values_list("bucket_id", "tool_id", "size")
+    }
+
+    best = (
+        entries.filter(testcase__isnull=False)
+        .order_by("bucket_id", "tool_id", "testcase__quality", "testcase__size", "-id")
+        .values_list(
+            "bucket_id", "tool_id", "testcase__quality", "id", "testcase__size"
+        )
+    )
+    for bucket, tool, quality, entry, size in best.iterator():
+        aggregate = aggregates[(bucket, tool)]
+        if aggregate.bestEntry is None:
+            aggregate.quality = quality
+            aggregate.bestEntry = entry
+            aggregate.bestEntrySize = size
+
+    BucketAggregate.objects.bulk_create(aggregates.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("crashmanager", "0018_testcase_sha1"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BucketAggregate",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("size", models.IntegerField(default=0)),
+                ("quality", models.IntegerField(blank=True, null=True)),
+                ("bestEntry", models.IntegerField(blank=True, null=True)),
+                ("bestEntrySize", models.IntegerField(blank=True, null=True)),
+                (
+                    "bucket",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="crashmanager.bucket",
+                    ),
+                ),
+                (
+                    "tool",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="crashmanager.tool",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="bucketaggregate",
+            constraint=models.UniqueConstraint(
+                fields=("bucket", "tool"), name="unique_bucketaggregate_per_tool"
+            ),
+        ),
+        migrations.RunPython(
+            add_bucket_aggregates,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
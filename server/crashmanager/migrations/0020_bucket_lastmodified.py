@@ -0,0 +1,26 @@
+# Generated by Django 4.2.19 on 2026-10-18 20:26
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crashmanager", "0019_bucketaggregate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bucket",
+            name="lastModified",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name="bucketaggregate",
+            name="lastModified",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+    ]
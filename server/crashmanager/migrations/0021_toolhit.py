@@ -0,0 +1,82 @@
+# Generated by Django 4.2.19 on 2026-10-18 20:35
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+import crashmanager.models
+
+
+def add_tool_hits(apps, schema_editor):
+    CrashEntry = apps.get_model("crashmanager", "CrashEntry")
+    ToolHit = apps.get_model("crashmanager", "ToolHit")
+
+    # the crash statistics only need the hits of the last week
+    since = timezone.now() - timedelta(days=8)
+    hits = (
+        CrashEntry.objects.filter(created__gte=since)
+        .annotate(begin=TruncHour("created"))
+        .order_by()
+        .values("tool_id", "begin")
+        .annotate(count=Count("id"))
+        .values_list("tool_id", "begin", "count")
+    )
+    ToolHit.objects.bulk_create(
+        [
+            ToolHit(tool_id=tool, begin=begin, count=count)
+            for tool, begin, count in hits
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crashmanager", "0020_bucket_lastmodified"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ToolHit",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "begin",
+                    models.DateTimeField(
+                        default=crashmanager.models.buckethit_default_range_begin
+                    ),
+                ),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "tool",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="crashmanager.tool",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="toolhit",
+            constraint=models.UniqueConstraint(
+                fields=("tool", "begin"), name="unique_toolhits_per_period"
+            ),
+        ),
+        migrations.RunPython(
+            add_tool_hits,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
@@ -1,15 +1,23 @@
+import base64
+import hashlib
 import json
 import logging
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
 from datetime import timedelta
 from itertools import zip_longest
 
+import msgpack
 from django.conf import settings
 from django.contrib.auth.models import Permission
 from django.contrib.auth.models import User as DjangoUser
 from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
 from django.core.files.storage import FileSystemStorage
-from django.db import models
+from django.db import models, transaction
 from django.db.models.signals import post_delete, post_save
 from django.dispatch.dispatcher import receiver
 from django.utils import timezone
@@ -19,10 +27,13 @@ from notifications.signals import notify
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Signatures.CrashInfo import CrashInfo
 from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.SignatureIndex import SignatureIndex
 
 if getattr(settings, "USE_CELERY", None):
     from .tasks import triage_new_crash
 
+LOG = logging.getLogger("crashmanager")
+
 
 class Tool(models.Model):
     name = models.CharField(max_length=63, unique=True)
@@ -69,6 +80,9 @@ class TestCase(models.Model):
     size = models.IntegerField(default=0)
     quality = models.IntegerField(default=0)
     isBinary = models.BooleanField(default=False)
+    # Testcase files are content-addressed and shared between all testcases with
+    # the same content and extension. Empty for text testcases stored before that.
+    sha1 = models.CharField(max_length=40, blank=True, default="", db_index=True)
 
     def __init__(self, *args, **kwargs):
         # This variable can hold the testcase data temporarily
@@ -87,10 +101,72 @@ class TestCase(models.Model):
 
     def storeTestAndSave(self):
         self.size = len(self.content)
-        self.test.open(mode="w")
-        self.test.write(self.content)
-        self.test.close()
-        self.save()
+        oldName, oldSha1 = self.test.name, self.sha1
+        with transaction.atomic():
+            self.storeTest(self.content, os.path.splitext(oldName)[1].lstrip("."))
+            self.save()
+        if oldName and oldName != self.test.name:
+            TestCase.releaseTest(oldName, oldSha1)
+
+    def storeTest(self, content, extension):
+        """
+        Point this testcase to the file holding the given content, storing the
+        file only if no other testcase did so already.
+
+        This must be called in the same transaction that saves the testcase. A
+        testcase sharing the file is locked until then, so the file can't be
+        released by deleting it concurrently.
+
+        @type content: bytes or str
+        @param content: The testcase data
+
+        @type extension: str
+        @param extension: File extension of the testcase
+        """
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        self.sha1 = hashlib.sha1(content).hexdigest()
+        filename = f"{self.sha1}.{extension}"
+        name = self.test.field.generate_filename(self, filename)
+        TestCase.lockTest(name, self.sha1)
+        if self.test.storage.exists(name):
+            self.test.name = name
+        else:
+            self.test.save(filename, ContentFile(content), save=False)
+
+    @staticmethod
+    def lockTest(name, sha1):
+        """
+        Lock a testcase using the given file until the end of the transaction.
+        Deleting it blocks until then and the file is only released afterwards
+        if no testcase saved in this transaction uses it.
+
+        @type name: str
+        @param name: Name of the file in the testcase storage
+
+        @type sha1: str
+        @param sha1: Content hash of the file
+
+        @rtype: TestCase
+        @return: The locked testcase or None if no testcase uses the file
+        """
+        return TestCase.objects.select_for_update().filter(sha1=sha1, test=name).first()
+
+    @staticmethod
+    def releaseTest(name, sha1):
+        """
+        Delete a testcase file unless it is still referenced by a testcase.
+
+        @type name: str
+        @param name: Name of the file in the testcase storage
+
+        @type sha1: str
+        @param sha1: Content hash the file was stored with, empty if the file
+                     was stored before testcases were deduplicated
+        """
+        if sha1 and TestCase.objects.filter(sha1=sha1, test=name).exists():
+            return
+        TestCase._meta.get_field("test").storage.delete(name)
 
 
 class Client(models.Model):
@@ -130,6 +206,177 @@ class Bug(models.Model):
         return DjangoUser.objects.filter(id__in=ids).distinct()
 
 
+class SignatureCache:
+    """
+    Per-process LRU cache of parsed bucket signatures, keyed by the bucket id
+    and a hash of the signature text, so modified signatures are never served
+    from the cache.
+
+    The cached CrashSignature objects are shared by all threads. Their only
+    mutable state is the memo of frame match results in each StringMatch
+    (see StringMatch.matchesFrame). It only ever maps a frame id to the
+    same deterministic result, and it is replaced rather than cleared when
+    it is reset. So concurrent readers and writers only race to store equal
+    values, which single dict operations handle safely.
+    """
+
+    def __init__(self):
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, pk, rawSignature):
+        """
+        Return the parsed signature for the given bucket, parsing it only if
+        it isn't cached yet.
+
+        @type pk: int
+        @param pk: Primary key of the bucket
+
+        @type rawSignature: str
+        @param rawSignature: The signature of the bucket
+
+        @rtype: CrashSignature
+        @return: The parsed signature
+        """
+        key = (pk, hashlib.sha1(rawSignature.encode("utf-8")).hexdigest())
+
+        with self.lock:
+            signature = self.cache.get(key)
+            if signature is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return signature
+            self.misses += 1
+
+        # Parse outside of the lock, errors are raised to the caller uncached
+        signature = CrashSignature(rawSignature)
+
+        with self.lock:
+            self.cache[key] = signature
+            while len(self.cache) > getattr(settings, "SIGNATURE_CACHE_ENTRIES", 1000):
+                self.cache.popitem(last=False)
+
+        return signature
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+SIGNATURE_CACHE = SignatureCache()
+
+
+class DimensionCache:
+    """
+    Per-process cache of the rows of the small lookup tables referenced by
+    every crash entry (Product, Platform, OS, Client and Tool), so reporting
+    and loading crashes doesn't need a query for each of them.
+
+    Rows are only cached once the transaction that loaded or created them is
+    committed. Rows saved or deleted in this process are invalidated right
+    away, changes made by other processes are seen after
+    DIMENSION_CACHE_MAX_AGE seconds. The cached instances are shared and must
+    not be modified.
+    """
+
+    def __init__(self):
+        self.byKey = {}
+        self.byId = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, cache, key):
+        with self.lock:
+            cached = cache.get(key)
+            if cached is not None:
+                (obj, loaded) = cached
+                maxAge = getattr(settings, "DIMENSION_CACHE_MAX_AGE", 300)
+                if time.monotonic() - loaded <= maxAge:
+                    self.hits += 1
+                    return obj
+                del cache[key]
+            self.misses += 1
+        return None
+
+    def _store(self, obj, key=None):
+        def store():
+            model = type(obj)
+            loaded = time.monotonic()
+            with self.lock:
+                if len(self.byId) >= getattr(
+                    settings, "DIMENSION_CACHE_ENTRIES", 10000
+                ):
+                    self.byKey.clear()
+                    self.byId.clear()
+                self.byId[(model, obj.pk)] = (obj, loaded)
+                if key is not None:
+                    self.byKey[(model, key)] = (obj, loaded)
+
+        transaction.on_commit(store)
+
+    def getOrCreate(self, model, **values):
+        """
+        Look up a row by its natural key, creating it if it doesn't exist.
+
+        @type model: class
+        @param model: One of the lookup models, e.g. Product
+
+        @param values: Values of the natural key of the row, as passed to
+                       get_or_create()
+
+        @return: The model instance
+        """
+        key = tuple(sorted(values.items()))
+        obj = self._lookup(self.byKey, (model, key))
+        if obj is None:
+            obj = model.objects.get_or_create(**values)[0]
+            self._store(obj, key)
+        return obj
+
+    def get(self, model, pk):
+        """
+        Look up a row by its primary key.
+
+        @type model: class
+        @param model: One of the lookup models, e.g. Product
+
+        @type pk: int
+        @param pk: Primary key of the row
+
+        @return: The model instance
+        """
+        obj = self._lookup(self.byId, (model, pk))
+        if obj is None:
+            obj = model.objects.get(pk=pk)
+            self._store(obj)
+        return obj
+
+    def invalidate(self, model, pk):
+        with self.lock:
+            self.byId.pop((model, pk), None)
+            for key in [
+                key
+                for (key, (obj, _)) in self.byKey.items()
+                if key[0] is model and obj.pk == pk
+            ]:
+                del self.byKey[key]
+
+    def clear(self):
+        with self.lock:
+            self.byKey.clear()
+            self.byId.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+DIMENSION_CACHE = DimensionCache()
+
+
 class Bucket(models.Model):
     bug = models.ForeignKey(
         Bug, blank=True, null=True, on_delete=models.deletion.CASCADE
@@ -141,6 +388,9 @@ class Bucket(models.Model):
     permanent = models.BooleanField(blank=False, default=False)
     doNotReduce = models.BooleanField(blank=False, default=False)
     reassign_in_progress = models.BooleanField(default=False)
+    # Time of the last change to the exported signature or metadata, so the
+    # signatures export only needs to regenerate buckets that changed since
+    lastModified = models.DateTimeField(auto_now=True, db_index=True)
 
     @property
     def watchers(self):
@@ -150,7 +400,9 @@ class Bucket(models.Model):
         return DjangoUser.objects.filter(id__in=ids).distinct()
 
     def getSignature(self):
-        return CrashSignature(self.signature)
+        if self.pk is None:
+            return CrashSignature(self.signature)
+        return SIGNATURE_CACHE.get(self.pk, self.signature)
 
     def getOptimizedSignature(self):
         return CrashSignature(self.optimizedSignature)
@@ -173,6 +425,8 @@ class Bucket(models.Model):
             self.optimizedSignature = None
             modified.add("optimizedSignature")
 
+        modified.add("lastModified")
+
         # required in Django 4.2+
         if "update_fields" in kwargs and kwargs["update_fields"] is not None:
             kwargs["update_fields"] = modified.union(kwargs["update_fields"])
@@ -190,26 +444,13 @@ class Bucket(models.Model):
         from .serializers import CrashEntryVueSerializer
 
         inList, outList = [], []
-        inListCount, outListCount = 0, 0
 
-        signature = self.getSignature()
-        needTest = signature.matchRequiresTest()
         entries = CrashEntry.objects.filter(
             models.Q(bucket=None) | models.Q(bucket=self)
         )
-        entries = entries.select_related(
-            "product", "platform", "os"
-        )  # these are used by getCrashInfo
-        if needTest:
-            entries = entries.select_related("testcase")
-
-        requiredOutputs = signature.getRequiredOutputSources()
-        entries = CrashEntry.deferRawFields(entries, requiredOutputs)
 
         if not submitSave:
-            entries = entries.select_related("tool").order_by(
-                "-id"
-            )  # used by the preview list
+            entries = entries.order_by("-id")
         else:
             # return unassigned entries last when saving to ensure a consistent sort
             # otherwise in the "create" case we get inconsistent return order and
@@ -242,64 +483,180 @@ class Bucket(models.Model):
             args = [iter(iterable)] * n
             return zip_longest(*args, fillvalue=fillvalue)
 
-        # If we are saving, we only care about the id of each entry
-        # Otherwise, we save the entire object. Limit to the first 100 entries to avoid
-        # OOM.
-        for entry_ids_chunk in grouper(entry_ids, 100):
-            entries_chunk = entries.filter(id__in=entry_ids_chunk)
-
-            for entry in entries_chunk:
-                match = signature.matches(
-                    entry.getCrashInfo(
-                        attachTestcase=needTest, requiredOutputSources=requiredOutputs
-                    )
+        entry_ids = list(entry_ids)
+        chunkSize = getattr(settings, "CELERY_REASSIGN_CHUNK_SIZE", 1000)
+        results = None
+        if (
+            getattr(settings, "USE_CELERY", None)
+            and getattr(settings, "CELERY_PARALLEL_REASSIGN", False)
+            and len(entry_ids) > chunkSize
+        ):
+            # Match ranges of entries in parallel on the workers, we only
+            # collect the results here.
+            from celery import group
+            from celery.exceptions import TimeoutError as CeleryTimeoutError
+
+            from .tasks import reassign_match
+
+            chunks = [
+                [pk for pk in chunk if pk is not None]
+                for chunk in grouper(entry_ids, chunkSize)
+            ]
+            groupResult = group(
+                reassign_match.s(self.signature, self.pk, c) for c in chunks
+            ).apply_async()
+            try:
+                results = groupResult.get(
+                    timeout=getattr(settings, "CELERY_REASSIGN_TIMEOUT", 60)
                 )
-                if match and entry.bucket_id is None:
-                    if submitSave:
-                        inList.append(entry.pk)
-                    elif len(inList) < 100:
-                        inList.append(CrashEntryVueSerializer(entry).data)
-                    inListCount += 1
-                elif not match and entry.bucket_id is not None:
-                    if submitSave:
-                        outList.append(entry.pk)
-                    elif len(outList) < 100:
-                        outList.append(CrashEntryVueSerializer(entry).data)
-                    outListCount += 1
+            except CeleryTimeoutError:
+                # The workers are busy, don't keep the request waiting
+                LOG.warning(
+                    "Matching bucket %d on the workers timed out, matching locally",
+                    self.pk,
+                )
+                groupResult.revoke()
+
+        if results is None:
+            # Limit to chunks of 100 entries to avoid OOM
+            results = [
+                Bucket.matchEntries(self.getSignature(), self.pk, chunk)
+                for chunk in grouper(entry_ids, 100)
+            ]
+
+        for chunkIn, chunkOut in results:
+            inList.extend(chunkIn)
+            outList.extend(chunkOut)
+        inListCount, outListCount = len(inList), len(outList)
+
+        if not submitSave:
+            # Only return the first 100 entries of each list for preview
+            previewEntries = CrashEntry.objects.select_related(
+                "product", "platform", "os", "tool"
+            ).order_by("-id")
+            inList = [
+                CrashEntryVueSerializer(entry).data
+                for entry in previewEntries.filter(pk__in=inList[:100])
+            ]
+            outList = [
+                CrashEntryVueSerializer(entry).data
+                for entry in previewEntries.filter(pk__in=outList[:100])
+            ]
 
         if submitSave:
             while inList:
                 updList, inList = inList[:500], inList[500:]
+                added, removed = {}, {}
                 for crash in CrashEntry.objects.filter(pk__in=updList).values(
-                    "bucket_id", "created", "tool_id"
+                    "id",
+                    "bucket_id",
+                    "created",
+                    "tool_id",
+                    "testcase__quality",
+                    "testcase__size",
                 ):
                     if crash["bucket_id"] != self.id:
                         if crash["bucket_id"] is not None:
                             BucketHit.decrement_count(
                                 crash["bucket_id"], crash["tool_id"], crash["created"]
                             )
+                            removed.setdefault(
+                                (crash["bucket_id"], crash["tool_id"]), []
+                            ).append(crash["id"])
                         BucketHit.increment_count(
                             self.id, crash["tool_id"], crash["created"]
                         )
+                        added.setdefault(crash["tool_id"], []).append(
+                            (
+                                crash["id"],
+                                crash["testcase__quality"],
+                                crash["testcase__size"],
+                            )
+                        )
                 CrashEntry.objects.filter(pk__in=updList).update(bucket=self)
+                for (bucket_id, tool_id), entry_ids in removed.items():
+                    BucketAggregate.remove_entries(bucket_id, tool_id, entry_ids)
+                for tool_id, entries in added.items():
+                    BucketAggregate.add_entries(self.id, tool_id, entries)
             while outList:
                 updList, outList = outList[:500], outList[500:]
+                removed = {}
                 for crash in CrashEntry.objects.filter(pk__in=updList).values(
-                    "bucket_id", "created", "tool_id"
+                    "id", "bucket_id", "created", "tool_id"
                 ):
                     if crash["bucket_id"] is not None:
                         BucketHit.decrement_count(
                             crash["bucket_id"], crash["tool_id"], crash["created"]
                         )
+                        removed.setdefault(
+                            (crash["bucket_id"], crash["tool_id"]), []
+                        ).append(crash["id"])
                 CrashEntry.objects.filter(pk__in=updList).update(
                     bucket=None, triagedOnce=False
                 )
+                for (bucket_id, tool_id), entry_ids in removed.items():
+                    BucketAggregate.remove_entries(bucket_id, tool_id, entry_ids)
 
         return inList, outList, inListCount, outListCount, nextOffset
 
-    def optimizeSignature(self, unbucketed_entries):
-        buckets = Bucket.objects.all()
+    @staticmethod
+    def matchEntries(signature, bucket_id, entry_ids):
+        """
+        Match the given crash entries against a signature. Only entries that
+        are unbucketed or in the given bucket are considered.
+
+        @type signature: CrashSignature or str
+        @param signature: The signature to match
+
+        @type bucket_id: int
+        @param bucket_id: The bucket the signature belongs to, if saved
+
+        @type entry_ids: list
+        @param entry_ids: Ids of the entries to match, may contain None
+
+        @rtype: tuple
+        @return: Ids of the unbucketed entries that match and ids of the entries
+                 in the bucket that don't match anymore, in the order given
+        """
+        if not isinstance(signature, CrashSignature):
+            signature = CrashSignature(signature)
 
+        needTest = signature.matchRequiresTest()
+        entries = CrashEntry.objects.filter(
+            models.Q(bucket=None) | models.Q(bucket_id=bucket_id), id__in=entry_ids
+        )
+        entries = entries.select_related(
+            "product", "platform", "os"
+        )  # these are used by getCrashInfo
+        if needTest:
+            entries = entries.select_related("testcase")
+
+        requiredOutputs = signature.getRequiredOutputSources()
+        entries = CrashEntry.deferRawFields(entries, requiredOutputs)
+
+        entries = list(entries)
+        matches = signature.matchesMany(
+            [
+                entry.getCrashInfo(
+                    attachTestcase=needTest, requiredOutputSources=requiredOutputs
+                )
+                for entry in entries
+            ]
+        )
+
+        inIds, outIds = set(), set()
+        for entry, match in zip(entries, matches):
+            if match and entry.bucket_id is None:
+                inIds.add(entry.pk)
+            elif not match and entry.bucket_id is not None:
+                outIds.add(entry.pk)
+
+        return (
+            [pk for pk in entry_ids if pk in inIds],
+            [pk for pk in entry_ids if pk in outIds],
+        )
+
+    def optimizeSignature(self, unbucketed_entries):
         signature = self.getSignature()
         if signature.matchRequiresTest():
             unbucketed_entries.select_related("testcase")
@@ -310,20 +667,23 @@ class Bucket(models.Model):
         optimizedSignature = None
         matchingEntries = []
 
-        # Avoid hitting the database multiple times when looking for the first
-        # entry of a bucket. Keeping these in memory is less expensive.
-        firstEntryPerBucketCache = {}
-
+        entries = list(entries)
         for entry in entries:
             entry.crashinfo = entry.getCrashInfo(
                 attachTestcase=signature.matchRequiresTest(),
                 requiredOutputSources=requiredOutputs,
             )
 
-            # For optimization, disregard any issues that directly match since those
-            # could be incoming new issues and we don't want these to block the
-            # optimization.
-            if signature.matches(entry.crashinfo):
+        # For optimization, disregard any issues that directly match since those
+        # could be incoming new issues and we don't want these to block the
+        # optimization.
+        directMatches = signature.matchesMany([entry.crashinfo for entry in entries])
+
+        # The first entry of each other bucket, loaded once for all candidates
+        otherBucketCrashInfos = None
+
+        for entry, directMatch in zip(entries, directMatches):
+            if directMatch:
                 continue
 
             optimizedSignature = signature.fit(entry.crashinfo)
@@ -332,44 +692,24 @@ class Bucket(models.Model):
                 # buckets. If the signature matches lots of other buckets as well, it is
                 # likely too broad and we should not consider it (or later rate it worse
                 # than others).
-                matchesInOtherBuckets = False
-                nonMatchesInOtherBuckets = 0  # noqa
-                otherMatchingBucketIds = []  # noqa
-                for otherBucket in buckets:
-                    if otherBucket.pk == self.pk:
-                        continue
-
-                    if (
-                        self.bug
-                        and otherBucket.bug
-                        and self.bug.pk == otherBucket.bug.pk
-                    ):
-                        # Allow matches in other buckets if they are both linked to the
-                        # same bug
-                        continue
-
-                    if otherBucket.pk not in firstEntryPerBucketCache:
-                        c = CrashEntry.objects.filter(
-                            bucket=otherBucket
-                        ).select_related("product", "platform", "os")
-                        c = CrashEntry.deferRawFields(c, requiredOutputs)
-                        c = c.first()
-                        firstEntryPerBucketCache[otherBucket.pk] = c
-                        if c:
-                            # Omit testcase for performance reasons for now
-                            firstEntryPerBucketCache[otherBucket.pk] = c.getCrashInfo(
-                                attachTestcase=False,
-                                requiredOutputSources=requiredOutputs,
-                            )
-
-                    firstEntryCrashInfo = firstEntryPerBucketCache[otherBucket.pk]
-                    if firstEntryCrashInfo:
-                        # Omit testcase for performance reasons for now
-                        if optimizedSignature.matches(firstEntryCrashInfo):
-                            matchesInOtherBuckets = True
-                            break
+                if otherBucketCrashInfos is None:
+                    otherBuckets = Bucket.objects.exclude(pk=self.pk)
+                    if self.bug_id is not None:
+                        # Allow matches in other buckets if they are both linked
+                        # to the same bug
+                        otherBuckets = otherBuckets.exclude(bug=self.bug_id)
+                    # Omit testcase for performance reasons for now
+                    otherBucketCrashInfos = [
+                        c.getCrashInfo(
+                            attachTestcase=False,
+                            requiredOutputSources=requiredOutputs,
+                        )
+                        for c in CrashEntry.firstEntriesOfBuckets(
+                            otherBuckets, requiredOutputs
+                        ).values()
+                    ]
 
-                if matchesInOtherBuckets:
+                if any(optimizedSignature.matchesMany(otherBucketCrashInfos)):
                     # Reset, we don't actually have an optimized signature if it's
                     # matching some other bucket as well.
                     optimizedSignature = None
@@ -378,8 +718,14 @@ class Bucket(models.Model):
                         otherEntry.crashinfo = otherEntry.getCrashInfo(
                             attachTestcase=False, requiredOutputSources=requiredOutputs
                         )
-                        if optimizedSignature.matches(otherEntry.crashinfo):
-                            matchingEntries.append(otherEntry)
+                    otherMatches = optimizedSignature.matchesMany(
+                        [otherEntry.crashinfo for otherEntry in entries]
+                    )
+                    matchingEntries = [
+                        otherEntry
+                        for (otherEntry, otherMatch) in zip(entries, otherMatches)
+                        if otherMatch
+                    ]
 
                     # Fallback for when the optimization algorithm failed for some
                     # reason
@@ -391,6 +737,109 @@ class Bucket(models.Model):
         return (optimizedSignature, matchingEntries)
 
 
+class BucketSignatureIndex:
+    """
+    Per-process index of all bucket signatures, used to narrow down the set
+    of buckets that have to be checked when triaging a new crash.
+
+    Buckets saved or deleted in this process are updated incrementally.
+    Buckets created or modified by other processes are picked up by refresh(),
+    which should be called once before looking up a crash or a batch of crashes,
+    through their id and Bucket.lastModified. Since the modification
+    time is set before the change is committed, buckets modified within the
+    last TRIAGE_INDEX_MARGIN seconds before a refresh are checked again on the
+    next one. The index is also rebuilt every TRIAGE_INDEX_MAX_AGE seconds,
+    which catches deleted buckets and changes committed even later.
+    """
+
+    def __init__(self):
+        self.index = SignatureIndex()
+        self.lock = threading.Lock()
+        self.built = None
+        self.maxId = 0
+        self.modifiedSince = None
+        self.dirty = set()
+
+    def invalidate(self, pk=None):
+        with self.lock:
+            if pk is None:
+                self.built = None
+            else:
+                self.dirty.add(pk)
+
+    def remove(self, pk):
+        with self.lock:
+            self.index.remove(pk)
+            self.dirty.discard(pk)
+
+    def _load(self, buckets):
+        for pk, signature in buckets.values_list("pk", "signature"):
+            current = self.index.get(pk)
+            if current is not None and current.rawSignature == signature:
+                continue
+            try:
+                self.index.add(pk, CrashSignature(signature))
+            except RuntimeError as e:
+                LOG.warning("Bucket %d has an invalid signature: %s", pk, e)
+                # Invalid signatures never match, so leaving them out is fine
+                self.index.remove(pk)
+            self.maxId = max(self.maxId, pk)
+
+    def refresh(self):
+        """
+        Update the index with the buckets created or modified since the last
+        refresh.
+        """
+        with self.lock:
+            self._refresh()
+
+    def _refresh(self):
+        maxAge = getattr(settings, "TRIAGE_INDEX_MAX_AGE", 300)
+        now = time.monotonic()
+        modifiedSince = timezone.now() - timedelta(
+            seconds=getattr(settings, "TRIAGE_INDEX_MARGIN", 60)
+        )
+
+        if self.built is None or now - self.built > maxAge:
+            self.index.clear()
+            self.dirty.clear()
+            self.maxId = 0
+            self.built = now
+            self.modifiedSince = modifiedSince
+            self._load(Bucket.objects.all())
+            return
+
+        query = models.Q(pk__gt=self.maxId) | models.Q(
+            lastModified__gte=self.modifiedSince
+        )
+        self.modifiedSince = modifiedSince
+        if self.dirty:
+            query |= models.Q(pk__in=list(self.dirty))
+            for pk in self.dirty:
+                self.index.remove(pk)
+            self.dirty.clear()
+        self._load(Bucket.objects.filter(query))
+
+    def candidates(self, crashInfo):
+        """
+        Return the ids of all buckets that could match the given crash, as of
+        the last refresh. The caller still has to check the actual signatures.
+
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash to find candidate buckets for
+
+        @rtype: set
+        @return: Primary keys of candidate buckets
+        """
+        with self.lock:
+            if self.built is None:
+                self._refresh()
+            return self.index.candidates(crashInfo)
+
+
+BUCKET_INDEX = BucketSignatureIndex()
+
+
 def buckethit_default_range_begin():
     return timezone.now().replace(microsecond=0, second=0, minute=0)
 
@@ -414,12 +863,12 @@ class BucketHit(models.Model):
             counter.save()
 
     @classmethod
-    def increment_count(cls, bucket_id, tool_id, begin):
+    def increment_count(cls, bucket_id, tool_id, begin, value=1):
         begin = begin.replace(microsecond=0, second=0, minute=0)
         counter, _ = cls.objects.get_or_create(
             bucket_id=bucket_id, begin=begin, tool_id=tool_id
         )
-        counter.count += 1
+        counter.count += value
         counter.save()
 
     class Meta:
@@ -431,6 +880,234 @@ class BucketHit(models.Model):
         ]
 
 
+class BucketAggregate(models.Model):
+    """
+    Size and best testcase of the crash entries of a bucket from one tool.
+
+    These are maintained along with BucketHit whenever entries are added to or
+    removed from a bucket, so listing buckets doesn't need to aggregate over
+    all crash entries. The values of a bucket are those of its aggregates for
+    all tools (or the tools in a toolfilter) combined. If they ever drift, the
+    reconcile_bucket_aggregates command recomputes them.
+    """
+
+    bucket = models.ForeignKey(Bucket, on_delete=models.deletion.CASCADE)
+    tool = models.ForeignKey(Tool, on_delete=models.deletion.CASCADE)
+    size = models.IntegerField(default=0)
+    # Best (lowest) testcase quality of the entries
+    quality = models.IntegerField(blank=True, null=True)
+    # Primary key of the entry with the smallest testcase of the best quality,
+    # newest first, and the size of that testcase. Stored as an integer like
+    # BucketWatch.lastCrash, so deleting the entry doesn't touch this row
+    # before the aggregate is updated.
+    bestEntry = models.IntegerField(blank=True, null=True)
+    bestEntrySize = models.IntegerField(blank=True, null=True)
+    # Time of the last update, see Bucket.lastModified
+    lastModified = models.DateTimeField(default=timezone.now, db_index=True)
+
+    @classmethod
+    def add_entries(cls, bucket_id, tool_id, entries):
+        """
+        Account for entries added to a bucket.
+
+        @type bucket_id: int
+        @param bucket_id: The bucket the entries were added to
+
+        @type tool_id: int
+        @param tool_id: The tool of the entries
+
+        @type entries: list
+        @param entries: Tuples of (id, testcase quality, testcase size) of the
+                        entries, quality and size are None without testcase
+        """
+        entries = list(entries)
+        if not entries:
+            return
+        cls.objects.get_or_create(bucket_id=bucket_id, tool_id=tool_id)
+        aggregate = cls.objects.filter(bucket_id=bucket_id, tool_id=tool_id)
+        aggregate.update(
+            size=models.F("size") + len(entries), lastModified=timezone.now()
+        )
+
+        best = min(
+            (
+                (quality, size, -pk)
+                for (pk, quality, size) in entries
+                if quality is not None
+            ),
+            default=None,
+        )
+        if best is not None:
+            (quality, size, pk) = (best[0], best[1], -best[2])
+            # Only replace the best entry if the new one is better, checked in
+            # the update itself in case entries are added concurrently
+            aggregate.filter(
+                models.Q(quality=None)
+                | models.Q(bestEntry=None)
+                | models.Q(quality__gt=quality)
+                | models.Q(quality=quality, bestEntrySize__gt=size)
+                | models.Q(quality=quality, bestEntrySize=size, bestEntry__lt=pk)
+            ).update(quality=quality, bestEntry=pk, bestEntrySize=size)
+
+    @classmethod
+    def remove_entries(cls, bucket_id, tool_id, entry_ids):
+        """
+        Account for entries removed from a bucket, after they were removed.
+
+        @type bucket_id: int
+        @param bucket_id: The bucket the entries were removed from
+
+        @type tool_id: int
+        @param tool_id: The tool of the entries
+
+        @type entry_ids: list
+        @param entry_ids: Primary keys of the entries
+        """
+        entry_ids = list(entry_ids)
+        if not entry_ids:
+            return
+        aggregate = cls.objects.filter(bucket_id=bucket_id, tool_id=tool_id)
+        aggregate.filter(size__gte=len(entry_ids)).update(
+            size=models.F("size") - len(entry_ids), lastModified=timezone.now()
+        )
+        if aggregate.filter(bestEntry__in=entry_ids).exists():
+            cls.refresh_best(bucket_id, tool_id)
+
+    @classmethod
+    def refresh_best(cls, bucket_id, tool_id):
+        """
+        Recompute the best testcase of the entries of a bucket from one tool,
+        e.g. after the best entry was removed or a testcase quality changed.
+
+        @type bucket_id: int
+        @param bucket_id: The bucket of the entries
+
+        @type tool_id: int
+        @param tool_id: The tool of the entries
+        """
+        best = (
+            CrashEntry.objects.filter(
+                bucket_id=bucket_id, tool_id=tool_id, testcase__isnull=False
+            )
+            .order_by("testcase__quality", "testcase__size", "-id")
+            .values_list("testcase__quality", "id", "testcase__size")
+            .first()
+        )
+        (quality, bestEntry, bestEntrySize) = best or (None, None, None)
+        cls.objects.filter(bucket_id=bucket_id, tool_id=tool_id).update(
+            quality=quality,
+            bestEntry=bestEntry,
+            bestEntrySize=bestEntrySize,
+            lastModified=timezone.now(),
+        )
+
+    @classmethod
+    def add_entry_ids(cls, bucket_id, entry_ids):
+        """
+        Account for entries added to a bucket, given only their primary keys.
+
+        @type bucket_id: int
+        @param bucket_id: The bucket the entries were added to
+
+        @type entry_ids: list
+        @param entry_ids: Primary keys of the entries
+        """
+        byTool = {}
+        for tool_id, pk, quality, size in CrashEntry.objects.filter(
+            pk__in=entry_ids
+        ).values_list("tool_id", "id", "testcase__quality", "testcase__size"):
+            byTool.setdefault(tool_id, []).append((pk, quality, size))
+        for tool_id, entries in byTool.items():
+            cls.add_entries(bucket_id, tool_id, entries)
+
+    @classmethod
+    def for_buckets(cls, bucket_ids, tools=None):
+        """
+        Combine the aggregates of each bucket.
+
+        @type bucket_ids: list
+        @param bucket_ids: Primary keys of the buckets, all buckets if None
+
+        @type tools: list
+        @param tools: Only include entries from these tools, if given
+
+        @rtype: dict
+        @return: Tuples of (size, quality, best entry, best entry testcase size)
+                 by bucket id, for buckets with entries
+        """
+        aggregates = cls.objects.filter(size__gt=0)
+        if bucket_ids is not None:
+            aggregates = aggregates.filter(bucket_id__in=bucket_ids)
+        if tools is not None:
+            aggregates = aggregates.filter(tool__in=tools)
+
+        def sortKey(aggregate):
+            # Best quality first, then the smallest testcase, then the newest
+            (_, quality, bestEntry, bestEntrySize) = aggregate
+            if quality is None:
+                return (1,)
+            return (0, quality, bestEntrySize or 0, -(bestEntry or 0))
+
+        result = {}
+        for bucket_id, *aggregate in aggregates.values_list(
+            "bucket_id", "size", "quality", "bestEntry", "bestEntrySize"
+        ):
+            combined = result.get(bucket_id)
+            if combined is None:
+                result[bucket_id] = tuple(aggregate)
+                continue
+            size = combined[0] + aggregate[0]
+            if sortKey(aggregate) < sortKey(combined):
+                combined = aggregate
+            result[bucket_id] = (size, *combined[1:])
+
+        return result
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bucket", "tool"],
+                name="unique_bucketaggregate_per_tool",
+            ),
+        ]
+
+
+class ToolHit(models.Model):
+    """
+    Number of crash entries of a tool created in one hour, including entries
+    that are not in a bucket. Like BucketHit, these are maintained whenever
+    entries are added or removed, so the crash statistics don't need to count
+    the entries of the last week.
+    """
+
+    tool = models.ForeignKey(Tool, on_delete=models.deletion.CASCADE)
+    begin = models.DateTimeField(default=buckethit_default_range_begin)
+    count = models.IntegerField(default=0)
+
+    @classmethod
+    def decrement_count(cls, tool_id, begin):
+        begin = begin.replace(microsecond=0, second=0, minute=0)
+        cls.objects.filter(tool_id=tool_id, begin=begin, count__gt=0).update(
+            count=models.F("count") - 1
+        )
+
+    @classmethod
+    def increment_count(cls, tool_id, begin, value=1):
+        begin = begin.replace(microsecond=0, second=0, minute=0)
+        cls.objects.get_or_create(tool_id=tool_id, begin=begin)
+        cls.objects.filter(tool_id=tool_id, begin=begin).update(
+            count=models.F("count") + value
+        )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["tool", "begin"],
+                name="unique_toolhits_per_period",
+            ),
+        ]
+
+
 class CrashHit(models.Model):
     lastUpdate = models.DateTimeField(default=timezone.now)
     tool = models.ForeignKey(Tool, on_delete=models.deletion.CASCADE)
@@ -494,15 +1171,37 @@ class CrashEntry(models.Model):
         # deserializeFields method if you need this data.
 
         self._original_bucket = None
+        self._original_created = None
+
+        # Set when the entry is triaged together with others after it is saved
+        self.deferTriage = False
         super().__init__(*args, **kwargs)
 
     @classmethod
     def from_db(cls, db, field_names, values):
         instance = super().from_db(db, field_names, values)
         instance._original_bucket = instance.bucket_id
+        instance._original_created = instance.created
         return instance
 
     def save(self, *args, **kwargs):
+        modified = self.prepareSave()
+
+        # required in Django 4.2+
+        if "update_fields" in kwargs and kwargs["update_fields"] is not None:
+            kwargs["update_fields"] = modified.union(kwargs["update_fields"])
+
+        super().save(*args, **kwargs)
+
+    def prepareSave(self):
+        """
+        Populate and sanitize the fields derived from the crash data before the
+        entry is written to the database. This is done by save(), but must be
+        called explicitly for entries created with bulk_create().
+
+        @rtype: set
+        @return: Names of the fields that were modified
+        """
         modified = set()
 
         if self.pk is None and not getattr(settings, "DB_ISUTF8MB4", False):
@@ -529,10 +1228,14 @@ class CrashEntry(models.Model):
                 self.rawCrashData = new_rawCrashData
                 modified.add("rawCrashData")
 
+            if modified:
+                # The crash must be parsed again from the sanitized output
+                self.cachedCrashInfo = None
+
         if not self.cachedCrashInfo:
-            # Serialize the important fields of the CrashInfo class into a JSON blob
+            # Serialize the important fields of the CrashInfo class into a blob
             crashInfo = self.getCrashInfo()
-            self.cachedCrashInfo = json.dumps(crashInfo.toCacheObject())
+            self.cachedCrashInfo = self.encodeCachedCrashInfo(crashInfo)
             modified.add("cachedCrashInfo")
 
         # Reserialize data, then call regular save method
@@ -574,11 +1277,7 @@ class CrashEntry(models.Model):
             self.shortSignature = self.shortSignature[:255]
             modified.add("shortSignature")
 
-        # required in Django 4.2+
-        if "update_fields" in kwargs and kwargs["update_fields"] is not None:
-            kwargs["update_fields"] = modified.union(kwargs["update_fields"])
-
-        super().save(*args, **kwargs)
+        return modified
 
     def deserializeFields(self):
         if self.args:
@@ -592,25 +1291,56 @@ class CrashEntry(models.Model):
             metadataDict = json.loads(self.metadata)
             self.metadataList = [f"{s}={metadataDict[s]}" for s in metadataDict.keys()]
 
+    @staticmethod
+    def encodeCachedCrashInfo(crashInfo):
+        """
+        Serialize the cache object of a crash for the cachedCrashInfo field.
+        The compact cache object is packed with msgpack and base64 encoded,
+        which is much cheaper to load than the JSON used by older versions.
+
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash to serialize
+
+        @rtype: str
+        @return: Serialized cache object
+        """
+        packed = msgpack.packb(crashInfo.toCompactCacheObject())
+        return base64.b64encode(packed).decode("ascii")
+
+    def getCachedCrashInfo(self):
+        """
+        Load the cache object stored in the cachedCrashInfo field.
+
+        @rtype: list or dict
+        @return: Cache object to pass to CrashInfo.fromRawCrashData, or None
+        """
+        if not self.cachedCrashInfo:
+            return None
+        if self.cachedCrashInfo.startswith("{"):
+            # JSON cache object stored by older versions
+            return json.loads(self.cachedCrashInfo)
+        return msgpack.unpackb(base64.b64decode(self.cachedCrashInfo))
+
     def getCrashInfo(
         self,
         attachTestcase=False,
         requiredOutputSources=("stdout", "stderr", "crashdata"),
     ):
-        # TODO: This should be cached at some level
         # TODO: Need to include environment and program arguments here
+        product = self.getDimension("product")
         configuration = ProgramConfiguration(
-            self.product.name, self.platform.name, self.os.name, self.product.version
+            product.name,
+            self.getDimension("platform").name,
+            self.getDimension("os").name,
+            product.version,
         )
 
-        cachedCrashInfo = None
-        if self.cachedCrashInfo:
-            cachedCrashInfo = json.loads(self.cachedCrashInfo)
+        cachedCrashInfo = self.getCachedCrashInfo()
 
         # We can skip loading raw output fields from the database iff
         #   1) we know we don't need them for matching *and*
         #   2) we already have the crash data cached
-        (rawStdout, rawStderr, rawCrashData) = (None, None, None)
+        rawStdout, rawStderr, rawCrashData = (None, None, None)
         if cachedCrashInfo is None or "stdout" in requiredOutputSources:
             rawStdout = self.rawStdout
         if cachedCrashInfo is None or "stderr" in requiredOutputSources:
@@ -626,11 +1356,39 @@ class CrashEntry(models.Model):
             cacheObject=cachedCrashInfo,
         )
 
-        if attachTestcase and self.testcase is not None and not self.testcase.isBinary:
+        if attachTestcase:
+            self.attachTestcase(crashInfo)
+
+        return crashInfo
+
+    def attachTestcase(self, crashInfo):
+        """
+        Attach the testcase of this entry to a crash for matching signatures
+        that require the testcase. Binary testcases are not attached.
+
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash of this entry
+        """
+        if self.testcase is not None and not self.testcase.isBinary:
             self.testcase.loadTest()
             crashInfo.testcase = self.testcase.content
 
-        return crashInfo
+    def getDimension(self, name):
+        """
+        Get one of the lookup rows referenced by this entry, e.g. the product,
+        without a query if it's neither loaded already nor cached.
+
+        @type name: str
+        @param name: Name of the foreign key field
+
+        @return: The referenced model instance
+        """
+        field = self._meta.get_field(name)
+        if field.is_cached(self):
+            return field.get_cached_value(self)
+        obj = DIMENSION_CACHE.get(field.related_model, getattr(self, field.attname))
+        field.set_cached_value(self, obj)
+        return obj
 
     def reparseCrashInfo(self):
         # Purges cached crash information and then forces a reparsing
@@ -641,6 +1399,7 @@ class CrashEntry(models.Model):
         # has changed or the implementation parsing it was updated.
         self.cachedCrashInfo = None
         crashInfo = self.getCrashInfo()
+        self.cachedCrashInfo = self.encodeCachedCrashInfo(crashInfo)
         if crashInfo.crashAddress is not None:
             self.crashAddress = f"0x{crashInfo.crashAddress:x}"
         self.shortSignature = crashInfo.createShortSignature()
@@ -649,7 +1408,8 @@ class CrashEntry(models.Model):
         # this bucket, otherwise remove it.
         if self.bucket is not None:
             sig = self.bucket.getSignature()
-            crashInfo = self.getCrashInfo(attachTestcase=sig.matchRequiresTest())
+            if sig.matchRequiresTest():
+                self.attachTestcase(crashInfo)
             if not sig.matches(crashInfo):
                 self.bucket = None
 
@@ -672,6 +1432,33 @@ class CrashEntry(models.Model):
             queryset = queryset.defer("rawCrashData")
         return queryset
 
+    @staticmethod
+    def firstEntriesOfBuckets(buckets, requiredOutputSources=()):
+        """
+        Load the first crash entry of each of the given buckets in one query.
+
+        @type buckets: QuerySet
+        @param buckets: The buckets to load the first entry of
+
+        @type requiredOutputSources: iterable
+        @param requiredOutputSources: Raw fields to load, see L{deferRawFields}
+
+        @rtype: dict
+        @return: The first crash entry by bucket id, for buckets with entries
+        """
+        firstIds = (
+            CrashEntry.objects.filter(bucket__in=buckets)
+            .order_by()
+            .values("bucket")
+            .annotate(firstId=models.Min("id"))
+            .values("firstId")
+        )
+        entries = CrashEntry.objects.filter(pk__in=firstIds).select_related(
+            "product", "platform", "os"
+        )
+        entries = CrashEntry.deferRawFields(entries, requiredOutputSources)
+        return {entry.bucket_id: entry for entry in entries}
+
 
 # These post_delete handlers ensure that the corresponding testcase
 # is also deleted when the CrashEntry is gone. It also explicitly
@@ -680,36 +1467,108 @@ class CrashEntry(models.Model):
 def CrashEntry_delete(sender, instance, **kwargs):
     if instance.testcase:
         instance.testcase.delete(False)
+    ToolHit.decrement_count(instance.tool_id, instance.created)
     if instance.bucket_id is not None:
         BucketHit.decrement_count(
             instance.bucket_id, instance.tool_id, instance.created
         )
+        BucketAggregate.remove_entries(
+            instance.bucket_id, instance.tool_id, [instance.pk]
+        )
+
+
+@receiver(post_save, sender=Bucket)
+def Bucket_save(sender, instance, **kwargs):
+    BUCKET_INDEX.invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=Bucket)
+def Bucket_delete(sender, instance, **kwargs):
+    BUCKET_INDEX.remove(instance.pk)
+
+
+@receiver(post_save, sender=Bug)
+def Bug_save(sender, instance, created, **kwargs):
+    # The external id is part of the exported metadata of the linked buckets
+    if not created:
+        Bucket.objects.filter(bug=instance).update(lastModified=timezone.now())
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=OS)
+@receiver(post_save, sender=Platform)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Tool)
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=OS)
+@receiver(post_delete, sender=Platform)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Tool)
+def Dimension_changed(sender, instance, **kwargs):
+    DIMENSION_CACHE.invalidate(sender, instance.pk)
 
 
 @receiver(post_delete, sender=TestCase)
 def TestCase_delete(sender, instance, **kwargs):
+    # The file is shared by all testcases with the same content, only delete it
+    # once the last one is gone
     if instance.test:
-        instance.test.delete(False)
+        TestCase.releaseTest(instance.test.name, instance.sha1)
 
 
 @receiver(post_save, sender=CrashEntry)
 def CrashEntry_save(sender, instance, created, **kwargs):
     if getattr(settings, "USE_CELERY", None):
-        if created and not instance.triagedOnce:
+        if created and not instance.triagedOnce and not instance.deferTriage:
             triage_new_crash.delay(instance.pk)
 
+    if created:
+        ToolHit.increment_count(instance.tool_id, instance.created)
+    elif (
+        instance._original_created is not None
+        and instance.created != instance._original_created
+    ):
+        # move the hits to the new creation time
+        ToolHit.decrement_count(instance.tool_id, instance._original_created)
+        ToolHit.increment_count(instance.tool_id, instance.created)
+        if instance._original_bucket is not None:
+            BucketHit.decrement_count(
+                instance._original_bucket,
+                instance.tool_id,
+                instance._original_created,
+            )
+            BucketHit.increment_count(
+                instance._original_bucket, instance.tool_id, instance.created
+            )
+    instance._original_created = instance.created
+
     if instance.bucket_id != instance._original_bucket:
         if instance._original_bucket is not None:
             # remove BucketHit for old bucket/tool
             BucketHit.decrement_count(
                 instance._original_bucket, instance.tool_id, instance.created
             )
+            BucketAggregate.remove_entries(
+                instance._original_bucket, instance.tool_id, [instance.pk]
+            )
 
         if instance.bucket is not None:
             # add BucketHit for new bucket
             BucketHit.increment_count(
                 instance.bucket_id, instance.tool_id, instance.created
             )
+            testcase = instance.testcase
+            BucketAggregate.add_entries(
+                instance.bucket_id,
+                instance.tool_id,
+                [
+                    (
+                        instance.pk,
+                        testcase and testcase.quality,
+                        testcase and testcase.size,
+                    )
+                ],
+            )
 
         if instance.bucket is not None:
             notify.send(
@@ -725,6 +1584,9 @@ def CrashEntry_save(sender, instance, created, **kwargs):
                 ),
             )
 
+        # Saving the entry again must not count it twice
+        instance._original_bucket = instance.bucket_id
+
 
 class BugzillaTemplateMode(Enum):
     Bug = "bug"
@@ -810,7 +1672,7 @@ class User(models.Model):
 
     @staticmethod
     def get_or_create_restricted(request_user):
-        (user, created) = User.objects.get_or_create(user=request_user)
+        user, created = User.objects.get_or_create(user=request_user)
         if created and getattr(settings, "USERS_RESTRICTED_BY_DEFAULT", False):
             user.restricted = True
             user.save()
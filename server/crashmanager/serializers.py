@@ -1,9 +1,8 @@
 import base64
-import hashlib
 
 from django.conf import settings
 from django.core.exceptions import MultipleObjectsReturned  # noqa
-from django.core.files.base import ContentFile
+from django.db import connection, transaction
 from django.forms import widgets  # noqa
 from django.urls import reverse
 from notifications.models import Notification
@@ -12,6 +11,7 @@ from rest_framework.exceptions import APIException
 
 from covmanager.models import Collection
 from crashmanager.models import (
+    DIMENSION_CACHE,
     OS,
     Bucket,
     Bug,
@@ -23,6 +23,7 @@ from crashmanager.models import (
     Product,
     TestCase,
     Tool,
+    ToolHit,
 )
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Signatures.CrashInfo import CrashInfo
@@ -33,6 +34,64 @@ class InvalidArgumentException(APIException):
     status_code = 400
 
 
+class TestCaseNotFoundException(APIException):
+    status_code = 404
+    default_detail = "No testcase with the given hash exists, upload it instead."
+
+
+class CrashEntryListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        """
+        Create several CrashEntry instances at once. The entries are inserted
+        with a single query if the database returns their primary keys, and
+        triaged together in one task instead of one task per entry.
+        """
+        lookups = {}
+        entries = []
+        try:
+            with transaction.atomic():
+                for attrs in validated_data:
+                    entries.append(CrashEntry(**self.child.prepare(attrs, lookups)))
+                if connection.features.can_return_rows_from_bulk_insert:
+                    self._bulk_insert(entries)
+                else:
+                    # Without the primary keys of bulk inserted entries (e.g. on
+                    # MySQL), save them one by one but still triage them together
+                    for entry in entries:
+                        entry.deferTriage = True
+                        entry.save()
+        except:  # noqa
+            for entry in entries:
+                if entry.testcase is not None:
+                    entry.testcase.delete()
+            raise
+
+        if getattr(settings, "USE_CELERY", None):
+            from crashmanager.tasks import triage_new_crashes_batch
+
+            entry_ids = [entry.pk for entry in entries]
+            transaction.on_commit(lambda: triage_new_crashes_batch.delay(entry_ids))
+
+        return entries
+
+    @staticmethod
+    def _bulk_insert(entries):
+        for entry in entries:
+            entry.prepareSave()
+        CrashEntry.objects.bulk_create(entries)
+
+        # bulk_create() doesn't send post_save, so count the entries here
+        hits = {}
+        for entry in entries:
+            key = (
+                entry.tool_id,
+                entry.created.replace(microsecond=0, second=0, minute=0),
+            )
+            hits[key] = hits.get(key, 0) + 1
+        for (tool_id, begin), count in hits.items():
+            ToolHit.increment_count(tool_id, begin, value=count)
+
+
 class CrashEntrySerializer(serializers.ModelSerializer):
     # We need to redefine several fields explicitly because we flatten our
     # foreign keys into these fields instead of using primary keys, hyperlinks
@@ -57,6 +116,13 @@ class CrashEntrySerializer(serializers.ModelSerializer):
     testcase_isbinary = serializers.BooleanField(
         source="testcase.isBinary", required=False, default=False
     )
+    testcase_sha1 = serializers.RegexField(
+        r"^[0-9a-f]{40}$", source="testcase.sha1", required=False, write_only=True
+    )
+    # Text testcases that aren't valid UTF-8 are sent base64 encoded
+    testcase_encoding = serializers.ChoiceField(
+        ("base64",), required=False, write_only=True
+    )
 
     def __init__(self, *args, **kwargs):
         include_raw = kwargs.pop("include_raw", True)
@@ -81,6 +147,8 @@ class CrashEntrySerializer(serializers.ModelSerializer):
             "testcase_size",
             "testcase_quality",
             "testcase_isbinary",
+            "testcase_sha1",
+            "testcase_encoding",
             "platform",
             "product",
             "product_version",
@@ -96,6 +164,7 @@ class CrashEntrySerializer(serializers.ModelSerializer):
         )
         ordering = ["-id"]
         read_only_fields = ("bucket", "id", "shortSignature", "crashAddress")
+        list_serializer_class = CrashEntryListSerializer
 
     def create(self, attrs):
         """
@@ -104,17 +173,50 @@ class CrashEntrySerializer(serializers.ModelSerializer):
         platform, os and client and create the foreign objects on the fly
         if they don't exist in our database yet.
         """
+        attrs = self.prepare(attrs)
+
+        try:
+            # Create our CrashEntry instance
+            return super().create(attrs)
+        except:  # noqa
+            if attrs["testcase"] is not None:
+                attrs["testcase"].delete()
+            raise
+
+    def prepare(self, attrs, lookups=None):
+        """
+        Resolve the foreign relationships, parse the crash data and store the
+        testcase for a CrashEntry to be created from the given values.
+
+        @type attrs: dict
+        @param attrs: Validated values for the CrashEntry
+
+        @type lookups: dict
+        @param lookups: Cache of foreign objects already looked up, used to
+                        avoid repeated queries when creating several entries
+
+        @rtype: dict
+        @return: The values to create the CrashEntry with
+        """
         missing_keys = {"rawStdout", "rawStderr", "rawCrashData"} - set(attrs.keys())
         if missing_keys:
             raise InvalidArgumentException(
                 {key: ["This field is required."] for key in missing_keys}
             )
 
-        attrs["product"] = Product.objects.get_or_create(**attrs["product"])[0]
-        attrs["platform"] = Platform.objects.get_or_create(**attrs["platform"])[0]
-        attrs["os"] = OS.objects.get_or_create(**attrs["os"])[0]
-        attrs["client"] = Client.objects.get_or_create(**attrs["client"])[0]
-        attrs["tool"] = Tool.objects.get_or_create(**attrs["tool"])[0]
+        if lookups is None:
+            lookups = {}
+        for field, model in (
+            ("product", Product),
+            ("platform", Platform),
+            ("os", OS),
+            ("client", Client),
+            ("tool", Tool),
+        ):
+            key = (field, tuple(sorted(attrs[field].items())))
+            if key not in lookups:
+                lookups[key] = DIMENSION_CACHE.getOrCreate(model, **attrs[field])
+            attrs[field] = lookups[key]
 
         # Parse the incoming data using the crash signature package from FTB
         configuration = ProgramConfiguration(
@@ -134,48 +236,59 @@ class CrashEntrySerializer(serializers.ModelSerializer):
         attrs["shortSignature"] = attrs["shortSignature"][
             : CrashEntry._meta.get_field("shortSignature").max_length
         ]
+        # Store the parsed crash with the entry right away, so saving it doesn't
+        # parse the raw output a second time
+        attrs["cachedCrashInfo"] = CrashEntry.encodeCachedCrashInfo(crashInfo)
 
-        # If a testcase is supplied, create a testcase object and store it
-        if "test" in attrs["testcase"]:
+        # If a testcase is supplied, create a testcase object and store it. If
+        # only the hash of the testcase is supplied, it must already be stored.
+        if "test" in attrs["testcase"] or "sha1" in attrs["testcase"]:
             testcase = attrs["testcase"]
             testcase_ext = attrs.pop("testcase_ext", None)
+            testcase_encoding = attrs.pop("testcase_encoding", None)
             testcase_size = testcase.get("size", 0)
             testcase_quality = testcase.get("quality", 0)
             testcase_isbinary = testcase.get("isBinary", False)
-            testcase = testcase["test"]
 
             if testcase_ext is None:
                 raise RuntimeError(
                     "Must provide testcase extension when providing testcase"
                 )
 
-            h = hashlib.new("sha1")
-            if testcase_isbinary:
-                testcase = base64.b64decode(testcase)
-                h.update(testcase)
-            else:
-                h.update(repr(testcase).encode("utf-8"))
-
-            if not testcase_size:
-                testcase_size = len(testcase)
-
-            dbobj = TestCase(
-                quality=testcase_quality, isBinary=testcase_isbinary, size=testcase_size
-            )
-            dbobj.test.save(f"{h.hexdigest()}.{testcase_ext}", ContentFile(testcase))
-            dbobj.save()
+            dbobj = TestCase(quality=testcase_quality, isBinary=testcase_isbinary)
+            # The testcase sharing the file stays locked until the new one is saved
+            with transaction.atomic():
+                if "test" in testcase:
+                    testcase = testcase["test"]
+                    if testcase_isbinary or testcase_encoding == "base64":
+                        testcase = base64.b64decode(testcase)
+                    dbobj.storeTest(testcase, testcase_ext)
+                    if not testcase_size:
+                        testcase_size = len(testcase)
+                else:
+                    name = dbobj.test.field.generate_filename(
+                        dbobj, f"{testcase['sha1']}.{testcase_ext}"
+                    )
+                    existing = TestCase.lockTest(name, testcase["sha1"])
+                    if existing is None or not existing.test.storage.exists(
+                        existing.test.name
+                    ):
+                        raise TestCaseNotFoundException()
+                    dbobj.sha1 = existing.sha1
+                    dbobj.test.name = existing.test.name
+                    dbobj.isBinary = existing.isBinary
+                    if not testcase_size:
+                        testcase_size = existing.size
+
+                dbobj.size = testcase_size
+                dbobj.save()
             attrs["testcase"] = dbobj
         else:
             attrs["testcase"] = None
             attrs.pop("testcase_ext", None)
+            attrs.pop("testcase_encoding", None)
 
-        try:
-            # Create our CrashEntry instance
-            return super().create(attrs)
-        except:  # noqa
-            if attrs["testcase"] is not None:
-                attrs["testcase"].delete()
-            raise
+        return attrs
 
 
 class BucketSerializer(serializers.ModelSerializer):
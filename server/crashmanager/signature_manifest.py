@@ -0,0 +1,118 @@
+import glob
+import hashlib
+import json
+import os
+from tempfile import mkstemp
+from zipfile import ZipFile
+
+from django.conf import settings
+
+# The manifest lists all files in the exported signatures.zip with the SHA1
+# of their contents. Each export increments the generation, and the manifests
+# of the last generations are kept so clients can request only the changes
+# since the generation they have.
+MANIFEST_NAME = "signatures.manifest.json"
+
+
+def manifest_path(generation=None):
+    storage = getattr(settings, "SIGNATURE_STORAGE", None)
+    if generation is None:
+        return os.path.join(storage, MANIFEST_NAME)
+    return os.path.join(storage, "signatures.manifest.%d.json" % generation)
+
+
+def load_manifest(generation=None):
+    """
+    Load the current signatures manifest or the one of an older generation.
+
+    @type generation: int
+    @param generation: Generation to load, or None for the current one
+
+    @rtype: dict
+    @return: Manifest with "generation" and "files" keys, or None if not found
+    """
+    try:
+        with open(manifest_path(generation)) as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(path, obj):
+    fd, tmpf = mkstemp(dir=os.path.dirname(path), prefix="fm-manifest-")
+    with os.fdopen(fd, "w") as fp:
+        json.dump(obj, fp)
+    os.chmod(tmpf, 0o644)
+    os.replace(tmpf, path)
+
+
+def hash_zip_contents(zipPath):
+    files = {}
+    with ZipFile(zipPath) as zipFile:
+        for name in zipFile.namelist():
+            files[name] = hashlib.sha1(zipFile.read(name)).hexdigest()
+    return files
+
+
+def update_manifest(files, exported=None):
+    """
+    Store the manifest for a new export generation and drop manifests that
+    are older than SIGNATURE_DELTA_HISTORY generations.
+
+    @type files: dict
+    @param files: Mapping of file names in the export to the SHA1 of their content
+
+    @type exported: datetime
+    @param exported: Time up to which the export includes all bucket changes,
+                     used to export only the buckets changed since
+
+    @rtype: int
+    @return: The new generation
+    """
+    previous = load_manifest()
+    generation = 1 if previous is None else previous["generation"] + 1
+
+    manifest = {"generation": generation, "files": files}
+    if exported is not None:
+        manifest["exported"] = exported.isoformat()
+    _write_json(manifest_path(generation), manifest)
+    _write_json(manifest_path(), manifest)
+
+    history = getattr(settings, "SIGNATURE_DELTA_HISTORY", 48)
+    for path in glob.glob(manifest_path(0).replace(".0.", ".*.")):
+        try:
+            old = int(path.rsplit(".", 2)[-2])
+        except ValueError:
+            continue
+        if old <= generation - history:
+            os.remove(path)
+
+    return generation
+
+
+def manifest_delta(since):
+    """
+    Compute the changes of the current export relative to an older generation.
+
+    @type since: int
+    @param since: The generation the client has
+
+    @rtype: tuple
+    @return: Tuple of the current manifest, a list of changed or added files and
+             a list of removed files. None if either manifest is not available.
+    """
+    current = load_manifest()
+    if current is None:
+        return None
+
+    old = load_manifest(since)
+    if old is None:
+        return None
+
+    changed = [
+        name
+        for name, digest in sorted(current["files"].items())
+        if old["files"].get(name) != digest
+    ]
+    removed = sorted(set(old["files"]) - set(current["files"]))
+    return (current, changed, removed)
@@ -7,3 +7,17 @@ from . import cron  # noqa ensure cron tasks get registered
 @app.task(ignore_result=True)
 def triage_new_crash(pk):
     call_command("triage_new_crash", pk)
+
+
+@app.task(ignore_result=True)
+def triage_new_crashes_batch(entry_ids):
+    from .management.commands.triage_new_crashes import triage_entries
+
+    triage_entries(entry_ids)
+
+
+@app.task
+def reassign_match(signature, bucket_id, entry_ids):
+    from .models import Bucket
+
+    return Bucket.matchEntries(signature, bucket_id, entry_ids)
@@ -17,6 +17,7 @@ from django.contrib.contenttypes.models import ContentType
 from django.core.files.base import ContentFile
 
 from crashmanager.models import (
+    DIMENSION_CACHE,
     OS,
     Bucket,
     BucketWatch,
@@ -34,6 +35,7 @@ from crashmanager.models import (
     Tool,
 )
 from crashmanager.models import User as cmUser
+from crashmanager.views import CRASH_STATS_CACHE
 
 LOG = logging.getLogger("fm.crashmanager.tests")
 
@@ -61,6 +63,18 @@ def _create_user(
     return user.user
 
 
+@pytest.fixture(autouse=True)
+def dimension_cache():
+    """Don't keep lookup rows cached across tests, the database is reset"""
+    DIMENSION_CACHE.clear()
+
+
+@pytest.fixture(autouse=True)
+def crash_stats_cache():
+    """Don't reuse crash statistics across tests, the database is reset"""
+    CRASH_STATS_CACHE.clear()
+
+
 @pytest.fixture
 def crashmanager_test(db):  # pylint: disable=invalid-name,unused-argument
     """Common testcase class for all crashmanager unittests"""
@@ -9,12 +9,15 @@ License, v. 2.0. If a copy of the MPL was not distributed with this
 file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
+import json
 import logging
 
 import pytest
 import requests
 from django.urls import reverse
 
+from crashmanager.models import DIMENSION_CACHE, CrashEntry, Tool
+
 from . import assert_contains
 
 LOG = logging.getLogger("fm.crashmanager.tests.crashes")
@@ -90,3 +93,61 @@ def test_delete_testcase_crash(cm):
         raise AssertionError(
             f"file should have been deleted with CrashInfo: {test_file!r}"
         )
+
+
+def test_crash_cached_crash_info(cm):
+    """Crash information is cached in the compact format and restored from it"""
+    stderr = "\n".join(
+        [
+            "==1==ERROR: AddressSanitizer: SEGV on unknown address 0x000000000010",
+            "    #0 0x4c9ed1 in foo /src/foo.cpp:1:2",
+            "    #1 0x4c9ed2 in bar /src/bar.cpp:3:4",
+        ]
+    )
+    crash = cm.create_crash(stderr=stderr)
+    assert not crash.cachedCrashInfo.startswith("{")
+
+    crashInfo = crash.getCrashInfo(requiredOutputSources=())
+    assert crashInfo.backtrace == ["foo", "bar"]
+    assert crashInfo.crashAddress == 0x10
+    assert crashInfo.rawStderr == []
+
+    # JSON cache objects stored by older versions can still be used
+    crash.cachedCrashInfo = json.dumps(crashInfo.toCacheObject())
+    crashInfo = crash.getCrashInfo(requiredOutputSources=())
+    assert crashInfo.backtrace == ["foo", "bar"]
+    assert crashInfo.crashAddress == 0x10
+
+
+def test_crash_dimension_cache(
+    cm, django_assert_num_queries, django_capture_on_commit_callbacks
+):
+    """Lookup rows are cached once committed and invalidated when changed"""
+    # rows are only cached once the transaction is committed
+    tool = DIMENSION_CACHE.getOrCreate(Tool, name="tool1")
+    with django_assert_num_queries(1):
+        assert DIMENSION_CACHE.getOrCreate(Tool, name="tool1") == tool
+
+    with django_capture_on_commit_callbacks(execute=True):
+        tool = DIMENSION_CACHE.getOrCreate(Tool, name="tool1")
+    with django_assert_num_queries(0):
+        assert DIMENSION_CACHE.getOrCreate(Tool, name="tool1") is tool
+        assert DIMENSION_CACHE.get(Tool, tool.pk) is tool
+
+    # saving a row invalidates it
+    tool.name = "tool2"
+    tool.save()
+    with django_assert_num_queries(1):
+        assert DIMENSION_CACHE.get(Tool, tool.pk).name == "tool2"
+    assert DIMENSION_CACHE.getOrCreate(Tool, name="tool1").pk != tool.pk
+
+    # crash information is loaded without querying the lookup rows
+    crash = cm.create_crash(stderr="Assertion failure: foo")
+    with django_capture_on_commit_callbacks(execute=True):
+        CrashEntry.objects.get(pk=crash.pk).getCrashInfo()
+    crash = CrashEntry.objects.get(pk=crash.pk)
+    with django_assert_num_queries(0):
+        crashInfo = crash.getCrashInfo()
+    assert crashInfo.configuration.product == "testproduct"
+    assert crashInfo.configuration.platform == "testplatform"
+    assert crashInfo.configuration.os == "testos"
@@ -9,6 +9,9 @@ License, v. 2.0. If a copy of the MPL was not distributed with this
 file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
+import base64
+import hashlib
+import importlib
 import json
 import logging
 import os.path
@@ -18,10 +21,14 @@ from unittest.mock import Mock, patch
 
 import pytest
 import requests
+from django.apps import apps as django_apps
+from django.core.files.base import ContentFile
 from django.utils.http import urlencode
 
 from crashmanager.models import CrashEntry
 from crashmanager.models import TestCase as cmTestCase
+from crashmanager.models import ToolHit
+from FTB.Signatures.CrashInfo import GDBCrashInfo
 
 # What should be allowed:
 #
@@ -498,6 +505,31 @@ def test_rest_crashes_report_crash_long(api_client, user_normal):
     _compare_created_data_to_crash(data, crash, crash_address="0xf7056fff")
 
 
+def test_rest_crashes_report_crash_parsed_once(api_client, user_normal, mocker):
+    """test that the crash data is only parsed once when reporting a crash"""
+    data = {
+        "rawStdout": "",
+        "rawStderr": "",
+        "rawCrashData": (FIXTURE_PATH / "gdb_crash_data.txt").read_text(),
+        "platform": "x86_64",
+        "product": "x",
+        "product_version": "",
+        "os": "linux",
+        "client": "x",
+        "tool": "x",
+    }
+    parse = mocker.spy(GDBCrashInfo, "_parse")
+    resp = api_client.post("/crashmanager/rest/crashes/", data=data)
+    LOG.debug(resp)
+    assert resp.status_code == requests.codes["created"]
+    assert parse.call_count == 1
+    crash = CrashEntry.objects.get()
+    crashInfo = crash.getCrashInfo()
+    assert parse.call_count == 1
+    assert crashInfo.crashAddress == 0xF7056FFF
+    assert crashInfo.backtrace
+
+
 @patch(
     "crashmanager.models.CrashEntry.save",
     new=Mock(side_effect=RuntimeError("crashentry failing intentionally")),
@@ -549,6 +581,284 @@ def test_rest_crashes_report_crash_long_sig(api_client, user_normal):
     _compare_created_data_to_crash(data, crash, short_signature=expected)
 
 
+@pytest.mark.parametrize("user", ["normal", "only_report"], indirect=True)
+def test_rest_crashes_report_bulk(api_client, user):
+    """test that several crashes can be reported at once"""
+    data = [
+        {
+            "rawStdout": "data on\nstdout",
+            "rawStderr": "data on\nstderr",
+            "rawCrashData": "some\tcrash\ndata\n",
+            "testcase": "foo();\ntest();",
+            "testcase_isbinary": False,
+            "testcase_quality": 0,
+            "testcase_ext": "js",
+            "platform": "x86",
+            "product": "mozilla-central",
+            "product_version": "badf00d",
+            "os": "linux",
+            "client": "client1",
+            "tool": "tool1",
+        },
+        {
+            "rawStdout": "",
+            "rawStderr": "",
+            "rawCrashData": "Assertion failure: foo",
+            "platform": "x",
+            "product": "x",
+            "product_version": "",
+            "os": "x",
+            "client": "x",
+            "tool": "x",
+        },
+    ]
+    resp = api_client.post("/crashmanager/rest/crashes/bulk/", data=data, format="json")
+    LOG.debug(resp)
+    assert resp.status_code == requests.codes["created"]
+    result = resp.json()
+    assert len(result) == 2
+    for created, item in zip(result, data):
+        _compare_created_data_to_crash(item, CrashEntry.objects.get(pk=created["id"]))
+    # the hourly counters of the crash statistics include bulk reported crashes
+    assert sorted(ToolHit.objects.values_list("tool__name", "count")) == [
+        ("tool1", 1),
+        ("x", 1),
+    ]
+
+
+def test_rest_crashes_report_bulk_invalid(api_client, user_normal, settings):
+    """test that bulk reporting is all or nothing on invalid data"""
+    data = {
+        "rawStdout": "",
+        "rawStderr": "",
+        "rawCrashData": "",
+        "platform": "x",
+        "product": "x",
+        "os": "x",
+        "client": "x",
+        "tool": "x",
+    }
+    resp = api_client.post(
+        "/crashmanager/rest/crashes/bulk/",
+        data=[data, dict(data, platform="")],
+        format="json",
+    )
+    assert resp.status_code == requests.codes["bad_request"]
+    resp = api_client.post("/crashmanager/rest/crashes/bulk/", data=data, format="json")
+    assert resp.status_code == requests.codes["bad_request"]
+    settings.CRASH_BULK_CREATE_LIMIT = 1
+    resp = api_client.post(
+        "/crashmanager/rest/crashes/bulk/", data=[data, data], format="json"
+    )
+    assert resp.status_code == requests.codes["bad_request"]
+    assert not CrashEntry.objects.exists()
+
+
+@pytest.mark.parametrize("bulk_insert", [True, False])
+def test_rest_crashes_report_bulk_triage(
+    api_client,
+    user_normal,
+    cm,
+    monkeypatch,
+    settings,
+    mocker,
+    django_capture_on_commit_callbacks,
+    bulk_insert,
+):
+    """test that bulk reported crashes are triaged in a single task, also if the
+    database can't return the primary keys of bulk inserted rows"""
+    from celeryconf import app
+    from django.db import connection
+
+    from crashmanager import tasks
+
+    mocker.patch.object(
+        type(connection.features),
+        "can_return_rows_from_bulk_insert",
+        new_callable=mocker.PropertyMock,
+        return_value=bulk_insert,
+    )
+
+    bucket = cm.create_bucket(
+        signature=json.dumps(
+            {"symptoms": [{"type": "output", "value": "Assertion failure: foo"}]}
+        )
+    )
+    settings.USE_CELERY = True
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+    single = mocker.patch.object(tasks.triage_new_crash, "delay")
+    batch = mocker.spy(tasks.triage_new_crashes_batch, "delay")
+
+    data = [
+        {
+            "rawStdout": "",
+            "rawStderr": "",
+            "rawCrashData": crashdata,
+            "platform": "x",
+            "product": "x",
+            "os": "x",
+            "client": "x",
+            "tool": "x",
+        }
+        for crashdata in (
+            "Assertion failure: foo",
+            "Assertion failure: bar",
+            "Assertion failure: foo",
+        )
+    ]
+    with django_capture_on_commit_callbacks(execute=True):
+        resp = api_client.post(
+            "/crashmanager/rest/crashes/bulk/", data=data, format="json"
+        )
+    assert resp.status_code == requests.codes["created"]
+    ids = [created["id"] for created in resp.json()]
+
+    assert not single.called
+    batch.assert_called_once_with(ids)
+    assert sum(ToolHit.objects.values_list("count", flat=True)) == 3
+    entries = CrashEntry.objects.order_by("id")
+    assert [entry.bucket_id for entry in entries] == [bucket.pk, None, bucket.pk]
+    assert all(entry.triagedOnce for entry in entries)
+    assert entries[0].shortSignature == "Assertion failure: foo"
+    assert entries[0].cachedCrashInfo
+
+
+def test_rest_crashes_report_testcase_dedup(api_client, user_normal):
+    """test that identical testcases share one file, which is removed with the
+    last testcase referencing it"""
+    data = {
+        "rawStdout": "",
+        "rawStderr": "",
+        "rawCrashData": "",
+        "testcase": "foo();\ntest();",
+        "testcase_isbinary": False,
+        "testcase_quality": 0,
+        "testcase_ext": "js",
+        "platform": "x",
+        "product": "x",
+        "product_version": "",
+        "os": "x",
+        "client": "x",
+        "tool": "x",
+    }
+    sha1 = hashlib.sha1(data["testcase"].encode("utf-8")).hexdigest()
+
+    # the hash alone isn't enough for an unknown testcase
+    hash_only = {key: value for key, value in data.items() if key != "testcase"}
+    hash_only["testcase_sha1"] = sha1
+    resp = api_client.post("/crashmanager/rest/crashes/", data=hash_only)
+    assert resp.status_code == requests.codes["not_found"]
+    assert not CrashEntry.objects.exists()
+
+    for _ in range(2):
+        resp = api_client.post("/crashmanager/rest/crashes/", data=data)
+        assert resp.status_code == requests.codes["created"]
+    resp = api_client.post(
+        "/crashmanager/rest/crashes/", data=dict(hash_only, testcase_ext="txt")
+    )
+    assert resp.status_code == requests.codes["not_found"]
+    resp = api_client.post("/crashmanager/rest/crashes/", data=hash_only)
+    assert resp.status_code == requests.codes["created"]
+
+    crashes = list(CrashEntry.objects.order_by("id"))
+    assert len(crashes) == 3
+    for crash in crashes:
+        _compare_created_data_to_crash(data, crash)
+        assert crash.testcase.sha1 == sha1
+    path = crashes[0].testcase.test.path
+    assert {crash.testcase.test.path for crash in crashes} == {path}
+    assert os.path.basename(path) == f"{sha1}.js"
+
+    crashes[0].delete()
+    crashes[1].delete()
+    assert os.path.exists(path)
+    crashes[2].delete()
+    assert not os.path.exists(path)
+
+
+def test_rest_crashes_report_testcase_encoded(api_client, user_normal):
+    """test that text testcases which aren't valid UTF-8 can be sent encoded and
+    stay text testcases"""
+    content = b"foo(\xff);\nencoded();"
+    data = {
+        "rawStdout": "",
+        "rawStderr": "",
+        "rawCrashData": "",
+        "testcase": base64.b64encode(content).decode("ascii"),
+        "testcase_isbinary": False,
+        "testcase_encoding": "base64",
+        "testcase_quality": 0,
+        "testcase_ext": "js",
+        "platform": "x",
+        "product": "x",
+        "product_version": "",
+        "os": "x",
+        "client": "x",
+        "tool": "x",
+    }
+    resp = api_client.post("/crashmanager/rest/crashes/", data=data)
+    assert resp.status_code == requests.codes["created"]
+    crash = CrashEntry.objects.get()
+    assert not crash.testcase.isBinary
+    assert crash.testcase.sha1 == hashlib.sha1(content).hexdigest()
+    crashInfo = crash.getCrashInfo(attachTestcase=True)
+    assert crashInfo.testcase == content
+
+    resp = api_client.post(
+        "/crashmanager/rest/crashes/", data=dict(data, testcase_encoding="rot13")
+    )
+    assert resp.status_code == requests.codes["bad_request"]
+
+
+def test_rest_crashes_report_testcase_legacy(api_client, user_normal):
+    """test that binary testcases stored before deduplication share their file
+    with new testcases once their hash is filled in by the migration"""
+    content = b"\0legacy\1"
+    sha1 = hashlib.sha1(content).hexdigest()
+    legacy = cmTestCase(isBinary=True, size=len(content))
+    # the storage is shared between test runs, don't get a renamed file
+    legacy.test.storage.delete(f"tests/{sha1}.bin")
+    legacy.test.save(f"{sha1}.bin", ContentFile(content), save=False)
+    legacy.save()
+    legacy_text = cmTestCase(size=1)
+    legacy_text.test.save(f"{sha1[::-1]}.js", ContentFile(b"x"), save=False)
+    legacy_text.save()
+
+    migration = importlib.import_module("crashmanager.migrations.0018_testcase_sha1")
+    migration.add_binary_testcase_sha1(django_apps, None)
+    legacy.refresh_from_db()
+    legacy_text.refresh_from_db()
+    assert legacy.sha1 == sha1
+    assert legacy_text.sha1 == ""
+
+    data = {
+        "rawStdout": "",
+        "rawStderr": "",
+        "rawCrashData": "",
+        "testcase": base64.b64encode(content).decode("ascii"),
+        "testcase_isbinary": True,
+        "testcase_quality": 0,
+        "testcase_ext": "bin",
+        "platform": "x",
+        "product": "x",
+        "product_version": "",
+        "os": "x",
+        "client": "x",
+        "tool": "x",
+    }
+    resp = api_client.post("/crashmanager/rest/crashes/", data=data)
+    assert resp.status_code == requests.codes["created"]
+    crash = CrashEntry.objects.get()
+    assert crash.testcase.test.name == legacy.test.name
+
+    # deleting either one keeps the file for the other
+    path = legacy.test.path
+    crash.delete()
+    assert os.path.exists(path)
+    legacy.delete()
+    assert not os.path.exists(path)
+
+
 def test_rest_crash_update(api_client, cm, user_normal):
     """test that only allowed fields of CrashEntry can be updated"""
     test = cm.create_testcase("test.txt", quality=0)
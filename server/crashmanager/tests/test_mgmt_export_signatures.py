@@ -17,8 +17,12 @@ import zipfile
 
 import pytest
 from django.core.management import CommandError, call_command
+from django.utils import timezone
 
+from crashmanager import cron
+from crashmanager.management.commands.export_signatures import write_signatures_zip
 from crashmanager.models import Bucket
+from crashmanager.signature_manifest import hash_zip_contents, load_manifest
 
 pytestmark = pytest.mark.django_db()  # pylint: disable=invalid-name
 
@@ -82,3 +86,117 @@ def test_some():
                         assert contents == "sig2"
     finally:
         os.unlink(tmpf)
+
+
+def test_aggregates(cm):
+    """the size and best testcase of buckets are exported"""
+    bucket = cm.create_bucket(signature="sig")
+    for quality, testdata in ((3, "a"), (2, "bbb"), (2, "cc")):
+        testcase = cm.create_testcase("t.js", testdata=testdata, quality=quality)
+        cm.create_crash(bucket=bucket, testcase=testcase)
+    cm.create_crash(bucket=bucket, tool="tool2")
+    fd, tmpf = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        call_command("export_signatures", tmpf)
+        with zipfile.ZipFile(tmpf) as zipf:
+            metadata = json.loads(zipf.read("%d.metadata" % bucket.pk))
+        assert metadata["size"] == 4
+        assert metadata["testcase__quality"] == 2
+        assert metadata["testcase__size"] == 2
+    finally:
+        os.unlink(tmpf)
+
+
+def _contents(path):
+    with zipfile.ZipFile(path) as zipf:
+        return {name: zipf.read(name) for name in zipf.namelist()}
+
+
+def test_incremental(cm, tmp_path):
+    """an incremental export equals a full export"""
+    bucket1 = cm.create_bucket(signature="sig1", bug=cm.create_bug("123"))
+    bucket2 = cm.create_bucket(signature="sig2")
+    bucket3 = cm.create_bucket(signature="sig3")
+    bucket4 = cm.create_bucket(signature="sig4", bug=cm.create_bug("456"))
+    cm.create_bucket(signature="sig5")
+    cm.create_crash(bucket=bucket3)
+    files = write_signatures_zip(tmp_path / "previous.zip")
+    assert files == hash_zip_contents(tmp_path / "previous.zip")
+
+    since = timezone.now()
+    bucket1.shortDescription = "changed"
+    bucket1.save()
+    bucket2.delete()
+    cm.create_crash(bucket=bucket3)
+    bucket4.bug.externalId = "457"
+    bucket4.bug.save()
+    cm.create_bucket(signature="sig6")
+
+    incremental = write_signatures_zip(
+        tmp_path / "incremental.zip",
+        since=since,
+        previousZip=tmp_path / "previous.zip",
+        previousFiles=files,
+    )
+    full = write_signatures_zip(tmp_path / "full.zip")
+    assert incremental == full
+    assert incremental == hash_zip_contents(tmp_path / "incremental.zip")
+    assert _contents(tmp_path / "incremental.zip") == _contents(tmp_path / "full.zip")
+    assert (
+        json.loads(_contents(tmp_path / "full.zip")["%d.metadata" % bucket3.pk])["size"]
+        == 2
+    )
+
+
+def test_incremental_unchanged(cm, tmp_path, django_assert_num_queries):
+    """unchanged buckets are copied from the previous export"""
+    for idx in range(3):
+        cm.create_crash(bucket=cm.create_bucket(signature="sig%d" % idx))
+    files = write_signatures_zip(tmp_path / "previous.zip")
+
+    # only the changed buckets and the list of buckets are queried
+    with django_assert_num_queries(3):
+        incremental = write_signatures_zip(
+            tmp_path / "incremental.zip",
+            since=timezone.now(),
+            previousZip=tmp_path / "previous.zip",
+            previousFiles=files,
+        )
+    assert incremental == files
+    assert _contents(tmp_path / "incremental.zip") == _contents(
+        tmp_path / "previous.zip"
+    )
+
+
+def test_cron(cm, mocker, settings, tmp_path):
+    """the periodic task exports incrementally and does full exports regularly"""
+    settings.SIGNATURE_STORAGE = str(tmp_path)
+    settings.SIGNATURE_FULL_EXPORT_INTERVAL = 3
+    zip_path = tmp_path / "signatures.zip"
+    mocker.patch.object(cron, "SIGNATURES_ZIP", str(zip_path))
+    write = mocker.patch(
+        "crashmanager.management.commands.export_signatures.write_signatures_zip",
+        side_effect=write_signatures_zip,
+    )
+    bucket = cm.create_bucket(signature="sig1")
+
+    cron.export_signatures()
+    assert write.call_args.kwargs.get("since") is None
+    manifest = load_manifest()
+    assert manifest["generation"] == 1
+    assert manifest["files"] == hash_zip_contents(zip_path)
+
+    bucket.signature = "sig2"
+    bucket.save()
+    cron.export_signatures()
+    assert write.call_args.kwargs.get("since") is not None
+    manifest = load_manifest()
+    assert manifest["generation"] == 2
+    assert _contents(zip_path)["%d.signature" % bucket.pk] == b"sig2"
+    assert manifest["files"] == hash_zip_contents(zip_path)
+
+    cron.export_signatures()
+    assert write.call_args.kwargs.get("since") is None
+    assert load_manifest()["generation"] == 3
+    assert [path.name for path in tmp_path.glob("fm-sigs-*")] == []
@@ -0,0 +1,134 @@
+"""Tests for the bucket aggregates and the reconcile_bucket_aggregates command
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from crashmanager.management.commands.reconcile_bucket_aggregates import (
+    compute_bucket_aggregates,
+)
+from crashmanager.models import BucketAggregate, Tool
+
+pytestmark = pytest.mark.usefixtures("crashmanager_test")
+
+
+def _stored():
+    return {
+        (aggregate.bucket_id, aggregate.tool_id): (
+            aggregate.size,
+            aggregate.quality,
+            aggregate.bestEntry,
+            aggregate.bestEntrySize,
+        )
+        for aggregate in BucketAggregate.objects.filter(size__gt=0)
+    }
+
+
+def _crash(cm, bucket, tool="tool1", quality=None, testdata="x", **kwds):
+    testcase = None
+    if quality is not None:
+        testcase = cm.create_testcase("t.js", testdata=testdata, quality=quality)
+    return cm.create_crash(bucket=bucket, tool=tool, testcase=testcase, **kwds)
+
+
+def test_args():
+    with pytest.raises(CommandError, match=r"Error: unrecognized arguments: "):
+        call_command("reconcile_bucket_aggregates", "")
+
+
+def test_maintained(cm):
+    """aggregates are updated when entries are added, moved and removed"""
+    bucket1 = cm.create_bucket(shortDescription="bucket1")
+    bucket2 = cm.create_bucket(shortDescription="bucket2")
+    _crash(cm, bucket1)
+    crash2 = _crash(cm, bucket1, quality=5, testdata="xx")
+    crash3 = _crash(cm, bucket1, quality=5, testdata="x")
+    _crash(cm, bucket1, tool="tool2", quality=7)
+    crash5 = _crash(cm, bucket2, quality=1)
+    assert _stored() == compute_bucket_aggregates()
+    assert BucketAggregate.for_buckets([bucket1.pk]) == {
+        bucket1.pk: (4, 5, crash3.pk, 1)
+    }
+
+    # moving the best entry
+    crash3.bucket = bucket2
+    crash3.save()
+    crash3.save()
+    assert _stored() == compute_bucket_aggregates()
+    assert BucketAggregate.for_buckets([bucket1.pk, bucket2.pk]) == {
+        bucket1.pk: (3, 5, crash2.pk, 2),
+        bucket2.pk: (2, 1, crash5.pk, 1),
+    }
+
+    # deleting the best entry
+    crash5.delete()
+    assert _stored() == compute_bucket_aggregates()
+
+    # changing the quality of a testcase
+    crash2.testcase.quality = 1
+    crash2.testcase.save()
+    BucketAggregate.refresh_best(bucket1.pk, crash2.tool_id)
+    assert _stored() == compute_bucket_aggregates()
+    assert BucketAggregate.for_buckets([bucket1.pk])[bucket1.pk][1:3] == (
+        1,
+        crash2.pk,
+    )
+
+    # only counting entries of some tools
+    tool2 = Tool.objects.get(name="tool2")
+    assert BucketAggregate.for_buckets([bucket1.pk], [tool2]) == {
+        bucket1.pk: (1, 7, bucket1.crashentry_set.get(tool=tool2).pk, 1)
+    }
+
+
+def test_maintained_reassign(cm):
+    """aggregates are updated when a bucket is reassigned"""
+    signature = json.dumps(
+        {"symptoms": [{"src": "stderr", "type": "output", "value": "/match/"}]}
+    )
+    bucket1 = cm.create_bucket(signature=signature)
+    bucket2 = cm.create_bucket(signature=signature)
+    _crash(cm, None, stderr="match", quality=2)
+    _crash(cm, bucket1, stderr="match", quality=1)
+    _crash(cm, bucket2, stderr="nope", quality=0)
+    _crash(cm, bucket2, stderr="match", tool="tool2")
+
+    bucket2.reassign(True)
+    assert _stored() == compute_bucket_aggregates()
+    assert BucketAggregate.for_buckets([bucket1.pk, bucket2.pk]) == {
+        bucket1.pk: (1, 1, bucket1.crashentry_set.get().pk, 1),
+        bucket2.pk: (2, 2, bucket2.crashentry_set.get(testcase__quality=2).pk, 1),
+    }
+
+
+def test_reconcile(cm):
+    """the command repairs aggregates that drifted"""
+    bucket1 = cm.create_bucket(shortDescription="bucket1")
+    bucket2 = cm.create_bucket(shortDescription="bucket2")
+    _crash(cm, bucket1, quality=3)
+    _crash(cm, bucket1, tool="tool2")
+    _crash(cm, bucket2, quality=1)
+    expected = compute_bucket_aggregates()
+
+    BucketAggregate.objects.filter(bucket=bucket1).update(size=10, bestEntry=None)
+    BucketAggregate.objects.filter(bucket=bucket2).delete()
+    stale = cm.create_bucket(shortDescription="stale")
+    BucketAggregate.objects.create(
+        bucket=stale, tool=Tool.objects.get(name="tool1"), size=1
+    )
+    assert _stored() != expected
+
+    call_command("reconcile_bucket_aggregates")
+    assert _stored() == expected
+    assert not BucketAggregate.objects.filter(bucket=stale).exists()
+
+    call_command("reconcile_bucket_aggregates")
+    assert _stored() == expected
@@ -14,11 +14,14 @@ import json
 import pytest
 from django.contrib.auth.models import User
 from django.core.management import CommandError, call_command
+from django.utils import timezone
 from notifications.models import Notification
 
 from crashmanager.models import (
     OS,
     Bucket,
+    BucketAggregate,
+    BucketHit,
     BucketWatch,
     Client,
     CrashEntry,
@@ -79,6 +82,53 @@ def test_some():
     assert crashes[0].bucket.pk == buckets[0].pk
     assert crashes[1].bucket.pk == buckets[1].pk
     assert crashes[2].bucket is None
+    assert BucketAggregate.for_buckets([bucket.pk for bucket in buckets]) == {
+        buckets[0].pk: (1, None, None, None),
+        buckets[1].pk: (1, None, None, None),
+    }
+
+
+def test_batched():
+    buckets = [
+        Bucket.objects.create(
+            signature=json.dumps(
+                {"symptoms": [{"src": "stderr", "type": "output", "value": "match"}]}
+            )
+        ),
+        Bucket.objects.create(
+            signature=json.dumps(
+                {"symptoms": [{"src": "stderr", "type": "output", "value": "/mat/"}]}
+            )
+        ),
+    ]
+    defaults = {
+        "client": Client.objects.create(),
+        "os": OS.objects.create(),
+        "platform": Platform.objects.create(),
+        "product": Product.objects.create(),
+        "tool": Tool.objects.create(),
+    }
+    crashes = [
+        CrashEntry.objects.create(rawStderr=stderr, **defaults)
+        for stderr in ("match", "mat", "blah", "match", "match")
+    ]
+
+    call_command("triage_new_crashes", "--batch-size", "2")
+
+    crashes = [CrashEntry.objects.get(pk=c.pk) for c in crashes]
+    for c in crashes:
+        assert c.triagedOnce
+
+    # the newest matching bucket wins
+    assert [c.bucket_id for c in crashes] == [
+        buckets[1].pk,
+        buckets[1].pk,
+        None,
+        buckets[1].pk,
+        buckets[1].pk,
+    ]
+    assert sum(hit.count for hit in BucketHit.objects.filter(bucket=buckets[1])) == 4
+    assert not BucketHit.objects.filter(bucket=buckets[0], count__gt=0).exists()
 
 
 def test_some_with_notification():
@@ -136,3 +186,99 @@ def test_some_with_notification():
         == f"The bucket {buckets[1].pk} received a new crash entry {crashes[1].pk}"
     )
     assert notification.target == crashes[1]
+
+
+def test_signature_index_updates():
+    bucket = Bucket.objects.create(
+        signature=json.dumps(
+            {"symptoms": [{"src": "stderr", "type": "output", "value": "foo"}]}
+        )
+    )
+    defaults = {
+        "client": Client.objects.create(),
+        "os": OS.objects.create(),
+        "platform": Platform.objects.create(),
+        "product": Product.objects.create(),
+        "tool": Tool.objects.create(),
+    }
+    crash = CrashEntry.objects.create(rawStderr="match", **defaults)
+    call_command("triage_new_crashes")
+    assert CrashEntry.objects.get(pk=crash.pk).bucket is None
+
+    # changing the signature must be picked up by the index
+    bucket.signature = json.dumps(
+        {"symptoms": [{"src": "stderr", "type": "output", "value": "match"}]}
+    )
+    bucket.save()
+    crash = CrashEntry.objects.create(rawStderr="match", **defaults)
+    call_command("triage_new_crashes")
+    assert CrashEntry.objects.get(pk=crash.pk).bucket.pk == bucket.pk
+
+    # so must a deleted bucket
+    bucket.delete()
+    crash = CrashEntry.objects.create(rawStderr="match", **defaults)
+    call_command("triage_new_crashes")
+    assert CrashEntry.objects.get(pk=crash.pk).bucket is None
+
+
+def test_signature_index_other_process():
+    bucket = Bucket.objects.create(
+        signature=json.dumps(
+            {"symptoms": [{"src": "stderr", "type": "output", "value": "foo"}]}
+        )
+    )
+    defaults = {
+        "client": Client.objects.create(),
+        "os": OS.objects.create(),
+        "platform": Platform.objects.create(),
+        "product": Product.objects.create(),
+        "tool": Tool.objects.create(),
+    }
+    crash = CrashEntry.objects.create(rawStderr="match", **defaults)
+    call_command("triage_new_crashes")
+    assert CrashEntry.objects.get(pk=crash.pk).bucket is None
+
+    # a signature changed by another process doesn't invalidate the index here,
+    # it is found by its modification time instead
+    Bucket.objects.filter(pk=bucket.pk).update(
+        signature=json.dumps(
+            {"symptoms": [{"src": "stderr", "type": "output", "value": "match"}]}
+        ),
+        lastModified=timezone.now(),
+    )
+    crash = CrashEntry.objects.create(rawStderr="match", **defaults)
+    call_command("triage_new_crashes")
+    assert CrashEntry.objects.get(pk=crash.pk).bucket.pk == bucket.pk
+
+
+def test_batch_query_count():
+    """The number of queries to triage a batch doesn't depend on its size"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from crashmanager.management.commands.triage_new_crashes import triage_entries
+
+    Bucket.objects.create(
+        signature=json.dumps(
+            {"symptoms": [{"src": "stderr", "type": "output", "value": "match"}]}
+        )
+    )
+    defaults = {
+        "client": Client.objects.create(),
+        "os": OS.objects.create(),
+        "platform": Platform.objects.create(),
+        "product": Product.objects.create(),
+        "tool": Tool.objects.create(),
+    }
+
+    # The first batch also creates the hit and aggregate rows of the bucket
+    queries = []
+    for size in (2, 2, 6):
+        entries = [
+            CrashEntry.objects.create(rawStderr=stderr, **defaults)
+            for stderr in ["match", "blah"] * (size // 2)
+        ]
+        with CaptureQueriesContext(connection) as context:
+            assert triage_entries([entry.pk for entry in entries]) == size // 2
+        queries.append(len(context.captured_queries))
+    assert queries[1] == queries[2]
@@ -17,7 +17,7 @@ import pytest
 import requests
 from django.urls import reverse
 
-from crashmanager.models import Bucket, BucketWatch, CrashEntry
+from crashmanager.models import SIGNATURE_CACHE, Bucket, BucketWatch, CrashEntry
 
 from . import assert_contains
 
@@ -157,6 +157,95 @@ def test_opt_signature_simple_get(client, cm):  # pylint: disable=invalid-name
     assert response.status_code == requests.codes["ok"]
 
 
+def _output_signature(*values):
+    return json.dumps(
+        {
+            "symptoms": [
+                {"src": "stderr", "type": "output", "value": value} for value in values
+            ]
+        }
+    )
+
+
+def test_find_signature_matching_bucket(client, cm):
+    """The first bucket matching the crash is assigned"""
+    client.login(username="test", password="test")
+    crash = cm.create_crash(stderr="foo\nbar")
+    cm.create_bucket(signature=_output_signature("baz"))
+    bucket = cm.create_bucket(signature=_output_signature("bar"))
+    cm.create_bucket(signature=_output_signature("foo"))
+
+    response = client.get(
+        reverse("crashmanager:findsigs", kwargs={"crashid": crash.pk})
+    )
+    assert response.status_code == requests.codes["ok"]
+    assert response.context["bucket"] == bucket
+    assert CrashEntry.objects.get(pk=crash.pk).bucket == bucket
+
+
+def test_find_signature_similar_buckets(client, cm):
+    """Similar buckets are rated by how many other buckets they would match"""
+    client.login(username="test", password="test")
+    crash = cm.create_crash(stderr="foo\nbar")
+    similar = cm.create_bucket(signature=_output_signature("foo", "baz"))
+    broad = cm.create_bucket(signature=_output_signature("bar", "qux"))
+    other = cm.create_bucket(signature=_output_signature("bar", "quux"))
+    cm.create_crash(stderr="bar\nquux", bucket=other)
+    cm.create_crash(stderr="foo\nbaz", bucket=similar)
+
+    response = client.get(
+        reverse("crashmanager:findsigs", kwargs={"crashid": crash.pk})
+    )
+    assert response.status_code == requests.codes["ok"]
+    buckets = {bucket.pk: bucket for bucket in response.context["buckets"]}
+    assert buckets[similar.pk].foreignMatchCount == 0
+    assert buckets[similar.pk].offCount == 1
+    assert buckets[broad.pk].foreignMatchCount == 1
+    assert buckets[broad.pk].linkToOthers == str(other.pk)
+    assert buckets[broad.pk].foreignMatchPercentage == 50.0
+
+
+def test_opt_signature_matching_entries(client, cm):
+    """The optimized signature lists all unbucketed entries it matches"""
+    client.login(username="test", password="test")
+    bucket = cm.create_bucket(signature=_output_signature("foo", "bar"))
+    cm.create_crash(stderr="foo\nbar", bucket=bucket)
+    crashes = [
+        cm.create_crash(stderr="foo"),
+        cm.create_crash(stderr="foo\nbaz"),
+    ]
+    cm.create_crash(stderr="baz")
+    other = cm.create_bucket(signature=_output_signature("baz"))
+    cm.create_crash(stderr="baz", bucket=other)
+
+    response = client.get(reverse("crashmanager:sigopt", kwargs={"sigid": bucket.pk}))
+    assert response.status_code == requests.codes["ok"]
+    assert response.context["optimizedSignature"] is not None
+    assert {entry.pk for entry in response.context["matchingEntries"]} == {
+        crash.pk for crash in crashes
+    }
+
+
+def test_first_entries_of_buckets(cm, django_assert_num_queries):
+    """The first entry of each bucket is loaded in one query"""
+    buckets = [cm.create_bucket(signature=_output_signature("foo")) for _ in range(3)]
+    first = [
+        cm.create_crash(stderr="foo", bucket=buckets[0]),
+        cm.create_crash(stderr="foo", bucket=buckets[1]),
+    ]
+    cm.create_crash(stderr="foo", bucket=buckets[0])
+
+    with django_assert_num_queries(1):
+        entries = CrashEntry.firstEntriesOfBuckets(
+            Bucket.objects.filter(pk__in=[bucket.pk for bucket in buckets])
+        )
+        assert {bucketId: entry.pk for (bucketId, entry) in entries.items()} == {
+            buckets[0].pk: first[0].pk,
+            buckets[1].pk: first[1].pk,
+        }
+        assert entries[buckets[0].pk].product.name
+
+
 def test_try_signature_simple_get(client, cm):  # pylint: disable=invalid-name
     """No errors are thrown in template"""
     client.login(username="test", password="test")
@@ -373,3 +462,22 @@ def test_watch_signature_crashes(client, cm):  # pylint: disable=invalid-name
     assert response.context["watchId"] == watch.id
     assert response.context["restricted"] is False
     assert_contains(response, "crasheslist")
+
+
+def test_signature_cache(cm):
+    """Parsed bucket signatures are cached until the signature changes"""
+    SIGNATURE_CACHE.clear()
+    bucket = cm.create_bucket(
+        signature=json.dumps({"symptoms": [{"type": "output", "value": "foo"}]})
+    )
+    sig = bucket.getSignature()
+    assert (SIGNATURE_CACHE.hits, SIGNATURE_CACHE.misses) == (0, 1)
+    assert Bucket.objects.get(pk=bucket.pk).getSignature() is sig
+    assert (SIGNATURE_CACHE.hits, SIGNATURE_CACHE.misses) == (1, 1)
+
+    bucket.signature = json.dumps({"symptoms": [{"type": "output", "value": "bar"}]})
+    bucket.save()
+    new_sig = bucket.getSignature()
+    assert new_sig is not sig
+    assert new_sig.symptoms[0].output.value == "bar"
+    assert (SIGNATURE_CACHE.hits, SIGNATURE_CACHE.misses) == (1, 2)
@@ -9,15 +9,18 @@ License, v. 2.0. If a copy of the MPL was not distributed with this
 file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
+import io
 import json
 import logging
+import zipfile
 
 import pytest
 import requests
 from django.urls import reverse
 from rest_framework import status
 
-from crashmanager.models import Bucket, Bug, CrashEntry
+from crashmanager.models import Bucket, BucketHit, Bug, CrashEntry
+from crashmanager.signature_manifest import hash_zip_contents, update_manifest
 
 from .conftest import _create_user
 
@@ -643,6 +646,67 @@ def test_edit_signature_edit_w_reassign(
     }
 
 
+@pytest.mark.parametrize("user", ["normal"], indirect=True)
+@pytest.mark.parametrize("timeout", [False, True])
+def test_edit_signature_edit_w_parallel_reassign(
+    api_client, cm, mocker, monkeypatch, settings, timeout, user
+):  # pylint: disable=invalid-name
+    from celery.exceptions import TimeoutError as CeleryTimeoutError
+    from celery.result import GroupResult
+    from celeryconf import app
+
+    bucket = cm.create_bucket()
+    other = cm.create_bucket()
+    matching = [
+        cm.create_crash(shortSignature="crash #1", stderr="blah") for _ in range(7)
+    ]
+    removed = [
+        cm.create_crash(shortSignature="crash #2", stderr="foo", bucket=bucket)
+        for _ in range(3)
+    ]
+    unrelated = [
+        cm.create_crash(shortSignature="crash #1", stderr="blah", bucket=other),
+        cm.create_crash(shortSignature="crash #3", stderr="foo"),
+    ]
+    sig = json.dumps(
+        {"symptoms": [{"src": "stderr", "type": "output", "value": "/^blah/"}]}
+    )
+
+    settings.USE_CELERY = True
+    settings.CELERY_PARALLEL_REASSIGN = True
+    settings.CELERY_REASSIGN_CHUNK_SIZE = 2
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+    if timeout:
+        # busy workers, the entries are matched locally instead
+        mocker.patch.object(GroupResult, "get", side_effect=CeleryTimeoutError)
+        revoke = mocker.patch.object(GroupResult, "revoke")
+
+    resp = api_client.patch(
+        "/crashmanager/rest/buckets/%d/?reassign=true" % bucket.pk,
+        data={
+            "signature": sig,
+            "shortDescription": "bucket #1",
+            "doNotReduce": False,
+            "frequent": False,
+            "permanent": False,
+        },
+        format="json",
+    )
+    assert resp.status_code == requests.codes["ok"]
+    assert resp.json()["inListCount"] == 7
+    assert resp.json()["outListCount"] == 3
+
+    for crash in matching:
+        assert CrashEntry.objects.get(pk=crash.pk).bucket_id == bucket.pk
+    for crash in removed:
+        assert CrashEntry.objects.get(pk=crash.pk).bucket_id is None
+    assert CrashEntry.objects.get(pk=unrelated[0].pk).bucket_id == other.pk
+    assert CrashEntry.objects.get(pk=unrelated[1].pk).bucket_id is None
+    assert sum(hit.count for hit in BucketHit.objects.filter(bucket=bucket)) == 7
+    if timeout:
+        assert revoke.call_count == 1
+
+
 @pytest.mark.parametrize("user", ["normal"], indirect=True)
 @pytest.mark.parametrize(
     "many", [pytest.param(False, id="single"), pytest.param(True, id="many")]
@@ -827,3 +891,65 @@ def test_signatures_download_perms(api_client, user, settings, tmp_path):
         api_client.get("/crashmanager/rest/signatures/download/", {}).status_code
         == requests.codes["ok"]
     )
+
+
+@pytest.mark.parametrize("user", ["normal"], indirect=True)
+def test_signatures_download_conditional(api_client, user, settings, tmp_path):
+    """signatures.zip is not sent again if unchanged"""
+    settings.SIGNATURE_STORAGE = str(tmp_path)
+    (tmp_path / "signatures.zip").write_bytes(b"zip")
+    resp = api_client.get("/crashmanager/rest/signatures/download/", {})
+    assert resp.status_code == requests.codes["ok"]
+    etag = resp["ETag"]
+    assert "X-Signatures-Generation" not in resp
+
+    resp = api_client.get(
+        "/crashmanager/rest/signatures/download/", {}, HTTP_IF_NONE_MATCH=etag
+    )
+    assert resp.status_code == requests.codes["not_modified"]
+
+    resp = api_client.get(
+        "/crashmanager/rest/signatures/download/", {}, HTTP_IF_NONE_MATCH='"other"'
+    )
+    assert resp.status_code == requests.codes["ok"]
+
+
+@pytest.mark.parametrize("user", ["normal"], indirect=True)
+def test_signatures_delta(api_client, user, settings, tmp_path):
+    """only changed signatures are sent since a known export generation"""
+    settings.SIGNATURE_STORAGE = str(tmp_path)
+    zip_path = tmp_path / "signatures.zip"
+
+    def export(files):
+        with zipfile.ZipFile(zip_path, "w") as zf:
+            for name, content in files.items():
+                zf.writestr(name, content)
+        return update_manifest(hash_zip_contents(zip_path))
+
+    url = "/crashmanager/rest/signatures/delta/"
+    assert api_client.get(url, {}).status_code == requests.codes["bad_request"]
+    assert api_client.get(url, {"since": 1}).status_code == requests.codes["gone"]
+
+    gen1 = export({"1.signature": "a", "1.metadata": "{}", "2.signature": "b"})
+    assert api_client.get(url, {"since": gen1}).status_code == 304
+    gen2 = export({"1.signature": "c", "1.metadata": "{}", "3.signature": "d"})
+    assert gen2 == gen1 + 1
+
+    resp = api_client.get(url, {"since": gen1})
+    assert resp.status_code == requests.codes["ok"]
+    assert resp["X-Signatures-Generation"] == str(gen2)
+    with zipfile.ZipFile(io.BytesIO(resp.content)) as zf:
+        assert sorted(zf.namelist()) == ["1.signature", "3.signature", "delta.json"]
+        assert zf.read("1.signature") == b"c"
+        assert json.loads(zf.read("delta.json")) == {
+            "generation": gen2,
+            "removed": ["2.signature"],
+        }
+
+    resp = api_client.get("/crashmanager/rest/signatures/download/", {})
+    assert resp["X-Signatures-Generation"] == str(gen2)
+
+    # old generations are dropped eventually
+    settings.SIGNATURE_DELTA_HISTORY = 1
+    export({})
+    assert api_client.get(url, {"since": gen1}).status_code == requests.codes["gone"]
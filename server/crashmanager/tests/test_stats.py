@@ -22,7 +22,7 @@ from django.urls import reverse
 from django.utils import timezone
 
 from crashmanager.cron import update_crash_stats
-from crashmanager.models import CrashHit, Tool
+from crashmanager.models import CrashEntry, CrashHit, Tool, ToolHit
 
 from . import assert_contains
 
@@ -203,6 +203,103 @@ def test_rest_stats_graph_data(api_client, user, cm, ignore_toolfilter, settings
         )
 
 
+def _count_stats(entries, now):
+    """Count the entries of the last hour, day and week one by one"""
+    totals = [0, 0, 0]
+    buckets = {}
+    for created, bucket_id in entries.values_list("created", "bucket_id"):
+        for idx, period in enumerate(
+            (timedelta(hours=1), timedelta(days=1), timedelta(days=7))
+        ):
+            if created > now - period:
+                totals[idx] += 1
+                if bucket_id is not None:
+                    buckets.setdefault(str(bucket_id), [0, 0, 0])[idx] += 1
+    return {"totals": totals, "frequentBuckets": buckets}
+
+
+@pytest.mark.parametrize("minute", [0, 30])
+@pytest.mark.parametrize("toolfilter", [True, False])
+def test_rest_stats_counters(api_client, cm, mocker, minute, toolfilter, user_normal):
+    """Stats from the hourly counters are the same as counting all entries"""
+    now = timezone.now().replace(minute=minute, second=0, microsecond=0)
+    buckets = [cm.create_bucket(shortDescription=f"bucket #{idx}") for idx in range(3)]
+    # minutes before now, around the beginning of each period
+    offsets = [0, 10, 29, 30, 31, 59, 60, 61, 90, 119, 120, 600, 1409, 1439, 1440]
+    offsets += [1441, 1470, 1500, 4000, 10049, 10079, 10080, 10081, 10110, 10200]
+    crashes = []
+    for idx, offset in enumerate(offsets):
+        crash = cm.create_crash(
+            tool=f"tool #{idx % 2}", bucket=(buckets + [None])[idx % 4]
+        )
+        crash.created = now - timedelta(minutes=offset)
+        crash.save()
+        crashes.append(crash)
+    # entries moved to another bucket or deleted later
+    crashes[3].bucket = buckets[2]
+    crashes[3].save()
+    crashes[7].bucket = None
+    crashes[7].save()
+    crashes[21].delete()
+    crashes[22].created -= timedelta(hours=2)
+    crashes[22].save()
+
+    entries = CrashEntry.objects.all()
+    if toolfilter:
+        cm.create_toolfilter("tool #1")
+        entries = entries.filter(tool__name="tool #1")
+
+    mocker.patch.object(timezone, "now", return_value=now)
+    resp = api_client.get(reverse(API_NAME))
+    assert resp.status_code == requests.codes["ok"], resp["detail"]
+    resp = resp.json()
+    del resp["outFilterGraphData"]
+    del resp["inFilterGraphData"]
+    assert resp == _count_stats(entries, now)
+
+
+def test_rest_stats_cache(api_client, cm, settings, user_normal):
+    """Stats are cached for a short time by the tool filter of the user"""
+    cm.create_crash(tool="tool #1")
+    cm.create_crash(tool="tool #2")
+    assert api_client.get(reverse(API_NAME)).json()["totals"] == [2, 2, 2]
+
+    cm.create_crash(tool="tool #1")
+    assert api_client.get(reverse(API_NAME)).json()["totals"] == [2, 2, 2]
+
+    # computed again for another tool filter
+    cm.create_toolfilter("tool #1")
+    assert api_client.get(reverse(API_NAME)).json()["totals"] == [2, 2, 2]
+    params = {"ignore_toolfilter": "1"}
+    assert api_client.get(reverse(API_NAME), params).json()["totals"] == [3, 3, 3]
+
+    cm.create_crash(tool="tool #2")
+    assert api_client.get(reverse(API_NAME), params).json()["totals"] == [3, 3, 3]
+    settings.CRASH_STATS_CACHE_SECONDS = -1
+    assert api_client.get(reverse(API_NAME), params).json()["totals"] == [4, 4, 4]
+
+
+def test_tool_hits(db, cm):
+    """Hourly counters of all entries are maintained when entries change"""
+    crash = cm.create_crash(tool="tool #1")
+    cm.create_crash(tool="tool #1")
+    begin = crash.created.replace(minute=0, second=0, microsecond=0)
+    assert list(ToolHit.objects.values_list("begin", "count")) == [(begin, 2)]
+
+    crash.created -= timedelta(hours=2)
+    crash.save()
+    assert sorted(ToolHit.objects.values_list("begin", "count")) == [
+        (begin - timedelta(hours=2), 1),
+        (begin, 1),
+    ]
+
+    crash.delete()
+    assert sorted(ToolHit.objects.values_list("begin", "count")) == [
+        (begin - timedelta(hours=2), 0),
+        (begin, 1),
+    ]
+
+
 def test_update_crash_stats(db, cm, settings):
     """Check that crash stats are calculated by cron task"""
     settings.CRASH_STATS_MAX_HISTORY_DAYS = 9
@@ -0,0 +1,154 @@
+"""Tests for the triage cache
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import pytest
+import redis
+
+from crashmanager.triage_cache import LocalTriageCache, RedisTriageCache
+
+
+def test_local_triage_cache(settings):
+    settings.CELERY_TRIAGE_MEMCACHE_ENTRIES = 2
+    cache = LocalTriageCache()
+    assert cache.get("a") == []
+
+    cache.add("a", 1)
+    cache.add("a", 2)
+    cache.add("a", 1)
+    cache.add("b", 3)
+    assert cache.get("a") == [1, 2]
+
+    # "a" was used last, so "b" is evicted
+    cache.add("a", 4)
+    cache.add("c", 5)
+    assert cache.get("b") == []
+    assert cache.get("a") == [1, 2, 4]
+    assert cache.get("c") == [5]
+
+    cache.record(True)
+    cache.record(False)
+    cache.record(False)
+    assert cache.stats() == {"hits": 1, "misses": 2}
+
+
+def test_redis_triage_cache(mocker):
+    conn = mocker.MagicMock()
+    conn.zrevrange.return_value = [b"7", b"3"]
+    conn.hgetall.return_value = {b"hits": b"5", b"misses": b"2"}
+    cache = RedisTriageCache(conn)
+
+    # buckets found by other workers are served from Redis and kept locally
+    assert cache.get("a") == [7, 3]
+    assert cache.get("a") == [7, 3]
+    assert conn.zrevrange.call_count == 1
+
+    cache.add("b", 1)
+    assert cache.get("b") == [1]
+    assert conn.pipeline.called
+
+    cache.record(True)
+    conn.hincrby.assert_called_once_with("crashmanager:triage:stats", "hits")
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 0,
+        "redis_hits": 1,
+        "shared_hits": 5,
+        "shared_misses": 2,
+    }
+
+
+def test_redis_triage_cache_unavailable(mocker):
+    conn = mocker.Mock()
+    conn.zrevrange.side_effect = redis.exceptions.ConnectionError
+    conn.pipeline.side_effect = redis.exceptions.ConnectionError
+    conn.hincrby.side_effect = redis.exceptions.ConnectionError
+    cache = RedisTriageCache(conn)
+
+    # the local cache keeps working without Redis
+    assert cache.get("a") == []
+    cache.add("a", 1)
+    assert cache.get("a") == [1]
+    cache.record(False)
+    assert cache.misses == 1
+
+
+@pytest.fixture
+def fake_redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeStrictRedis()
+
+
+def test_redis_triage_cache_shared(fake_redis):
+    """Hints added by one worker are found by another one"""
+    worker1 = RedisTriageCache(fake_redis)
+    worker2 = RedisTriageCache(fake_redis)
+
+    worker1.add("a", 1)
+    worker1.add("a", 2)
+    # the most recently matched buckets come first
+    assert worker2.get("a") == [2, 1]
+    assert worker2.get("b") == []
+
+    worker1.record(True)
+    worker2.record(False)
+    stats = worker2.stats()
+    assert stats["redis_hits"] == 1
+    assert (stats["shared_hits"], stats["shared_misses"]) == (1, 1)
+    assert fake_redis.ttl(worker1._key("a")) > 0
+
+
+def test_redis_triage_cache_limits(fake_redis, settings):
+    """The buckets per hint and the number of hints are limited"""
+    settings.CELERY_TRIAGE_REDIS_BUCKETS = 2
+    settings.CELERY_TRIAGE_REDIS_ENTRIES = 2
+    cache = RedisTriageCache(fake_redis)
+
+    for bucket_id in (1, 2, 3):
+        cache.add("a", bucket_id)
+    assert RedisTriageCache(fake_redis).get("a") == [3, 2]
+
+    # "a" was used least recently and is evicted
+    cache.add("b", 1)
+    cache.add("c", 1)
+    reader = RedisTriageCache(fake_redis)
+    assert reader.get("a") == []
+    assert reader.get("b") == [1]
+    assert reader.get("c") == [1]
+    assert fake_redis.zcard("crashmanager:triage:lru") == 2
+
+
+def test_redis_triage_cache_concurrent_eviction(fake_redis, mocker, settings):
+    """The eviction is retried if the LRU set changes concurrently"""
+    settings.CELERY_TRIAGE_REDIS_ENTRIES = 1
+    cache = RedisTriageCache(fake_redis)
+    cache.add("a", 1)
+
+    pipeline = fake_redis.pipeline
+
+    def _pipeline(*args, **kwds):
+        pipe = pipeline(*args, **kwds)
+        zrange = pipe.zrange
+
+        def _zrange(*args, **kwds):
+            result = zrange(*args, **kwds)
+            if not _zrange.called:
+                # another worker touches the watched key
+                _zrange.called = True
+                fake_redis.zadd("crashmanager:triage:lru", {"other": 0})
+            return result
+
+        _zrange.called = False
+        pipe.zrange = _zrange
+        return pipe
+
+    mocker.patch.object(fake_redis, "pipeline", side_effect=_pipeline)
+    cache.add("b", 1)
+    assert fake_redis.zrange("crashmanager:triage:lru", 0, -1) == [
+        cache._key("b").encode()
+    ]
@@ -0,0 +1,164 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+
+import redis
+from django.conf import settings
+
+LOG = logging.getLogger("crashmanager.triage_cache")
+
+
+class LocalTriageCache:
+    """Per-process cache mapping short descriptions of crashes to a list of
+    bucket candidates to try first when triaging.
+
+    The cache is ordered by the time of last use so the least recently used
+    item can be evicted once it grows too large.
+    """
+
+    def __init__(self):
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, shortSignature):
+        return list(self.cache.get(shortSignature, []))
+
+    def _store(self, shortSignature, bucket_ids):
+        # We delete the current entry and add it again to ensure that our
+        # dictionary remains ordered by the time of last use. We can then just
+        # pop the first element if the cache grows too large.
+        self.cache.pop(shortSignature, None)
+        self.cache[shortSignature] = bucket_ids
+
+        if len(self.cache) > getattr(settings, "CELERY_TRIAGE_MEMCACHE_ENTRIES", 100):
+            self.cache.popitem(last=False)
+
+    def add(self, shortSignature, bucket_id):
+        bucket_ids = self.cache.get(shortSignature, [])
+        if bucket_id not in bucket_ids:
+            bucket_ids = bucket_ids + [bucket_id]
+        self._store(shortSignature, bucket_ids)
+
+    def record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class RedisTriageCache(LocalTriageCache):
+    """Triage cache shared by all workers through Redis.
+
+    The local cache is used as first level. Each short signature is stored as a
+    sorted set of bucket ids scored by the time they last matched, expiring after
+    CELERY_TRIAGE_REDIS_TTL seconds without use. A second sorted set tracks the
+    last use of each short signature, so the least recently used ones can be
+    evicted when more than CELERY_TRIAGE_REDIS_ENTRIES are stored.
+    """
+
+    PREFIX = "crashmanager:triage"
+
+    def __init__(self, conn=None):
+        super().__init__()
+        self.conn = conn
+        self.redisHits = 0
+
+    def _conn(self):
+        if self.conn is None:
+            self.conn = redis.StrictRedis.from_url(settings.REDIS_URL)
+        return self.conn
+
+    def _key(self, shortSignature):
+        digest = hashlib.sha1(shortSignature.encode("utf-8")).hexdigest()
+        return f"{self.PREFIX}:hint:{digest}"
+
+    def get(self, shortSignature):
+        if shortSignature in self.cache:
+            return super().get(shortSignature)
+
+        try:
+            bucket_ids = [
+                int(bucket_id)
+                for bucket_id in self._conn().zrevrange(
+                    self._key(shortSignature), 0, -1
+                )
+            ]
+        except redis.exceptions.RedisError as e:
+            LOG.warning("Failed to read triage cache from Redis: %s", e)
+            return []
+
+        if bucket_ids:
+            self.redisHits += 1
+            self._store(shortSignature, bucket_ids)
+        return bucket_ids
+
+    def add(self, shortSignature, bucket_id):
+        super().add(shortSignature, bucket_id)
+
+        key = self._key(shortSignature)
+        lru = f"{self.PREFIX}:lru"
+        now = time.time()
+        maxBuckets = getattr(settings, "CELERY_TRIAGE_REDIS_BUCKETS", 10)
+        maxEntries = getattr(settings, "CELERY_TRIAGE_REDIS_ENTRIES", 10000)
+
+        try:
+            with self._conn().pipeline() as pipe:
+                # transactional pipeline, all commands are applied atomically
+                pipe.zadd(key, {bucket_id: now})
+                pipe.zremrangebyrank(key, 0, -(maxBuckets + 1))
+                pipe.expire(key, getattr(settings, "CELERY_TRIAGE_REDIS_TTL", 86400))
+                pipe.zadd(lru, {key: now})
+                pipe.execute()
+
+            # evict the least recently used short signatures
+            with self._conn().pipeline() as pipe:
+                while True:
+                    try:
+                        pipe.watch(lru)
+                        evict = pipe.zrange(lru, 0, -(maxEntries + 1))
+                        pipe.multi()
+                        if evict:
+                            pipe.delete(*evict)
+                            pipe.zrem(lru, *evict)
+                        pipe.execute()
+                        break
+                    except redis.exceptions.WatchError:
+                        pass
+        except redis.exceptions.RedisError as e:
+            LOG.warning("Failed to update triage cache in Redis: %s", e)
+
+    def record(self, hit):
+        super().record(hit)
+
+        try:
+            self._conn().hincrby(f"{self.PREFIX}:stats", "hits" if hit else "misses")
+        except redis.exceptions.RedisError as e:
+            LOG.warning("Failed to update triage cache stats in Redis: %s", e)
+
+    def stats(self):
+        result = super().stats()
+        result["redis_hits"] = self.redisHits
+        try:
+            shared = self._conn().hgetall(f"{self.PREFIX}:stats")
+        except redis.exceptions.RedisError as e:
+            LOG.warning("Failed to read triage cache stats from Redis: %s", e)
+        else:
+            result["shared_hits"] = int(shared.get(b"hits", 0))
+            result["shared_misses"] = int(shared.get(b"misses", 0))
+        return result
+
+
+def get_triage_cache():
+    if getattr(settings, "CELERY_TRIAGE_REDIS_CACHE", False):
+        return RedisTriageCache()
+    return LocalTriageCache()
@@ -29,6 +29,11 @@ urlpatterns = [
         views.SignaturesDownloadView.as_view(),
         name="download_signatures_rest",
     ),
+    re_path(
+        r"^rest/signatures/delta/$",
+        views.SignaturesDeltaView.as_view(),
+        name="download_signatures_delta_rest",
+    ),
     re_path(
         r"^rest/crashes/(?P<crashid>\d+)/download/$",
         views.TestDownloadView.as_view(),
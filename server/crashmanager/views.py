@@ -1,18 +1,26 @@
+import heapq
 import json
 import os
+import threading
+import time
 from collections import OrderedDict
 from datetime import datetime, timedelta
+from io import BytesIO
 from wsgiref.util import FileWrapper
+from zipfile import ZipFile
 
 from django.conf import settings as django_settings
 from django.conf import settings as djangosettings
 from django.core.exceptions import FieldError, PermissionDenied, SuspiciousOperation
-from django.db.models import F, Q
-from django.db.models.aggregates import Count, Min
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+from django.db.models.aggregates import Count, Min, Sum
+from django.db.models.functions import Coalesce
 from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.views.generic import TemplateView
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from django.views.generic.list import ListView
@@ -27,6 +35,7 @@ from rest_framework.views import APIView
 
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Signatures.CrashInfo import CrashInfo
+from FTB.Signatures.SignatureSet import SignatureSet
 from server.auth import CheckAppPermission
 
 from .forms import (
@@ -36,6 +45,7 @@ from .forms import (
 )
 from .models import (
     Bucket,
+    BucketAggregate,
     BucketHit,
     BucketWatch,
     Bug,
@@ -45,6 +55,7 @@ from .models import (
     CrashEntry,
     CrashHit,
     Tool,
+    ToolHit,
     User,
 )
 from .serializers import (
@@ -57,6 +68,7 @@ from .serializers import (
     InvalidArgumentException,
     NotificationSerializer,
 )
+from .signature_manifest import load_manifest, manifest_delta
 
 
 class JSONDateEncoder(json.JSONEncoder):
@@ -119,6 +131,26 @@ def filter_crash_entries_by_toolfilter(request, entries, restricted_only=False):
     return entries
 
 
+def get_toolfilter_tools(request, restricted_only=False):
+    """
+    Get the tools that the toolfilter of the user restricts results to, in
+    the same way as filter_crash_entries_by_toolfilter().
+
+    @rtype: list
+    @return: The tools, or None if the results aren't filtered
+    """
+    user = User.get_or_create_restricted(request.user)[0]
+
+    if restricted_only and not user.restricted:
+        return None
+
+    defaultToolsFilter = list(user.defaultToolsFilter.all())
+    if defaultToolsFilter or user.restricted:
+        return defaultToolsFilter
+
+    return None
+
+
 def filter_signatures_by_toolfilter(
     request, signatures, restricted_only=False, legacy_filters=True
 ):
@@ -611,14 +643,14 @@ def optimizeSignaturePrecomputed(request, sigid):
     entries = CrashEntry.deferRawFields(entries, requiredOutputs)
 
     # Recompute matching entries based on current state
-    matchingEntries = []
+    entries = list(entries)
     for entry in entries:
         entry.crashinfo = entry.getCrashInfo(
             attachTestcase=optimizedSignature.matchRequiresTest(),
             requiredOutputSources=requiredOutputs,
         )
-        if optimizedSignature.matches(entry.crashinfo):
-            matchingEntries.append(entry)
+    matches = optimizedSignature.matchesMany([entry.crashinfo for entry in entries])
+    matchingEntries = [entry for (entry, match) in zip(entries, matches) if match]
 
     diff = None
     if matchingEntries:
@@ -647,21 +679,22 @@ def findSignatures(request, crashid):
 
     buckets = Bucket.objects.all()
     buckets = filter_signatures_by_toolfilter(request, buckets, restricted_only=True)
+    bucketQuery = buckets
+    buckets = [(bucket, bucket.getSignature()) for bucket in buckets]
     similarBuckets = []
     matchingBucket = None
 
-    # Avoid hitting the database multiple times when looking for the first
-    # entry of a bucket. Keeping these in memory is less expensive.
-    firstEntryPerBucketCache = {}
+    # We found a matching bucket, no need to display/calculate similar buckets
+    matchingBuckets = SignatureSet(buckets).matchAll(entry.crashinfo)
+    if matchingBuckets:
+        matchingBucket = matchingBuckets[0]
+        buckets = []
 
-    for bucket in buckets:
-        signature = bucket.getSignature()
-        distance = signature.getDistance(entry.crashinfo)
+    # The first entry of each bucket, loaded once for all proposed signatures
+    firstEntryCrashInfos = None
 
-        # We found a matching bucket, no need to display/calculate similar buckets
-        if distance == 0:
-            matchingBucket = bucket
-            break
+    for bucket, signature in buckets:
+        distance = signature.getDistance(entry.crashinfo)
 
         # TODO: This could be made configurable through a GET parameter
         if distance <= 4:
@@ -671,37 +704,42 @@ def findSignatures(request, crashid):
                 # buckets. If the signature matches lots of other buckets as well, it is
                 # likely too broad and we should not consider it (or later rate it worse
                 # than others).
+                if firstEntryCrashInfos is None:
+                    # Omit testcase for performance reasons for now
+                    firstEntryCrashInfos = [
+                        (bucketId, c.getCrashInfo(attachTestcase=False))
+                        for (bucketId, c) in sorted(
+                            CrashEntry.firstEntriesOfBuckets(
+                                bucketQuery, ("stdout", "stderr", "crashdata")
+                            ).items()
+                        )
+                    ]
+
+                otherBuckets = [
+                    (otherBucketId, crashInfo)
+                    for (otherBucketId, crashInfo) in firstEntryCrashInfos
+                    if otherBucketId != bucket.pk
+                ]
+                otherMatches = proposedCrashSignature.matchesMany(
+                    [crashInfo for (_, crashInfo) in otherBuckets]
+                )
+
                 matchesInOtherBuckets = 0
                 matchesInOtherBucketsLimitExceeded = False
                 nonMatchesInOtherBuckets = 0
                 otherMatchingBucketIds = []
-                for otherBucket in buckets:
-                    if otherBucket.pk == bucket.pk:
-                        continue
-
-                    if otherBucket.pk not in firstEntryPerBucketCache:
-                        c = CrashEntry.objects.filter(bucket=otherBucket).first()
-                        firstEntryPerBucketCache[otherBucket.pk] = c
-                        if c:
-                            # Omit testcase for performance reasons for now
-                            firstEntryPerBucketCache[otherBucket.pk] = c.getCrashInfo(
-                                attachTestcase=False
-                            )
-
-                    firstEntryCrashInfo = firstEntryPerBucketCache[otherBucket.pk]
-                    if firstEntryCrashInfo:
-                        # Omit testcase for performance reasons for now
-                        if proposedCrashSignature.matches(firstEntryCrashInfo):
-                            matchesInOtherBuckets += 1
-                            otherMatchingBucketIds.append(otherBucket.pk)
-
-                            # We already match too many foreign buckets. Abort our
-                            # search here to speed up the response time.
-                            if matchesInOtherBuckets > 5:
-                                matchesInOtherBucketsLimitExceeded = True
-                                break
-                        else:
-                            nonMatchesInOtherBuckets += 1
+                for (otherBucketId, _), otherMatch in zip(otherBuckets, otherMatches):
+                    if otherMatch:
+                        matchesInOtherBuckets += 1
+                        otherMatchingBucketIds.append(otherBucketId)
+
+                        # We already match too many foreign buckets. Abort our
+                        # search here to speed up the response time.
+                        if matchesInOtherBuckets > 5:
+                            matchesInOtherBucketsLimitExceeded = True
+                            break
+                    else:
+                        nonMatchesInOtherBuckets += 1
 
                 bucket.offCount = distance
 
@@ -974,20 +1012,42 @@ class ToolFilterSignaturesBackend(BaseFilterBackend):
         except (AssertionError, ValueError):
             raise InvalidArgumentException({"ignore_toolfilter": ["Expecting 0 or 1."]})
         view.ignore_toolfilter = bool(ignore_toolfilter)
-        return filter_signatures_by_toolfilter(
+
+        # Buckets are filtered by their aggregates instead of joining all of
+        # their entries, the tools are also used by BucketAnnotateFilterBackend
+        view.toolfilter_tools = get_toolfilter_tools(
             request,
-            queryset,
-            legacy_filters=False,
             restricted_only=bool(view.ignore_toolfilter) or view.action != "list",
         )
+        if view.toolfilter_tools is None:
+            return queryset
+        if not view.toolfilter_tools:
+            return queryset.none()
+        return queryset.filter(
+            Exists(
+                BucketAggregate.objects.filter(
+                    bucket=OuterRef("pk"),
+                    tool__in=view.toolfilter_tools,
+                    size__gt=0,
+                )
+            )
+        )
 
 
 class BucketAnnotateFilterBackend(BaseFilterBackend):
     """Annotates bucket queryset with size and best_quality"""
 
     def filter_queryset(self, request, queryset, view):
+        aggregates = BucketAggregate.objects.filter(bucket=OuterRef("pk"), size__gt=0)
+        tools = getattr(view, "toolfilter_tools", None)
+        if tools is not None:
+            aggregates = aggregates.filter(tool__in=tools)
+        aggregates = aggregates.order_by().values("bucket")
         return queryset.annotate(
-            size=Count("crashentry"), quality=Min("crashentry__testcase__quality")
+            size=Coalesce(
+                Subquery(aggregates.annotate(total=Sum("size")).values("total")), 0
+            ),
+            quality=Subquery(aggregates.annotate(best=Min("quality")).values("best")),
         )
 
 
@@ -1082,6 +1142,23 @@ class CrashEntryViewSet(
             },
         )
 
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """Create several crash entries at once. Expects a list of crash entries
+        in the same format as accepted for creating a single entry."""
+        if not isinstance(request.data, list):
+            raise InvalidArgumentException("Expected a list of crash entries")
+        limit = getattr(django_settings, "CRASH_BULK_CREATE_LIMIT", 1000)
+        if len(request.data) > limit:
+            raise InvalidArgumentException(
+                f"Cannot create more than {limit} crash entries at once"
+            )
+
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     def list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
 
@@ -1132,6 +1209,9 @@ class CrashEntryViewSet(
             # writes.
             obj.testcase.quality = testcase_quality
             obj.testcase.save()
+            if obj.bucket_id is not None:
+                # The best testcase of the bucket may have changed
+                BucketAggregate.refresh_best(obj.bucket_id, obj.tool_id)
         return Response(CrashEntrySerializer(obj).data)
 
 
@@ -1210,35 +1290,19 @@ class BucketViewSet(
         return response
 
     def retrieve(self, request, *args, **kwargs):
-        user = User.get_or_create_restricted(request.user)[0]
         instance = self.get_object()
         ignore_toolfilter = getattr(self, "ignore_toolfilter", False)
 
-        crashes_in_filter = filter_crash_entries_by_toolfilter(
-            request,
-            instance.crashentry_set,
-            restricted_only=bool(ignore_toolfilter),
-        )
-        crashes_in_filter = CrashEntry.deferRawFields(crashes_in_filter)
-
-        if not ignore_toolfilter and not user.restricted:
-            # if a non-restricted user requested toolfilter, we ignored it...
-            # otherwise if the bucket had no crashes in toolfilter, it would 404
-            # recalculate size and quality using toolfilter
-            # even if the result is 0
-            agg = crashes_in_filter.aggregate(
-                quality=Min("testcase__quality"), size=Count("id")
-            )
-            instance.size = agg["size"]
-            instance.quality = agg["quality"]
-
-        if instance.quality is not None:
-            instance.best_entry = (
-                crashes_in_filter.filter(testcase__quality=instance.quality)
-                .order_by("testcase__size", "-id")
-                .values_list("id", flat=True)
-                .first()
+        # if a non-restricted user requested toolfilter, we ignored it...
+        # otherwise if the bucket had no crashes in toolfilter, it would 404
+        # recalculate size and quality using toolfilter
+        # even if the result is 0
+        tools = get_toolfilter_tools(request, restricted_only=ignore_toolfilter)
+        (instance.size, instance.quality, instance.best_entry, _) = (
+            BucketAggregate.for_buckets([instance.pk], tools).get(
+                instance.pk, (0, None, None, None)
             )
+        )
 
         serializer = self.get_serializer(instance)
         response = Response(serializer.data)
@@ -1552,11 +1616,23 @@ class AbstractDownloadView(APIView):
         if not os.path.exists(file_path):
             return HttpResponse(status=404)
 
+        # Support conditional requests, so clients can skip unchanged downloads
+        stat = os.stat(file_path)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        last_modified = int(stat.st_mtime)
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=last_modified
+        )
+        if response is not None:
+            return response
+
         test_file = open(file_path, "rb")
         response = HttpResponse(
             FileWrapper(test_file), content_type="application/octet-stream"
         )
         response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
         return response
 
     def get(self):
@@ -1592,7 +1668,58 @@ class SignaturesDownloadView(AbstractDownloadView):
         filename = "signatures.zip"
         file_path = os.path.join(storage_base, filename)
 
-        return self.response(file_path, filename)
+        response = self.response(file_path, filename)
+        manifest = load_manifest()
+        if manifest is not None:
+            response["X-Signatures-Generation"] = str(manifest["generation"])
+        return response
+
+
+class SignaturesDeltaView(AbstractDownloadView):
+    def get(self, request, format=None):
+        """
+        Return a zip of the signatures and metadata that were added or changed since
+        the export generation given by the "since" parameter. The zip also contains
+        a "delta.json" with the new generation and the list of removed files.
+        """
+        deny_restricted_users(request)
+
+        storage_base = getattr(django_settings, "SIGNATURE_STORAGE", None)
+        if not storage_base:
+            # This is a misconfiguration
+            return HttpResponse(status=500)
+
+        try:
+            since = int(request.query_params["since"])
+        except (KeyError, ValueError):
+            raise InvalidArgumentException("Missing or invalid parameter 'since'.")
+
+        zip_path = os.path.join(storage_base, "signatures.zip")
+        current = load_manifest()
+        if current is not None and current["generation"] == since:
+            return HttpResponse(status=304)
+
+        delta = manifest_delta(since)
+        if delta is None or not os.path.exists(zip_path):
+            # The client has to fetch the full signatures.zip instead
+            return HttpResponse(status=410)
+        (current, changed, removed) = delta
+
+        data = BytesIO()
+        with ZipFile(zip_path) as src, ZipFile(data, "w") as dst:
+            srcFiles = set(src.namelist())
+            for name in changed:
+                if name in srcFiles:
+                    dst.writestr(name, src.read(name))
+            dst.writestr(
+                "delta.json",
+                json.dumps({"generation": current["generation"], "removed": removed}),
+            )
+
+        response = HttpResponse(data.getvalue(), content_type="application/zip")
+        response["Content-Disposition"] = 'attachment; filename="signatures-delta.zip"'
+        response["X-Signatures-Generation"] = str(current["generation"])
+        return response
 
 
 class BugzillaTemplateListView(ListView):
@@ -1752,34 +1879,50 @@ class InboxView(TemplateView):
     template_name = "inbox.html"
 
 
-class _FreqCount:
+class CrashStatsCache:
+    """
+    Per-process cache of the crash statistics for CRASH_STATS_CACHE_SECONDS,
+    by the tools they were computed for, so refreshing the dashboard in many
+    browsers doesn't compute them again for each one.
+    """
+
     def __init__(self):
-        self.hour = 0
-        self.day = 0
-        self.week = 0
-        self.bucket_hour = {}
-        self.bucket_day = {}
-        self.bucket_week = {}
-
-    def add_hour(self, bucket):
-        self.hour += 1
-        if bucket is not None:
-            self.bucket_hour.setdefault(bucket, 0)
-            self.bucket_hour[bucket] += 1
-        self.add_day(bucket)
-
-    def add_day(self, bucket):
-        self.day += 1
-        if bucket is not None:
-            self.bucket_day.setdefault(bucket, 0)
-            self.bucket_day[bucket] += 1
-        self.add_week(bucket)
-
-    def add_week(self, bucket):
-        self.week += 1
-        if bucket is not None:
-            self.bucket_week.setdefault(bucket, 0)
-            self.bucket_week[bucket] += 1
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is None:
+                return None
+            (data, loaded) = cached
+            if time.monotonic() - loaded > getattr(
+                django_settings, "CRASH_STATS_CACHE_SECONDS", 30
+            ):
+                del self.entries[key]
+                return None
+            return data
+
+    def set(self, key, data):
+        with self.lock:
+            now = time.monotonic()
+            maxAge = getattr(django_settings, "CRASH_STATS_CACHE_SECONDS", 30)
+            # drop the expired statistics of other tool filters
+            for other, (_, loaded) in list(self.entries.items()):
+                if now - loaded > maxAge:
+                    del self.entries[other]
+            self.entries[key] = (data, now)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+CRASH_STATS_CACHE = CrashStatsCache()
+
+
+def _start_of_hour(value):
+    return value.replace(microsecond=0, second=0, minute=0)
 
 
 class CrashStatsViewSet(viewsets.GenericViewSet):
@@ -1796,85 +1939,131 @@ class CrashStatsViewSet(viewsets.GenericViewSet):
     def retrieve(self, request, *_args, **_kwds):
         user = User.get_or_create_restricted(request.user)[0]
         entries = self.filter_queryset(self.get_queryset())
+        tools = get_toolfilter_tools(
+            request, restricted_only=self.ignore_toolfilter or self.detail
+        )
+        default_tools_filter = set(user.defaultToolsFilter.values_list("id", flat=True))
 
+        key = (
+            None if tools is None else tuple(sorted(tool.pk for tool in tools)),
+            tuple(sorted(default_tools_filter)),
+            user.restricted,
+        )
+        data = CRASH_STATS_CACHE.get(key)
+        if data is None:
+            data = self._compute(entries, tools, default_tools_filter, user)
+            CRASH_STATS_CACHE.set(key, data)
+        return Response(data, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def _compute(entries, tools, default_tools_filter, user):
         now = timezone.now()
-        last_hour = now - timedelta(hours=1)
-        last_day = now - timedelta(days=1)
-        last_week = now - timedelta(days=7)
-        entries = entries.filter(created__gt=last_week)
-
-        totals = _FreqCount()
-        for created, bucket_id in entries.values_list("created", "bucket_id"):
-            if created > last_hour:
-                totals.add_hour(bucket_id)
-            elif created > last_day:
-                totals.add_day(bucket_id)
-            else:
-                totals.add_week(bucket_id)
+        cur_hour = _start_of_hour(now)
+        starts = {
+            "hour": now - timedelta(hours=1),
+            "day": now - timedelta(days=1),
+            "week": now - timedelta(days=7),
+        }
 
-        # this gives all the bucket ids
-        #   where the bucket is top10 for any period (hour, day, week)
-        top10s = (
-            {
-                b_id
-                for b_id, _ in sorted(
-                    totals.bucket_hour.items(), key=lambda t: t[1], reverse=True
-                )[:10]
-            }
-            | {
-                b_id
-                for b_id, _ in sorted(
-                    totals.bucket_day.items(), key=lambda t: t[1], reverse=True
-                )[:10]
-            }
-            | {
-                b_id
-                for b_id, _ in sorted(
-                    totals.bucket_week.items(), key=lambda t: t[1], reverse=True
-                )[:10]
-            }
+        # The hours that are completely in a period are counted by the BucketHit
+        # and ToolHit counters. The entries of the current hour and of the hours
+        # that are only partly in a period are counted directly.
+        edges = Q(created__gte=cur_hour)
+        for start in starts.values():
+            edges |= Q(
+                created__gt=start,
+                created__lt=_start_of_hour(start) + timedelta(hours=1),
+            )
+        periods = {
+            name: Count(
+                "id",
+                filter=Q(created__gt=start)
+                & (
+                    Q(created__gte=cur_hour)
+                    | Q(created__lt=_start_of_hour(start) + timedelta(hours=1))
+                ),
+            )
+            for name, start in starts.items()
+        }
+        counted = (
+            entries.filter(edges)
+            .order_by()
+            .values("bucket_id")
+            .annotate(**periods)
+            .values_list("bucket_id", "hour", "day", "week")
         )
 
-        frequent_buckets = {}
-        for b_id in top10s:
-            frequent_buckets[b_id] = [
-                totals.bucket_hour.get(b_id, 0),
-                totals.bucket_day.get(b_id, 0),
-                totals.bucket_week[b_id],  # only one that's guaranteed to exist
+        hit_periods = {
+            name: Sum("count", filter=Q(begin__gt=_start_of_hour(start)))
+            for name, start in starts.items()
+        }
+        bucket_hits = BucketHit.objects.filter(
+            begin__gt=_start_of_hour(starts["week"]), begin__lt=cur_hour
+        )
+        tool_hits = ToolHit.objects.filter(
+            begin__gt=_start_of_hour(starts["week"]), begin__lt=cur_hour
+        )
+        if tools is not None:
+            bucket_hits = bucket_hits.filter(tool__in=tools)
+            tool_hits = tool_hits.filter(tool__in=tools)
+        tool_hits = tool_hits.aggregate(**hit_periods)
+
+        totals = [tool_hits[name] or 0 for name in starts]
+        buckets = {}
+        for bucket_id, *counts in counted:
+            totals = [total + count for total, count in zip(totals, counts)]
+            if bucket_id is not None:
+                buckets[bucket_id] = counts
+        for bucket_id, *counts in (
+            bucket_hits.order_by()
+            .values("bucket_id")
+            .annotate(**hit_periods)
+            .values_list("bucket_id", "hour", "day", "week")
+        ):
+            previous = buckets.get(bucket_id, (0, 0, 0))
+            buckets[bucket_id] = [
+                total + (count or 0) for total, count in zip(previous, counts)
             ]
 
-        default_tools_filter = set(user.defaultToolsFilter.values_list("id", flat=True))
+        # this gives all the bucket ids
+        #   where the bucket is top10 for any period (hour, day, week)
+        top10s = set()
+        for idx in range(3):
+            top10s.update(
+                heapq.nlargest(
+                    10,
+                    (b_id for b_id, counts in buckets.items() if counts[idx] > 0),
+                    key=lambda b_id: buckets[b_id][idx],
+                )
+            )
+        frequent_buckets = {b_id: buckets[b_id] for b_id in top10s}
 
         n_periods = getattr(django_settings, "CRASH_STATS_MAX_HISTORY_DAYS", 14) * 24
         cur_period = CrashHit.get_period(now)
-        periods = [cur_period - timedelta(hours=n) for n in range(n_periods)]
-        periods.reverse()
-        in_filter_hits_per_hour = [0 for _ in periods]
+        first_period = cur_period - timedelta(hours=n_periods - 1)
+        in_filter_hits_per_hour = [0] * n_periods
         out_filter_hits_per_hour = in_filter_hits_per_hour.copy()
-        hit_idx = 0
-        for hit in CrashHit.objects.filter(
-            lastUpdate__gt=periods[0] - timedelta(hours=1),
-            lastUpdate__lte=periods[-1],
-        ).order_by("lastUpdate"):
-            hit_period = CrashHit.get_period(hit.lastUpdate)
-            hit_idx = periods.index(hit_period, hit_idx)
-
-            if hit.tool_id in default_tools_filter:
-                in_filter_hits_per_hour[hit_idx] += hit.count
-            elif not user.restricted:
-                out_filter_hits_per_hour[hit_idx] += hit.count
+        for lastUpdate, tool_id, count in CrashHit.objects.filter(
+            lastUpdate__gt=first_period - timedelta(hours=1),
+            lastUpdate__lte=cur_period,
+        ).values_list("lastUpdate", "tool_id", "count"):
+            hit_idx = (CrashHit.get_period(lastUpdate) - first_period) // timedelta(
+                hours=1
+            )
 
-        return Response(
-            {
-                # [int, int, int] (hour, day, week)
-                "totals": [totals.hour, totals.day, totals.week],
-                # { bucket_id: [hour, day, week] }
-                # includes the top 10 for each time-frame, which usually overlap
-                "frequentBuckets": frequent_buckets,
-                # [int, ...] hits per hour for last week
-                "outFilterGraphData": out_filter_hits_per_hour,
-                # ditto
-                "inFilterGraphData": in_filter_hits_per_hour,
-            },
-            status=status.HTTP_200_OK,
-        )
+            if tool_id in default_tools_filter:
+                in_filter_hits_per_hour[hit_idx] += count
+            elif not user.restricted:
+                out_filter_hits_per_hour[hit_idx] += count
+
+        return {
+            # [int, int, int] (hour, day, week)
+            "totals": totals,
+            # { bucket_id: [hour, day, week] }
+            # includes the top 10 for each time-frame, which usually overlap
+            "frequentBuckets": frequent_buckets,
+            # [int, ...] hits per hour for last week
+            "outFilterGraphData": out_filter_hits_per_hour,
+            # ditto
+            "inFilterGraphData": in_filter_hits_per_hour,
+        }
@@ -353,6 +353,12 @@ USERDATA_STORAGE = os.path.join(BASE_DIR)
 # This is the directory where signatures.zip will be stored
 SIGNATURE_STORAGE = os.path.join(BASE_DIR)
 
+# Number of signature exports that clients can request incremental updates for
+SIGNATURE_DELTA_HISTORY = 48
+
+# Maximum number of crashes that can be submitted in one bulk request
+CRASH_BULK_CREATE_LIMIT = 1000
+
 # Redis configuration
 REDIS_URL = "redis://localhost:6379?db=0"  # unix sockets, use unix:///path/to/sock?db=0
 
@@ -365,6 +371,21 @@ CELERY_RESULT_SERIALIZER = "json"
 CELERY_BROKER_URL = "redis:///2"
 CELERY_RESULT_BACKEND = "redis:///1"
 CELERY_TRIAGE_MEMCACHE_ENTRIES = 100
+# Share the triage cache between all workers through Redis (REDIS_URL). This costs
+# a Redis round trip for every triaged crash.
+CELERY_TRIAGE_REDIS_CACHE = False
+# Number of short signatures kept in Redis
+CELERY_TRIAGE_REDIS_ENTRIES = 10000
+# Number of buckets kept for each short signature
+CELERY_TRIAGE_REDIS_BUCKETS = 10
+# Seconds a short signature is kept in Redis without being used
+CELERY_TRIAGE_REDIS_TTL = 24 * 60 * 60
+# Match entries on the workers in chunks of this size when reassigning buckets.
+# If the workers don't return all results within CELERY_REASSIGN_TIMEOUT seconds
+# (e.g. because they are busy triaging), the entries are matched in the request.
+CELERY_PARALLEL_REASSIGN = False
+CELERY_REASSIGN_CHUNK_SIZE = 1000
+CELERY_REASSIGN_TIMEOUT = 60
 CELERY_TASK_ROUTES = {
     "covmanager.cron.*": {"queue": "cron"},
     "crashmanager.cron.*": {"queue": "cron"},
@@ -3,11 +3,18 @@ from django.contrib.auth.models import Permission, User
 from django.contrib.contenttypes.models import ContentType
 from rest_framework.authtoken.models import Token
 
+from crashmanager.models import DIMENSION_CACHE
 from crashmanager.models import User as CMUser
 
 pytestmark = pytest.mark.django_db(transaction=True)
 
 
+@pytest.fixture(autouse=True)
+def dimension_cache():
+    """Don't keep lookup rows cached across tests, the database is reset"""
+    DIMENSION_CACHE.clear()
+
+
 @pytest.fixture
 def fm_user():
     user = User.objects.create_user("fuzzmanager", "test@example.com", "test")